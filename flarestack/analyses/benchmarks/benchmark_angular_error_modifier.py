@@ -0,0 +1,151 @@
+"""Script to benchmark the angular error floors and pull corrections, which
+are evaluated for every event of a dataset. Compares the array-based
+functions of each floor and pull class with the previous implementations,
+which evaluated each event in a separate Python loop iteration. Each class is
+built directly from synthetic support points, so no pickled floor or pull
+files are required.
+"""
+import logging
+import time
+import numpy as np
+from scipy.interpolate import interp1d, RectBivariateSpline
+from flarestack.core.angular_error_modifier import StaticFloor, \
+    QuantileFloor0D, QuantileFloorEParam0D, BaseFloorClass, \
+    MedianPullEParam0D, MedianPull2D, MedianPullEParam2D
+from flarestack.shared import min_angular_err
+
+logging.getLogger().setLevel("INFO")
+
+log_e_points = np.linspace(1., 7., 13)
+sin_dec_points = np.linspace(-1., 1., 11)
+gamma_points = np.linspace(1., 4., 7)
+
+floor_grid = np.random.RandomState(0).uniform(
+    0.001, 0.01, (len(log_e_points), len(gamma_points)))
+pull_grid = np.random.RandomState(1).normal(
+    0., 0.2, (len(log_e_points), len(sin_dec_points)))
+pull_0d = 0.1
+gamma = [2.5]
+
+
+def simulate_events(n_events, seed=42):
+    np.random.seed(seed)
+    data = np.empty(n_events, dtype=[
+        ("logE", np.float), ("sinDec", np.float), ("raw_sigma", np.float),
+        ("sigma", np.float)])
+    data["logE"] = np.random.uniform(1., 7., n_events)
+    data["sinDec"] = np.random.uniform(-1., 1., n_events)
+    data["raw_sigma"] = np.random.uniform(0., 0.02, n_events)
+    data["sigma"] = data["raw_sigma"]
+    return data
+
+
+def make_class(cls, **attributes):
+    """Builds a floor or pull class without loading or creating its pickle.
+    """
+    obj = cls.__new__(cls)
+    for (key, val) in attributes.items():
+        setattr(obj, key, val)
+    return obj
+
+
+# Previous per-event implementations
+
+def static_floor_per_event(data):
+    return np.array([static_floor.min_error for _ in data])
+
+
+def quantile_floor_0d_per_event(data):
+    return np.array([floor_grid[0, 0] for _ in data])
+
+
+floor_0d_e_f = interp1d(gamma_points, floor_grid[0])
+
+
+def quantile_floor_0d_e_per_event(data):
+    return np.array([floor_0d_e_f(gamma) for _ in data])
+
+
+floor_1d_e_f = RectBivariateSpline(
+    log_e_points, gamma_points, np.log(floor_grid), kx=1, ky=1, s=0)
+
+
+def quantile_floor_1d_e_per_event(data):
+    return np.array(
+        [np.exp(floor_1d_e_f(x["logE"], gamma[0])[0]) for x in data]).T
+
+
+def pull_0d_e_per_event(data):
+    return np.array([pull_0d for _ in data])
+
+
+pull_2d_f = RectBivariateSpline(log_e_points, sin_dec_points, pull_grid)
+
+
+def pull_2d_per_event(data):
+    return [pull_2d_f(x["logE"], x["sinDec"])[0][0] for x in data]
+
+
+static_floor = make_class(StaticFloor, min_error=min_angular_err)
+
+floor_0d = make_class(QuantileFloor0D).create_function(floor_grid[0, 0])
+floor_0d_e = make_class(QuantileFloorEParam0D).create_function(
+    [gamma_points, floor_grid[0]])
+floor_1d_e = make_class(
+    BaseFloorClass.subclasses["quantile_floor_1d_e"]).create_function(
+    [log_e_points, gamma_points, floor_grid])
+
+functions = [
+    ("StaticFloor", static_floor_per_event, static_floor.floor),
+    ("QuantileFloor0D", quantile_floor_0d_per_event,
+     lambda data: floor_0d(data, gamma)),
+    ("QuantileFloorEParam0D", quantile_floor_0d_e_per_event,
+     lambda data: floor_0d_e(data, gamma)),
+    ("QuantileFloorEParam1D", quantile_floor_1d_e_per_event,
+     lambda data: floor_1d_e(data, gamma)),
+    ("MedianPullEParam0D", pull_0d_e_per_event,
+     make_class(MedianPullEParam0D).create_dynamic(pull_0d)),
+    ("MedianPull2D", pull_2d_per_event,
+     make_class(MedianPull2D, pickled_data=[
+         log_e_points, sin_dec_points, pull_grid]).create_static()),
+    ("MedianPullEParam2D", pull_2d_per_event,
+     make_class(MedianPullEParam2D).create_dynamic(
+         [log_e_points, sin_dec_points, pull_grid])),
+]
+
+
+def time_function(f, data, n_repeats):
+    start = time.time()
+    for _ in range(n_repeats):
+        res = f(data)
+    return (time.time() - start) / n_repeats, np.array(res)
+
+
+for n_events in [10, int(1e3), int(1e5)]:
+
+    data = simulate_events(n_events)
+
+    n_repeats = max(1, int(1e4 / n_events))
+
+    for (name, f_old, f_new) in functions:
+
+        t_old, res_old = time_function(f_old, data, n_repeats)
+        t_new, res_new = time_function(f_new, data, n_repeats)
+
+        assert res_old.shape == res_new.shape
+
+        max_diff = np.max(np.abs(res_old - res_new))
+
+        logging.info("{0}, {1} events: per-event {2:.3G} events/s, "
+                     "vectorised {3:.3G} events/s (speedup {4:.1f}x, max "
+                     "difference {5:.2G})".format(
+                        name, n_events, n_events / t_old, n_events / t_new,
+                        t_old / t_new, max_diff))
+
+    # The static floor is applied to the full dataset by pull_correct_static
+
+    t_apply, _ = time_function(
+        lambda x: static_floor.apply_static(x.copy()), data, n_repeats)
+
+    logging.info("StaticFloor.apply_static, {0} events: {1:.3G} "
+                 "events/s".format(n_events, n_events / t_apply))
@@ -0,0 +1,104 @@
+"""Script to benchmark the number of background trials per second, for a
+single point source and for a stacked catalogue of 100 sources. Compares
+trials run one at a time, as in MinimisationHandler.run, with the columnar
+results of run_batch.
+"""
+import logging
+import os
+import time
+import numpy as np
+from flarestack.data.public import icecube_ps_3_year
+from flarestack.core.minimisation import MinimisationHandler
+from flarestack.utils.prepare_catalogue import ps_catalogue_name, cat_dtype
+from flarestack.shared import catalogue_dir
+
+logging.getLogger().setLevel("INFO")
+
+n_trials = 50
+
+llh_dict = {
+    "llh_name": "standard",
+    "llh_energy_pdf": {
+        "energy_pdf_name": "power_law"
+    },
+    "llh_sig_time_pdf": {
+        "time_pdf_name": "steady"
+    },
+    "llh_bkg_time_pdf": {
+        "time_pdf_name": "steady",
+    }
+}
+
+inj_dict = {
+    "injection_energy_pdf": {
+        "energy_pdf_name": "power_law",
+        "gamma": 2.0
+    },
+    "injection_sig_time_pdf": {
+        "time_pdf_name": "steady"
+    }
+}
+
+
+def random_catalogue(n_sources, seed=42):
+    """Creates a catalogue of sources distributed uniformly on the sky."""
+    np.random.seed(seed)
+
+    cat = np.empty(n_sources, dtype=cat_dtype)
+    cat["ra_rad"] = np.random.uniform(0., 2 * np.pi, n_sources)
+    cat["dec_rad"] = np.arcsin(np.random.uniform(-0.95, 0.95, n_sources))
+    cat["base_weight"] = 1.
+    cat["injection_weight_modifier"] = 1.
+    cat["distance_mpc"] = 1.
+    cat["ref_time_mjd"] = np.nan
+    cat["start_time_mjd"] = np.nan
+    cat["end_time_mjd"] = np.nan
+    cat["source_name"] = ["src_{0}".format(i) for i in range(n_sources)]
+
+    path = catalogue_dir + "benchmarks/random_{0}_sources.npy".format(
+        n_sources)
+
+    try:
+        os.makedirs(os.path.dirname(path))
+    except OSError:
+        pass
+
+    np.save(path, cat)
+
+    return path
+
+
+catalogues = {
+    "point source": ps_catalogue_name(0.5),
+    "100 sources": random_catalogue(100)
+}
+
+for (name, cat_path) in catalogues.items():
+
+    mh_dict = {
+        "name": "analyses/benchmarks/batched_trials/",
+        "mh_name": "fixed_weights",
+        "dataset": icecube_ps_3_year.get_seasons("IC86-2011"),
+        "catalogue": cat_path,
+        "llh_dict": llh_dict,
+        "inj_dict": inj_dict
+    }
+
+    mh = MinimisationHandler.create(mh_dict)
+
+    # Run a single trial first, so that all caches are already created
+
+    mh.run_trial(mh.prepare_dataset(scale=0., seed=1))
+
+    start = time.time()
+    for i in range(n_trials):
+        mh.run_trial(mh.prepare_dataset(scale=0., seed=i))
+    t_single = time.time() - start
+
+    start = time.time()
+    mh.run_batch(n_trials, scale=0., seed=1)
+    t_batch = time.time() - start
+
+    logging.info("{0}: single {1:.2f} trials/s, run_batch {2:.2f} "
+                 "trials/s".format(name, n_trials / t_single,
+                                   n_trials / t_batch))
@@ -0,0 +1,73 @@
+"""Script to benchmark the rotation of simulated events onto a source, as
+performed for every injected signal event. Compares the array-based rotation
+of SignalSpatialPDF.rotate with the previous implementation, which built a
+separate healpy rotation matrix for each event.
+"""
+import logging
+import time
+import numpy as np
+import healpy as hp
+from flarestack.core.spatial_pdf import SignalSpatialPDF
+
+logging.getLogger().setLevel("INFO")
+
+
+def rotate_per_event(ra1, dec1, ra2, dec2, ra3, dec3):
+    """Previous implementation of SignalSpatialPDF.rotate, with one healpy
+    rotation matrix constructed per event.
+    """
+    phi1 = ra1 - np.pi
+    zen1 = np.pi/2. - dec1
+    phi2 = ra2 - np.pi
+    zen2 = np.pi/2. - dec2
+    phi3 = ra3 - np.pi
+    zen3 = np.pi/2. - dec3
+
+    x = np.array([hp.rotator.rotateDirection(
+        hp.rotator.get_rotation_matrix((dp, -dz, 0.))[0], z, p)
+        for z, p, dz, dp in zip(zen1, phi1, zen2, phi2)])
+
+    zen, phi = hp.rotator.rotateDirection(np.dot(
+        hp.rotator.get_rotation_matrix((-phi3, 0, 0))[0],
+        hp.rotator.get_rotation_matrix((0, zen3, 0.))[0]), x[:, 0], x[:, 1])
+
+    dec = np.pi/2. - zen
+
+    ra = phi + np.pi
+    return np.atleast_1d(ra), np.atleast_1d(dec)
+
+
+def simulate_events(n_events, seed=42):
+    np.random.seed(seed)
+    true_ra = np.random.uniform(0., 2 * np.pi, n_events)
+    true_dec = np.arcsin(np.random.uniform(-1., 1., n_events))
+    ra = (true_ra + np.random.normal(0., 0.02, n_events)) % (2 * np.pi)
+    dec = np.clip(true_dec + np.random.normal(0., 0.02, n_events),
+                  -np.pi/2., np.pi/2.)
+    return ra, dec, true_ra, true_dec
+
+
+def time_rotation(f, events, n_repeats):
+    start = time.time()
+    for _ in range(n_repeats):
+        res = f(*events, 1.5, 0.3)
+    return (time.time() - start) / n_repeats, res
+
+
+for n_events in [10, int(1e3), int(1e5)]:
+
+    events = simulate_events(n_events)
+
+    n_repeats = max(1, int(1e4 / n_events))
+
+    t_old, res_old = time_rotation(rotate_per_event, events, n_repeats)
+    t_new, res_new = time_rotation(SignalSpatialPDF.rotate, events, n_repeats)
+
+    max_diff = max(np.max(np.abs(res_old[0] - res_new[0])),
+                   np.max(np.abs(res_old[1] - res_new[1])))
+
+    logging.info("{0} events: per-event {1:.3G} events/s, vectorised "
+                 "{2:.3G} events/s (speedup {3:.1f}x, max difference "
+                 "{4:.2G} rad)".format(
+                    n_events, n_events / t_old, n_events / t_new,
+                    t_old / t_new, max_diff))
@@ -0,0 +1,358 @@
+"""Adaptive allocation of trials. Trials are run in rounds, and after each
+round the sensitivity and discovery potential curves are fitted. The next
+round of trials is placed at flux scales close to each crossing which is
+not yet known to the required precision, rather than on a fixed grid.
+"""
+import logging
+import os
+import random
+import numpy as np
+from flarestack.core.minimisation import MinimisationHandler
+from flarestack.core.multiprocess_wrapper import empty_results, \
+    add_trial_to_results, run_multiprocess
+from flarestack.core.results import fit_sensitivity_curve, fit_disc_curve
+from flarestack.core.ts_distributions import background_ts_threshold
+from flarestack.cluster import analyse, wait_for_cluster
+from flarestack.shared import scale_shortener, k_to_flux, \
+    load_trial_results
+
+# Flux scales of each new round, relative to the current estimate of a crossing
+adaptive_scale_factors = [0.8, 1., 1.25]
+
+# Trials within this factor of a crossing are used to estimate its precision
+adaptive_window = 1.25
+
+
+def interpolate_crossing(x, y, threshold):
+    """Finds the scale at which the fraction of trials reaches a threshold by
+    linear interpolation, for use where the curve cannot be fitted. The
+    fractions are first made non-decreasing with scale.
+
+    :param x: Array of flux scales, in increasing order
+    :param y: Fraction of trials at each flux scale
+    :param threshold: Fraction of trials at the crossing
+    :return: Scale at threshold (nan if never reached), and interpolated
+    function
+    """
+    y = np.maximum.accumulate(y)
+
+    def f(scale):
+        return np.interp(scale, x, y)
+
+    if max(y) < threshold:
+        return np.nan, f
+
+    i = np.argmax(y >= threshold)
+
+    if i == 0:
+        return x[0], f
+
+    crossing = x[i - 1] + (threshold - y[i - 1]) * (x[i] - x[i - 1]) / (
+            y[i] - y[i - 1])
+
+    return crossing, f
+
+
+class AdaptiveTrials(object):
+    """Runs trials in rounds, placing each round where it most reduces the
+    uncertainty on the flux scale of the sensitivity (90% of trials above
+    the background median) and of the discovery potential (50% of trials
+    above the 5 sigma threshold). Each round is run either in this process,
+    on several local processes with run_multiprocess, or on the cluster.
+    The results of all trials are saved in the usual way, so can also be
+    analysed with a ResultsHandler.
+    """
+
+    def __init__(self, mh_dict, n_background=None, n_trials_per_round=None,
+                 tolerance=0.05, max_rounds=10,
+                 n_cpu=min(os.cpu_count() - 1, 32), cluster=False,
+                 **cluster_kwargs):
+        """
+        :param mh_dict: MinimisationHandler dictionary. The "scale",
+        "n_steps" and "n_trials" entries define the initial round of trials.
+        :param n_background: Number of background trials (default is 10
+        times n_trials, as for a standard set of trials)
+        :param n_trials_per_round: Number of trials in each later round
+        (default is 3 times n_trials)
+        :param tolerance: Required relative precision on each crossing
+        :param max_rounds: Maximum number of rounds after the first
+        :param n_cpu: Number of CPUs to run with. Trials are run in this
+        process if n_cpu is 1.
+        :param cluster: Boolean flag for whether to run each round on the
+        cluster
+        :param cluster_kwargs: Optional kwargs for the cluster submission,
+        such as n_jobs
+        """
+        self.mh_dict = mh_dict
+        self.mh = MinimisationHandler.create(mh_dict)
+
+        self.n_cpu = n_cpu
+        self.cluster = cluster
+        self.cluster_kwargs = cluster_kwargs
+
+        self.n_trials = int(mh_dict["n_trials"])
+
+        if n_background is None:
+            n_background = 10 * self.n_trials
+        self.n_background = int(n_background)
+
+        if n_trials_per_round is None:
+            n_trials_per_round = 3 * self.n_trials
+        self.n_trials_per_round = int(n_trials_per_round)
+
+        self.tolerance = tolerance
+        self.max_rounds = int(max_rounds)
+
+        self.ts_type = "Standard"
+
+        self.ts = dict()
+
+        # Results files of earlier runs with the same name are not used
+
+        self.loaded_paths = set(self.results_paths())
+
+        self.sensitivity = np.nan
+        self.disc_potential = np.nan
+        self.sensitivity_error = np.inf
+        self.disc_potential_error = np.inf
+
+    def run_trials(self, scale, n_trials):
+        """Runs trials at a given scale, saves the results, and keeps the TS
+        values for the next fit. Scales are rounded with scale_shortener, so
+        that trials at the same scale are combined.
+
+        :param scale: Ratio of Injected Flux to source flux
+        :param n_trials: Number of trials
+        """
+        key = scale_shortener(scale)
+        scale = float(key)
+
+        seeds = [int(random.random() * 10 ** 8) for _ in range(int(n_trials))]
+
+        results = empty_results(self.mh.param_names)
+
+        for seed in seeds:
+            full_dataset = self.mh.prepare_dataset(scale, seed)
+            add_trial_to_results(results, self.mh.run_trial(full_dataset))
+
+        self.mh.dump_results(results, scale, seeds[0])
+
+        if key not in self.ts:
+            self.mh.dump_injection_values(scale)
+            self.ts[key] = np.array(results["TS"])
+        else:
+            self.ts[key] = np.append(self.ts[key], results["TS"])
+
+    def results_paths(self):
+        """Lists the results files of all trials saved for this
+        MinimisationHandler, excluding merged results.
+
+        :return: List of paths
+        """
+        paths = []
+
+        if not os.path.isdir(self.mh.pickle_output_dir):
+            return paths
+
+        for sub_dir_name in os.listdir(self.mh.pickle_output_dir):
+            sub_dir = os.path.join(self.mh.pickle_output_dir, sub_dir_name)
+
+            if sub_dir_name[0] == "." or sub_dir_name == "merged" or \
+                    not os.path.isdir(sub_dir):
+                continue
+
+            paths += [os.path.join(sub_dir, x) for x in os.listdir(sub_dir)
+                      if os.path.splitext(x)[1] == ".npz"]
+
+        return paths
+
+    def load_new_results(self):
+        """Loads the TS values of all results files which have been saved
+        since the last call, after trials were run on other processes.
+        """
+        for path in sorted(self.results_paths()):
+            if path in self.loaded_paths:
+                continue
+
+            key = scale_shortener(float(os.path.basename(
+                os.path.dirname(path))))
+
+            ts = load_trial_results(path)["TS"]
+
+            if key not in self.ts:
+                self.ts[key] = np.array(ts)
+            else:
+                self.ts[key] = np.append(self.ts[key], ts)
+
+            self.loaded_paths.add(path)
+
+    def run_round(self, scales, n_trials):
+        """Runs a round of trials, with n_trials trials at each of the given
+        scales. Repeated scales are run repeatedly. The round is run in this
+        process, with run_multiprocess, or on the cluster, and the TS values
+        of all trials are kept for the next fit.
+
+        :param scales: List of scales
+        :param n_trials: Number of trials at each scale
+        """
+        if not self.cluster and self.n_cpu <= 1:
+            for scale in scales:
+                self.run_trials(scale, n_trials)
+            return
+
+        round_dict = dict(self.mh_dict)
+        round_dict["scale_range"] = [float(scale_shortener(x)) for x in scales]
+        round_dict["n_trials"] = n_trials
+
+        if self.cluster:
+
+            # Each of the n_jobs cluster jobs runs all scales of the round
+
+            n_jobs = self.cluster_kwargs.get("n_jobs", 10)
+            round_dict["n_trials"] = int(np.ceil(float(n_trials) / n_jobs))
+
+            job_id = analyse(round_dict, cluster=True, n_cpu=self.n_cpu,
+                             **self.cluster_kwargs)
+            wait_for_cluster([job_id])
+
+        else:
+            run_multiprocess(n_cpu=self.n_cpu, mh_dict=round_dict)
+
+        self.load_new_results()
+
+    def crossing_error(self, crossing, best_f, threshold):
+        """Estimates the uncertainty on the flux scale of a crossing, from
+        the binomial uncertainty on the fraction of trials close to the
+        crossing, and the slope of the fitted curve.
+
+        :param crossing: Scale at which the fitted curve reaches threshold
+        :param best_f: Fitted curve
+        :param threshold: Fraction of trials at the crossing
+        :return: Relative uncertainty on the crossing
+        """
+        if not np.isfinite(crossing) or crossing <= 0.:
+            return np.inf
+
+        n_near = np.sum([
+            len(ts) for (key, ts) in self.ts.items()
+            if crossing / adaptive_window <= float(key) <=
+            crossing * adaptive_window])
+
+        step = 0.01 * crossing
+        slope = (best_f(crossing + step) - best_f(crossing - step)) / (2 * step)
+
+        if n_near == 0 or not slope > 0.:
+            return np.inf
+
+        frac_error = np.sqrt(threshold * (1. - threshold) / n_near)
+
+        return frac_error / (slope * crossing)
+
+    def fit_crossings(self):
+        """Fits the sensitivity and discovery potential curves to all trials
+        so far.
+
+        :return: List of (crossing scale, relative uncertainty)
+        """
+        bkg_ts = self.ts[scale_shortener(0.0)]
+
+        thresholds = [
+            (np.median(bkg_ts), 0.9, fit_sensitivity_curve),
+            (background_ts_threshold(bkg_ts, ts_type=self.ts_type)[0], 0.5,
+             fit_disc_curve)
+        ]
+
+        x = np.array(sorted([float(key) for key in self.ts.keys()]))
+
+        crossings = []
+
+        for (ts_val, threshold, fit_f) in thresholds:
+
+            y = [np.mean(self.ts[scale_shortener(scale)] > ts_val)
+                 for scale in x]
+
+            try:
+                crossing, best_f = fit_f(x, y, threshold)
+            except (RuntimeError, ValueError, TypeError) as e:
+                logging.warning("Fit failed, interpolating instead: "
+                                "{0}".format(e))
+                crossing, best_f = interpolate_crossing(x, y, threshold)
+
+            crossings.append(
+                (crossing, self.crossing_error(crossing, best_f, threshold)))
+
+        return crossings
+
+    def run(self):
+        """Runs the initial round of trials on a grid of scales, and then
+        further rounds around each crossing until both are known to the
+        required precision, or the maximum number of rounds is reached.
+
+        :return: Sensitivity and discovery potential (flux)
+        """
+
+        # The background trials are run in the initial round, split into
+        # units of n_trials trials
+
+        n_background_units = int(np.ceil(
+            float(self.n_background) / self.n_trials))
+
+        initial_scales = [0. for _ in range(n_background_units)] + list(
+            np.linspace(0., self.mh_dict["scale"],
+                        int(self.mh_dict["n_steps"]))[1:])
+
+        self.run_round(initial_scales, self.n_trials)
+
+        for i in range(self.max_rounds + 1):
+
+            crossings = self.fit_crossings()
+
+            [(sens, sens_error), (disc, disc_error)] = crossings
+
+            self.sensitivity = k_to_flux(sens)
+            self.disc_potential = k_to_flux(disc)
+            self.sensitivity_error = sens_error
+            self.disc_potential_error = disc_error
+
+            logging.info("Round {0}: sensitivity scale {1:.3g} (+/- {2:.1%}), "
+                         "discovery potential scale {3:.3g} (+/- {4:.1%}), "
+                         "{5} trials".format(
+                            i, sens, sens_error, disc, disc_error,
+                            np.sum([len(x) for x in self.ts.values()])))
+
+            unconverged = [x for x in crossings if not x[1] < self.tolerance]
+
+            if len(unconverged) == 0 or i == self.max_rounds:
+                break
+
+            new_scales = []
+
+            max_scale = max([float(key) for key in self.ts.keys()])
+
+            for (crossing, error) in unconverged:
+
+                # If the threshold has not been reached, extend the range of
+                # scales
+
+                if not np.isfinite(crossing) or crossing <= 0.:
+                    new_scales.append(2. * max_scale)
+                else:
+                    new_scales += [crossing * x for x in adaptive_scale_factors]
+
+            n_per_scale = int(np.ceil(
+                float(self.n_trials_per_round) / len(new_scales)))
+
+            self.run_round(new_scales, n_per_scale)
+
+        return self.sensitivity, self.disc_potential
+
+
+def run_adaptive_trials(mh_dict, **kwargs):
+    """Runs trials for a MinimisationHandler dictionary, allocating them
+    adaptively to find the sensitivity and discovery potential.
+
+    :param mh_dict: MinimisationHandler dictionary
+    :return: Sensitivity and discovery potential (flux)
+    """
+    at = AdaptiveTrials(mh_dict, **kwargs)
+    return at.run()
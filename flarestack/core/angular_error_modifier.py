@@ -11,11 +11,21 @@ from flarestack.utils.dynamic_pull_correction import \
 import pickle as Pickle
 from scipy.interpolate import interp1d, RectBivariateSpline
 from flarestack.utils.make_SoB_splines import gamma_support_points, \
-    gamma_precision, _around
+    gamma_precision, _around, LazySupportPointCache
 import numexpr
 import inspect
 
 
+def broadcast_to_events(data, val):
+    """Repeats a value, which may itself be an array, once for each event.
+
+    :param data: Event array
+    :param val: Value shared by all events
+    :return: Array with one copy of val per event along the first axis
+    """
+    return np.full((len(data),) + np.shape(val), val)
+
+
 class BaseFloorClass(object):
     subclasses = {}
 
@@ -47,12 +57,13 @@ class BaseFloorClass(object):
         return cls.subclasses[floor_name](floor_dict)
 
     def floor(self, data):
-        return np.array([0. for _ in data])
+        return np.zeros(len(data))
 
     def apply_floor(self, data):
-        mask = data["raw_sigma"] < self.floor(data)
+        floor = self.floor(data)
+        mask = data["raw_sigma"] < floor
         data["sigma"][mask] = np.sqrt(
-            self.floor(data[mask]) ** 2. + data["raw_sigma"][mask] ** 2.)
+            floor[mask] ** 2. + data["raw_sigma"][mask] ** 2.)
         return data
 
     def apply_dynamic(self, data):
@@ -106,7 +117,7 @@ class StaticFloor(BaseStaticFloor):
         logging.debug("Applying an angular error floor of {0} degrees".format(np.degrees(self.min_error)))
 
     def floor(self, data):
-        return np.array([self.min_error for _ in data])
+        return np.full(len(data), self.min_error)
 
 
 class BaseQuantileFloor(BaseFloorClass):
@@ -147,8 +158,7 @@ class QuantileFloor0D(BaseQuantileFloor, BaseStaticFloor):
         create_quantile_floor_0d(self.floor_dict)
 
     def create_function(self, pickled_array):
-        return lambda data, params: np.array([pickled_array for _ in data])
-
+        return lambda data, params: np.full(len(data), pickled_array)
 
 
 @BaseFloorClass.register_subclass('quantile_floor_0d_e')
@@ -159,7 +169,7 @@ class QuantileFloorEParam0D(BaseQuantileFloor, BaseDynamicFloorClass):
 
     def create_function(self, pickled_array):
         func = interp1d(pickled_array[0], pickled_array[1])
-        return lambda data, params: np.array([func(params) for _ in data])
+        return lambda data, params: broadcast_to_events(data, func(params))
 
 
 @BaseFloorClass.register_subclass('quantile_floor_1d')
@@ -184,8 +194,8 @@ class QuantileFloor1D(BaseQuantileFloor, BaseDynamicFloorClass):
             pickled_array[0], pickled_array[1],
             np.log(pickled_array[2]),
             kx=1, ky=1, s=0)
-        return lambda data, params: np.array(
-            [np.exp(func(x["logE"], params[0])[0]) for x in data]).T
+        return lambda data, params: np.exp(func.ev(
+            data["logE"], np.full(len(data), params[0])))[np.newaxis, :]
 
 
 class BaseAngularErrorModifier(object):
@@ -241,31 +251,38 @@ class BaseAngularErrorModifier(object):
 
     def create_spatial_cache(self, cut_data, SoB_pdf):
         if len(inspect.getfullargspec(SoB_pdf)[0]) == 2:
-            SoB = dict()
-            for gamma in gamma_support_points:
-                SoB[gamma] = np.log(SoB_pdf(cut_data, gamma))
+            SoB = LazySupportPointCache(
+                lambda gamma: np.log(SoB_pdf(cut_data, gamma)),
+                gamma_support_points)
         else:
             SoB = SoB_pdf(cut_data)
         return SoB
 
-    def estimate_spatial(self, gamma, spatial_cache):
+    def estimate_spatial(self, gamma, spatial_cache, return_gradient=False):
 
-        if isinstance(spatial_cache, dict):
-            return self.estimate_spatial_dynamic(gamma, spatial_cache)
+        if isinstance(spatial_cache, (dict, LazySupportPointCache)):
+            return self.estimate_spatial_dynamic(
+                gamma, spatial_cache, return_gradient)
+        elif return_gradient:
+            return spatial_cache, 0.
         else:
             return spatial_cache
 
-    def estimate_spatial_dynamic(self, gamma, spatial_cache):
+    def estimate_spatial_dynamic(self, gamma, spatial_cache,
+                                 return_gradient=False):
         """Quickly estimates the value of pull for Gamma.
         Uses pre-calculated values for first and second derivatives.
         Uses a Taylor series to estimate S(gamma), unless pull has already
-        been calculated for a given gamma.
+        been calculated for a given gamma. If return_gradient is True,
+        the derivative of Log(S(gamma)) with respect to gamma is also
+        returned, as given by the same Taylor series.
 
         :param gamma: Spectral Index
         :param spatial_cache: Median Pull cache
+        :param return_gradient: Boolean, whether to return the gradient
         :return: Estimated value for S(gamma)
         """
-        if gamma in list(spatial_cache.keys()):
+        if gamma in spatial_cache and not return_gradient:
             val = np.exp(spatial_cache[gamma])
             # val = spatial_cache[gamma]
         else:
@@ -285,6 +302,13 @@ class BaseAngularErrorModifier(object):
                 "exp((S0 - 2.*S1 + S2) / (2. * dg**2) * (gamma - g1)**2" + \
                 " + (S2 -S0) / (2. * dg) * (gamma - g1) + S1)"
             )
+
+            if return_gradient:
+                grad = numexpr.evaluate(
+                    "(S0 - 2.*S1 + S2) / dg**2 * (gamma - g1)" + \
+                    " + (S2 -S0) / (2. * dg)"
+                )
+                return val, grad
             # val = numexpr.evaluate(
             #     "((S0 - 2.*S1 + S2) / (2. * dg**2) * (gamma - g1)**2" + \
             #     " + (S2 -S0) / (2. * dg) * (gamma - g1) + S1)"
@@ -319,10 +343,10 @@ class BaseMedianAngularErrorModifier(BaseAngularErrorModifier):
         pass
 
     def create_static(self):
-        return lambda data: np.array([1. for _ in data])
+        return lambda data: np.ones(len(data))
 
     def create_dynamic(self, pickled_array):
-        return lambda data: np.array([1. for _ in data])
+        return lambda data: np.ones(len(data))
 
 
 class StaticMedianPullCorrector(BaseMedianAngularErrorModifier):
@@ -346,8 +370,9 @@ class DynamicMedianPullCorrector(BaseMedianAngularErrorModifier):
     def __init__(self, pull_dict):
         BaseAngularErrorModifier.__init__(self, pull_dict)
 
-    def estimate_spatial(self, gamma, spatial_cache):
-        return self.estimate_spatial_dynamic(gamma, spatial_cache)
+    def estimate_spatial(self, gamma, spatial_cache, return_gradient=False):
+        return self.estimate_spatial_dynamic(
+            gamma, spatial_cache, return_gradient)
 
     def pull_correct_dynamic(self, data, param):
         data = self.floor.apply_dynamic(data)
@@ -393,7 +418,7 @@ class MedianPullEParam0D(DynamicMedianPullCorrector):
         create_pull_0d_e(self.pull_dict)
 
     def create_dynamic(self, pickled_array):
-        return lambda data: np.array([pickled_array for _ in data])
+        return lambda data: broadcast_to_events(data, pickled_array)
 
 
 @BaseAngularErrorModifier.register_subclass("median_1d")
@@ -427,8 +452,7 @@ class MedianPull2D(StaticMedianPullCorrector):
         func = RectBivariateSpline(self.pickled_data[0], self.pickled_data[1],
                                    self.pickled_data[2])
 
-        return lambda data: [func(x["logE"], x["sinDec"])[0][0] for x in data]
-        # return lambda data:
+        return lambda data: func.ev(data["logE"], data["sinDec"])
 
 @BaseAngularErrorModifier.register_subclass("median_2d_e")
 class MedianPullEParam2D(DynamicMedianPullCorrector):
@@ -440,7 +464,7 @@ class MedianPullEParam2D(DynamicMedianPullCorrector):
         func = RectBivariateSpline(pickled_array[0], pickled_array[1],
                                    pickled_array[2])
 
-        return lambda data: func(data["logE"], data["sinDec"])
+        return lambda data: func.ev(data["logE"], data["sinDec"])
 
 
 if __name__ == "__main__":
@@ -12,6 +12,30 @@ gamma_range = [1., 4.]
 default_emin = 100
 default_emax = 10**7
 
+# Number of logarithmically-spaced bins used to integrate over energy
+n_energy_steps = int(1.e3)
+
+
+def evaluate_over_energy(f, energies):
+    """Evaluates a function on an array of energies in one call. The
+    function may also return an array with additional leading dimensions,
+    e.g to evaluate many declinations at once. Functions which only accept
+    scalar energies are instead evaluated at each energy in turn.
+
+    :param f: Function of energy
+    :param energies: Array of energies
+    :return: Array of function values
+    """
+    try:
+        vals = np.asarray(f(energies), dtype=np.float)
+        if vals.shape[vals.ndim - energies.ndim:] == energies.shape:
+            return vals
+    except (TypeError, ValueError):
+        pass
+
+    return np.array([f(e) for e in energies.ravel()],
+                    dtype=np.float).reshape(energies.shape)
+
 
 def read_e_pdf_dict(e_pdf_dict):
     """Ensures backwards compatibility of e_pdf_dict objects.
@@ -106,7 +130,9 @@ class EnergyPDF(object):
     def integrate_over_E(self, f, lower=None, upper=None):
         """Uses Newton's method to integrate function f over the energy
         range. By default, uses 100GeV to 10PeV, unless otherwise specified.
-        Uses 1000 logarithmically-spaced bins to calculate integral.
+        Uses 1000 logarithmically-spaced bins to calculate integral. If
+        upper is an array, or f returns an array of integrands (e.g for
+        many declinations), an array of integrals is returned.
 
         :param f: Function to be integrated
         :return: Integral of function
@@ -114,14 +140,16 @@ class EnergyPDF(object):
 
         diff_sum, _ = self.piecewise_integrate_over_energy(f, lower, upper)
 
-        int_sum = np.sum(diff_sum)
+        int_sum = np.sum(diff_sum, axis=-1)
 
         return int_sum
 
     def piecewise_integrate_over_energy(self, f, lower=None, upper=None):
         """Uses Newton's method to integrate function f over the energy
         range. By default, uses 100GeV to 10PeV, unless otherwise specified.
-        Uses 1000 logarithmically-spaced bins to calculate integral.
+        Uses 1000 logarithmically-spaced bins to calculate integral. The
+        function is evaluated on the whole grid at once, and the upper
+        limit may be an array, giving one grid per limit.
 
         :param f: Function to be integrated
         :return: Integral of function bins
@@ -133,15 +161,14 @@ class EnergyPDF(object):
         if upper is None:
             upper = self.integral_e_max
 
-        nsteps = int(1.e3)
+        e_range = np.linspace(np.log10(lower), np.log10(upper),
+                              n_energy_steps + 1, axis=-1)
 
-        e_range = np.linspace(np.log10(lower), np.log10(upper), nsteps + 1)
-        diff_sum = []
+        e_vals = np.exp(e_range)
+        f_vals = evaluate_over_energy(f, e_vals)
 
-        for i, log_e in enumerate(e_range[:-1]):
-            e0 = np.exp(log_e)
-            e1 = np.exp(e_range[i + 1])
-            diff_sum.append(0.5 * (e1 - e0) * (f(e0) + f(e1)))
+        diff_sum = 0.5 * (e_vals[..., 1:] - e_vals[..., :-1]) * (
+                f_vals[..., :-1] + f_vals[..., 1:])
 
         return diff_sum, e_range
 
@@ -229,13 +256,11 @@ class PowerLaw(EnergyPDF):
 
         # If there is a minimum energy, gives a weight of 0 to events below
         if hasattr(self, "e_min"):
-            if energy < self.e_min:
-                return 0.
+            val = np.where(energy < self.e_min, 0., val)
 
         # If there is a maximum energy, gives a weight of 0 to events above
         if hasattr(self, "e_max"):
-            if energy > self.e_max:
-                return 0.
+            val = np.where(energy > self.e_max, 0., val)
 
         return val
 
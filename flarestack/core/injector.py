@@ -1,20 +1,27 @@
 import logging
 import os
+import shutil
+import tempfile
+import weakref
 import numpy as np
 import healpy as hp
 import random
-from flarestack.shared import k_to_flux, scale_shortener, band_mask_cache_name
+from collections import OrderedDict
+from flarestack.shared import k_to_flux, scale_shortener
 from flarestack.core.energy_pdf import EnergyPDF, read_e_pdf_dict
 from flarestack.core.time_pdf import TimePDF, read_t_pdf_dict
 from flarestack.core.spatial_pdf import SpatialPDF
 from flarestack.icecube_utils.dataset_loader import data_loader
 from flarestack.utils.catalogue_loader import calculate_source_weight
-from scipy import sparse, interpolate
+from scipy import interpolate
 from flarestack.shared import k_to_flux
 
 
 logging.basicConfig(level=logging.DEBUG)
 
+# Default memory limit (in MB) for the rotated pools of RotatedPoolInjector
+default_pool_memory_mb = 1000.
+
 
 def read_injector_dict(inj_dict):
     """Ensures that injection dictionaries remain backwards-compatible
@@ -78,6 +85,7 @@ class BaseInjector:
         self.season.load_background_model()
 
         self.sources = sources
+        self.source_index_map = self.make_source_index_map(self.sources)
 
         if len(sources) > 0:
             self.weight_scale = calculate_source_weight(self.sources)
@@ -121,17 +129,43 @@ class BaseInjector:
     def calculate_n_exp_single(self, source):
         raise NotImplementedError
 
-    def get_n_exp_single(self, source):
+    @staticmethod
+    def make_source_index_map(sources):
+        """Maps the name of each source to its position in the catalogue,
+        which is also its position in the n_exp table.
 
-        if not isinstance(source['source_name'], bytes):
-            name = bytes(source['source_name'], encoding='utf8')
-        else:
-            name = source['source_name']
+        :param sources: Catalogue of sources
+        :return: Dictionary of source name to index
+        """
+        index_map = dict()
+
+        for i, name in enumerate(np.atleast_1d(sources["source_name"])):
+            if isinstance(name, bytes):
+                name = name.decode()
+            index_map.setdefault(name, i)
+
+        return index_map
 
-        return np.copy(self.n_exp[self.n_exp["source_name"] == name])
+    def get_source_index(self, source):
+        """Returns the position of a source in the catalogue of the
+        injector. Raises a KeyError if the source is not in the catalogue.
+
+        :param source: Source to be found
+        :return: Index of source
+        """
+        name = source['source_name']
+
+        if isinstance(name, bytes):
+            name = name.decode()
+
+        return self.source_index_map[name]
+
+    def get_n_exp_single(self, source):
+        return np.copy(self.n_exp[self.get_source_index(source)])
 
     def get_expectation(self, source, scale):
-        return float(self.get_n_exp_single(source)["n_exp"]) * scale
+        return float(self.n_exp["n_exp"][self.get_source_index(source)]) * \
+               scale
 
     def update_sources(self, sources):
         """Reuses an injector with new sources
@@ -139,6 +173,8 @@ class BaseInjector:
         :param sources: Sources to be added
         """
         self.sources = sources
+        self.source_index_map = self.make_source_index_map(self.sources)
+        self.sig_time_pdf.clear_inverse_cdf()
         self.weight_scale = np.sum(
                 self.sources["base_weight"] * self.sources["distance_mpc"]**-2)
         self.n_exp = self.calculate_n_exp()
@@ -152,7 +188,15 @@ class BaseInjector:
         :param angular_error_modifier: AngularErrorModifier to change angular errors
         :return: Simulated dataset
         """
-        bkg_events = self.season.simulate_background()
+        # The background is scrambled into a reusable buffer, and is only
+        # copied once, either when combined with the signal or otherwise
+        # directly. The buffer itself cannot be returned, because it is
+        # overwritten by the next call while callers may still hold the
+        # previous dataset, and because pull_correct_static modifies the
+        # angular errors in place, so that corrections would otherwise
+        # accumulate in the buffer.
+
+        bkg_events = self.season.simulate_background(reuse_buffer=True)
 
         if scale > 0.:
             sig_events = self.inject_signal(scale)
@@ -161,6 +205,8 @@ class BaseInjector:
 
         if len(sig_events) > 0:
             simulated_data = np.concatenate((bkg_events, sig_events))
+        elif bkg_events is self.season.background_buffer:
+            simulated_data = np.copy(bkg_events)
         else:
             simulated_data = bkg_events
 
@@ -223,9 +269,15 @@ class MCInjector(BaseInjector):
 
     def __init__(self, season, sources, **kwargs):
         kwargs = read_injector_dict(kwargs)
-        self._mc = season.get_mc()
+        # The MC is memory-mapped rather than copied, so that it is shared
+        # between all processes running trials on the same season
+        self._mc = season.get_mc(mmap_mode="r")
         BaseInjector.__init__(self, season, sources, **kwargs)
 
+        # Concatenated selection CDFs of all sources, built with n_exp
+        self.injection_index = None
+        self.injection_cdf = None
+
         try:
             self.mc_weights = self.energy_pdf.weight_mc(self._mc)
             self.n_exp = self.calculate_n_exp()
@@ -279,20 +331,43 @@ class MCInjector(BaseInjector):
 
         return source_mc
 
+    def calculate_n_exp(self):
+        """Calculates the expected number of events for each source at unit
+        flux scale, and builds the CDFs used to select MC events for each
+        source. Neither depends on the flux scale, so injection then only
+        needs to multiply n_exp by the scale before sampling.
+
+        :return: Table of expected number of events for each source
+        """
+        n_exp = BaseInjector.calculate_n_exp(self)
+
+        self.injection_index, self.injection_cdf = self.make_injection_cdf(
+            self.sources)
+
+        return n_exp
+
     def calculate_n_exp_single(self, source):
-        return np.sum(self.calculate_single_source(source, 1.)["ow"])
+        """Calculates the expected number of events for a source at unit
+        flux scale, from the sum of MC weights in its declination band. This
+        is equal to the oneweight sum of calculate_single_source, but
+        without copying the MC.
 
-    def calculate_fluence(self, source, scale, source_mc, band_mask, omega):
-        """Function to calculate the fluence for a given source, and multiply
-        the oneweights by this. After this step, the oneweight sum is equal
-        to the expected neutrino number.
+        :param source: Source to be calculated
+        :return: Expected number of events
+        """
+        dec_width, min_dec, max_dec, omega = self.get_dec_and_omega(source)
+        band_mask = self.get_band_mask(source, min_dec, max_dec)
+
+        return self.get_fluence(source, 1.) * np.sum(
+            self.mc_weights[band_mask]) / omega
+
+    def get_fluence(self, source, scale):
+        """Function to calculate the fluence for a given source, i.e the
+        flux multiplied by the effective injection time.
 
         :param source: Source to be calculated
         :param scale: Flux scale
-        :param source_mc: MC that is close to source
-        :param band_mask: Closeness mask for MC
-        :param omega: Solid angle covered by MC mask
-        :return: Modified source MC
+        :return: Fluence of source
         """
         # Calculate the effective injection time for simulation. Equal to
         # the overlap between the season and the injection time PDF for
@@ -309,7 +384,21 @@ class MCInjector(BaseInjector):
         weight = calculate_source_weight(source) / self.weight_scale
 
         # Calculate the fluence, using the effective injection time.
-        fluence = inj_flux * eff_inj_time * weight
+        return inj_flux * eff_inj_time * weight
+
+    def calculate_fluence(self, source, scale, source_mc, band_mask, omega):
+        """Function to calculate the fluence for a given source, and multiply
+        the oneweights by this. After this step, the oneweight sum is equal
+        to the expected neutrino number.
+
+        :param source: Source to be calculated
+        :param scale: Flux scale
+        :param source_mc: MC that is close to source
+        :param band_mask: Closeness mask for MC
+        :param omega: Solid angle covered by MC mask
+        :return: Modified source MC
+        """
+        fluence = self.get_fluence(source, scale)
 
         # Recalculates the oneweights to account for the declination
         # band, and the relative distance of the sources.
@@ -320,6 +409,143 @@ class MCInjector(BaseInjector):
 
         return source_mc
 
+    def update_sources(self, sources):
+        """Reuses an injector with new sources
+
+        :param sources: Sources to be added
+        """
+        self.injection_index = None
+        self.injection_cdf = None
+        BaseInjector.update_sources(self, sources)
+
+    def make_injection_cdf(self, sources):
+        """Builds the normalised cumulative distributions used to select MC
+        events for each source. The probability of selecting an event is
+        proportional to its weight, and independent of the flux scale. The
+        distributions of all sources are concatenated, with the distribution
+        of the i-th source shifted to lie between i and i + 1, so that events
+        for all sources can be drawn with a single search.
+
+        :param sources: Sources to be simulated
+        :return: Index of each MC event in self._mc, and concatenated CDFs
+        """
+        all_index = []
+        all_cdf = []
+
+        for i, source in enumerate(sources):
+            dec_width, min_dec, max_dec, omega = self.get_dec_and_omega(source)
+            band_mask = self.get_band_mask(source, min_dec, max_dec)
+
+            index = np.flatnonzero(band_mask)
+            cdf = np.cumsum(self.mc_weights[index])
+
+            # Sources without any weighted MC cannot be injected
+            if len(cdf) == 0 or not cdf[-1] > 0.:
+                continue
+
+            cdf /= cdf[-1]
+            cdf[-1] = 1.
+            cdf += i
+
+            all_index.append(index)
+            all_cdf.append(cdf)
+
+        if len(all_index) == 0:
+            return np.zeros(0, dtype=np.int), np.zeros(0)
+
+        return np.concatenate(all_index), np.concatenate(all_cdf)
+
+    @staticmethod
+    def draw_cdf_positions(cdf, n_s):
+        """Draws positions in the concatenated CDFs built by
+        make_injection_cdf, for all sources at once.
+
+        :param cdf: Concatenated CDFs of each source
+        :param n_s: Number of events to draw for each source
+        :return: Position in cdf of each drawn event, ordered by source
+        """
+        starts = np.searchsorted(cdf, np.arange(len(n_s)), side="right")
+        ends = np.searchsorted(cdf, np.arange(len(n_s)) + 1., side="right")
+
+        # Sources without any weighted MC have no CDF, and cannot be injected
+        MCInjector.check_injectable(n_s, ends > starts)
+
+        source_index = np.repeat(np.arange(len(n_s)), n_s)
+
+        pos = np.searchsorted(
+            cdf, source_index + np.random.random(len(source_index)),
+            side="right")
+
+        # Guards against rounding up to the start of the next source
+        pos = np.minimum(pos, ends[source_index] - 1)
+
+        return pos
+
+    @staticmethod
+    def check_injectable(n_s, has_mc):
+        """Checks that every source with events to inject has weighted MC in
+        its declination band to draw them from.
+
+        :param n_s: Number of events to inject for each source
+        :param has_mc: Whether the band of each source has weighted MC
+        """
+        missing = np.flatnonzero(np.logical_and(np.asarray(n_s) > 0,
+                                                ~np.asarray(has_mc)))
+        if len(missing) > 0:
+            raise ValueError(
+                "No weighted MC in the declination band of sources {0}, but "
+                "{1} events were to be injected for them.".format(
+                    list(missing), list(np.asarray(n_s)[missing])))
+
+    @staticmethod
+    def draw_from_cdf(index, cdf, n_s):
+        """Draws MC events for all sources at once, by inverting the
+        concatenated CDFs built by make_injection_cdf.
+
+        :param index: Index of each MC event in self._mc
+        :param cdf: Concatenated CDFs of each source
+        :param n_s: Number of events to draw for each source
+        :return: Index in self._mc of each drawn event, ordered by source
+        """
+        return index[MCInjector.draw_cdf_positions(cdf, n_s)]
+
+    def select_injection_events(self, n_s):
+        """Selects MC events to inject for each source.
+
+        :param n_s: Number of events to inject for each source
+        :return: Index in self._mc of each selected event, ordered by source
+        """
+        if self.injection_cdf is None:
+            self.injection_index, self.injection_cdf = \
+                self.make_injection_cdf(self.sources)
+
+        return self.draw_from_cdf(self.injection_index, self.injection_cdf,
+                                  n_s)
+
+    def simulate_n_s(self, scale):
+        """Draws the number of events to inject for each source.
+
+        :param scale: Ratio of Injected Flux to source flux.
+        :return: Expected and simulated number of events for each source
+        """
+
+        # If a number of neutrinos to inject is specified, use that.
+        # Otherwise, inject based on the flux scale as normal.
+
+        if not np.isnan(self.fixed_n):
+            n_inj = np.full(len(self.sources), int(self.fixed_n), dtype=np.float)
+        else:
+            n_inj = np.ravel(self.n_exp["n_exp"]) * scale
+
+        # Simulates poisson noise around the expectation value n_inj.
+        if self.poisson_smear:
+            n_s = np.random.poisson(n_inj)
+        # If there is no poisson noise, rounds n_s down to nearest integer
+        else:
+            n_s = n_inj.astype(np.int)
+
+        return n_inj, n_s
+
     def inject_signal(self, scale):
         """Randomly select simulated events from the Monte Carlo dataset to
         simulate a signal for each source. The source flux can be scaled by
@@ -328,65 +554,45 @@ class MCInjector(BaseInjector):
         :param scale: Ratio of Injected Flux to source flux.
         :return: Set of signal events for the given IC Season.
         """
-        # Creates empty signal event array
-        sig_events = np.empty((0, ), dtype=self.season.get_background_dtype())
+        n_inj, n_s = self.simulate_n_s(scale)
 
-        n_tot_exp = 0
+        names = list(self.season.get_background_dtype().names)
 
-        # Loop over each source to be simulated
-        for i, source in enumerate(self.sources):
-
-            # If a number of neutrinos to inject is specified, use that.
-            # Otherwise, inject based on the flux scale as normal.
-
-            if not np.isnan(self.fixed_n):
-                n_inj = int(self.fixed_n)
-            else:
-                n_inj = self.get_expectation(source, scale)
-
-            n_tot_exp += n_inj
-
-            # Simulates poisson noise around the expectation value n_inj.
-            if self.poisson_smear:
-                n_s = np.random.poisson(n_inj)
-            # If there is no poisson noise, rounds n_s down to nearest integer
-            else:
-                n_s = int(n_inj)
+        # Creates signal event array, to be filled source by source
+        sig_events = np.empty((np.sum(n_s), ),
+                              dtype=self.season.get_background_dtype())
 
-            #  If n_s = 0, skips simulation step.
-            if n_s < 1:
-                continue
+        if len(sig_events) == 0:
+            return sig_events
 
-            source_mc = self.calculate_single_source(source, scale)
+        # Selects the MC events for all sources at once, with a probability
+        # for each event equal to its weight
+        sim_ev = self._mc[self.select_injection_events(n_s)]
 
-            # Creates a normalised array of OneWeights
-            p_select = source_mc['ow'] / np.sum(source_mc['ow'])
+        ends = np.cumsum(n_s)
 
-            # Creates an array with n_signal entries.
-            # Each entry is a random integer between 0 and no. of sources.
-            # The probability for each integer is equal to the OneWeight of
-            # the corresponding source_path.
-            ind = np.random.choice(len(source_mc['ow']), size=n_s, p=p_select)
+        for i in np.flatnonzero(n_s):
 
-            # Selects the sources corresponding to the random integer array
-            sim_ev = source_mc[ind]
+            source = self.sources[i]
+            start = ends[i] - n_s[i]
 
             # Rotates the Monte Carlo events onto the source_path
-            sim_ev = self.spatial_pdf.rotate_to_position(
-                sim_ev, source['ra_rad'], source['dec_rad']
+            ev = self.spatial_pdf.rotate_to_position(
+                sim_ev[start:ends[i]], source['ra_rad'], source['dec_rad']
             )
 
-            # Generates times for each simulated event, drawing from the
-            # Injector time PDF.
+            for name in names:
+                if name != "time":
+                    sig_events[name][start:ends[i]] = ev[name]
 
-            sim_ev["time"] = self.sig_time_pdf.simulate_times(source, n_s)
+        # Generates times for each simulated event, drawing from the
+        # Injector time PDF.
 
-            # Joins the new events to the signal events
-            sig_events = np.concatenate(
-                (sig_events,
-                 sim_ev[list(self.season.get_background_dtype().names)])
-            )
-            logging.info("Injected {0} events with an expectation of {1:.2f} events".format(n_s, n_inj[0]))
+        sig_events["time"] = self.sig_time_pdf.simulate_times_multi(
+            self.sources, n_s)
+
+        logging.info("Injected {0} events with an expectation of {1:.2f} "
+                     "events".format(len(sig_events), np.sum(n_inj)))
 
         return sig_events
 
@@ -395,90 +601,296 @@ class MCInjector(BaseInjector):
 class LowMemoryInjector(MCInjector):
     """For large numbers of sources O(~100), saving MC masks becomes
     increasingly burdensome. As a solution, the LowMemoryInjector should be
-    used instead. It will be somewhat slower, but will have much more
-    reasonable memory consumption.
+    used instead. The MC is indexed in order of true declination, so that
+    the declination band of each source is a contiguous slice of the
+    sorting index, given only by its start and stop positions. No masks are
+    stored, and the memory required for each source is constant. The MC
+    itself is not sorted, so the events of a band are selected with an
+    index array, which returns a copy of the band rather than a view.
     """
 
     def __init__(self, season, sources, **kwargs):
-        self.split_cats = None
-        self.injection_band_paths = None
-        self.band_mask_cache = None
-        self.band_mask_index = None
+        self.dec_order = None
+        self.sorted_dec = None
+        self.cumulative_weights = None
 
         MCInjector.__init__(self, season, sources, **kwargs)
 
-    def calculate_n_exp(self):
+    def sort_mc(self):
+        """Sorts the MC by true declination. The sorted MC itself is not
+        stored, only the sorting index, the sorted declinations and the
+        cumulative sum of the sorted MC weights (starting at zero). The sum
+        of weights in any band is then the difference of two entries.
+        """
+        self.dec_order = np.argsort(self._mc["trueDec"], kind="stable")
+        self.sorted_dec = np.asarray(self._mc["trueDec"])[self.dec_order]
+        self.cumulative_weights = np.concatenate(
+            ([0.], np.cumsum(self.mc_weights[self.dec_order])))
+
+    def get_band_edges(self, min_dec, max_dec):
+        """Returns the slice of the declination-sorted MC which lies
+        strictly between min_dec and max_dec.
+
+        :param min_dec: Minimum declination of band
+        :param max_dec: Maximum declination of band
+        :return: Start and stop positions of band in sorted MC
+        """
+        start = np.searchsorted(self.sorted_dec, min_dec, side="right")
+        stop = np.searchsorted(self.sorted_dec, max_dec, side="left")
+        return start, max(start, stop)
 
-        cats, paths, m_index, s_index = band_mask_cache_name(
-            self.season, self.sources
-        )
-        self.split_cats = cats
-        self.injection_band_paths = paths
+    def calculate_n_exp(self):
 
-        if np.sum([not os.path.isfile(x) for x in self.injection_band_paths]) > 0.:
-            logging.info("No saved band masks found. These will have to be made first.")
-            self.make_injection_band_mask()
+        if self.dec_order is None:
+            self.sort_mc()
 
         self.n_exp = np.empty((len(self.sources), 1), dtype=np.dtype(
             [('source_name', 'a30'), ('n_exp', np.float),
-             ('mask_index', np.int), ("source_index", np.int)]))
-
-        self.n_exp["mask_index"] = np.array(m_index).reshape(len(m_index), 1)
-        self.n_exp["source_index"] = np.array(s_index).reshape(len(s_index), 1)
+             ('band_start', np.int), ("band_stop", np.int)]))
 
         for i, source in enumerate(self.sources):
+            dec_width, min_dec, max_dec, omega = self.get_dec_and_omega(source)
+            start, stop = self.get_band_edges(min_dec, max_dec)
+
+            band_weight = self.cumulative_weights[stop] - \
+                self.cumulative_weights[start]
+
             self.n_exp[i]["source_name"] = source["source_name"]
-            self.n_exp[i]["n_exp"] = self.calculate_n_exp_single(source)
+            self.n_exp[i]["band_start"] = start
+            self.n_exp[i]["band_stop"] = stop
+            self.n_exp[i]["n_exp"] = self.get_fluence(source, 1.) * \
+                band_weight / omega
 
         return self.n_exp
 
-    def make_injection_band_mask(self):
+    def get_band_mask(self, source, min_dec, max_dec):
+        """Returns the index in self._mc of the MC events within the
+        declination band, ordered by true declination. This can be used in
+        place of a boolean mask, and like a boolean mask, indexing the MC
+        with it returns a copy of the events in the band.
+        """
+        start, stop = self.get_band_edges(min_dec, max_dec)
+        return self.dec_order[start:stop]
+
+    def select_injection_events(self, n_s):
+        """Selects MC events to inject for each source. The cumulative
+        weights of each band are a slice of the cumulative weights of the
+        sorted MC, so events for all sources are drawn with a single
+        search, without building any distributions for each source.
+
+        :param n_s: Number of events to inject for each source
+        :return: Index in self._mc of each selected event, ordered by source
+        """
+        band_start = np.ravel(self.n_exp["band_start"])
+        band_stop = np.ravel(self.n_exp["band_stop"])
+
+        self.check_injectable(n_s, self.cumulative_weights[band_stop] >
+                              self.cumulative_weights[band_start])
+
+        source_index = np.repeat(np.arange(len(n_s)), n_s)
+
+        start = band_start[source_index]
+        stop = band_stop[source_index]
+
+        low = self.cumulative_weights[start]
+        high = self.cumulative_weights[stop]
+
+        pos = np.searchsorted(
+            self.cumulative_weights,
+            low + np.random.random(len(source_index)) * (high - low),
+            side="right") - 1
+
+        # Guards against rounding beyond the edges of each band
+        pos = np.clip(pos, start, stop - 1)
 
-        for j, cat in enumerate(self.split_cats):
+        return self.dec_order[pos]
 
-            path = self.injection_band_paths[j]
 
+@MCInjector.register_subclass("rotated_pool_injector")
+class RotatedPoolInjector(MCInjector):
+    """For a fixed catalogue, the rotation of each MC event onto a source is
+    the same in every trial. The RotatedPoolInjector therefore rotates the
+    MC in the declination band of each source only once, the first time an
+    event is injected for that source. Each trial then only selects events
+    from these pools of rotated events. The pools are kept in memory up to
+    a maximum size ("pool_max_memory_mb"), after which the least recently
+    used pools are dropped. If "pool_spill_dir" is given, dropped pools are
+    instead saved there, and loaded again when next needed. The saved pools
+    are in a temporary directory, which is removed by clear_pools, or
+    otherwise when the injector is deleted or Python exits.
+    """
+
+    def __init__(self, season, sources, **kwargs):
+        kwargs = read_injector_dict(kwargs)
+
+        try:
+            self.pool_max_memory = float(kwargs["pool_max_memory_mb"]) * 1.e6
+        except KeyError:
+            self.pool_max_memory = default_pool_memory_mb * 1.e6
+
+        try:
+            self.pool_spill_dir = kwargs["pool_spill_dir"]
+        except KeyError:
+            self.pool_spill_dir = None
+
+        self.rotated_pools = OrderedDict()
+        self.spilled_pools = dict()
+        self.pool_memory = 0
+        self.pool_dir = None
+        self.pool_dir_finalizer = None
+        self.pool_starts = None
+
+        MCInjector.__init__(self, season, sources, **kwargs)
+
+    def update_sources(self, sources):
+        """Reuses an injector with new sources, discarding all rotated pools
+
+        :param sources: Sources to be added
+        """
+        self.clear_pools()
+        MCInjector.update_sources(self, sources)
+
+    def clear_pools(self):
+        """Discards all rotated pools, and removes the directory of pools
+        saved to disk."""
+        if self.pool_dir_finalizer is not None:
+            self.pool_dir_finalizer()
+
+        self.pool_dir = None
+        self.pool_dir_finalizer = None
+        self.rotated_pools = OrderedDict()
+        self.spilled_pools = dict()
+        self.pool_memory = 0
+        self.pool_starts = None
+
+    def make_pool(self, i):
+        """Rotates the MC events which can be injected for a source onto
+        the position of the source.
+
+        :param i: Index of source
+        :return: Rotated events, in the order of the source's CDF
+        """
+        source = self.sources[i]
+
+        start = self.pool_starts[i]
+        end = self.pool_starts[i + 1]
+
+        ev = self.spatial_pdf.rotate_to_position(
+            self._mc[self.injection_index[start:end]],
+            source['ra_rad'], source['dec_rad']
+        )
+
+        pool = np.zeros(len(ev), dtype=self.season.get_background_dtype())
+
+        for name in pool.dtype.names:
+            if name != "time":
+                pool[name] = ev[name]
+
+        return pool
+
+    def spill_pool(self, i, pool):
+        """Saves a rotated pool to disk, if a spill directory was given.
+
+        :param i: Index of source
+        :param pool: Rotated events
+        """
+        if self.pool_spill_dir is None or i in self.spilled_pools:
+            return
+
+        if self.pool_dir is None:
             try:
-                os.makedirs(os.path.dirname(path))
+                os.makedirs(self.pool_spill_dir)
             except OSError:
                 pass
 
-            # Make mask
-            injection_band_mask = sparse.lil_matrix((len(cat),
-                                                     len(self._mc)), dtype=bool)
-            for i, source in enumerate(cat):
-                dec_width, min_dec, max_dec, omega = self.get_dec_and_omega(source)
-                band_mask = np.logical_and(np.greater(self._mc["trueDec"], min_dec),
-                                           np.less(self._mc["trueDec"], max_dec))
-                injection_band_mask[i, :] = band_mask
-            injection_band_mask = injection_band_mask.tocsr()
-            sparse.save_npz(path, injection_band_mask)
+            self.pool_dir = tempfile.mkdtemp(
+                prefix=self.season.season_name + "_", dir=self.pool_spill_dir)
 
-            del injection_band_mask
+            # The directory is removed when the injector is deleted, or at
+            # exit, if clear_pools has not been called
 
-            logging.info("Saving to {0}".format(path))
+            self.pool_dir_finalizer = weakref.finalize(
+                self, shutil.rmtree, self.pool_dir, ignore_errors=True)
 
-    def load_band_mask(self, index):
-        path = self.injection_band_paths[index]
-        del self.band_mask_cache
-        self.band_mask_cache = sparse.load_npz(path)
-        self.band_mask_index = index
-        # return sparse.load_npz(path)
+        path = os.path.join(self.pool_dir, "{0}.npy".format(i))
+        np.save(path, pool)
+        self.spilled_pools[i] = path
 
-    def get_band_mask(self, source, min_dec, max_dec):
+    def get_pool(self, i):
+        """Returns the rotated pool of a source, making it if necessary. The
+        least recently used pools are dropped (or saved to disk) once the
+        pools exceed the memory limit.
 
-        entry = self.get_n_exp_single(source)
-        mask_index = entry["mask_index"]
+        :param i: Index of source
+        :return: Rotated events
+        """
+        if i in self.rotated_pools:
+            self.rotated_pools.move_to_end(i)
+            return self.rotated_pools[i]
+
+        if i in self.spilled_pools:
+            pool = np.load(self.spilled_pools[i])
+        else:
+            pool = self.make_pool(i)
+
+        self.rotated_pools[i] = pool
+        self.pool_memory += pool.nbytes
+
+        while self.pool_memory > self.pool_max_memory and \
+                len(self.rotated_pools) > 1:
+            j, old_pool = self.rotated_pools.popitem(last=False)
+            self.pool_memory -= old_pool.nbytes
+            self.spill_pool(j, old_pool)
+
+        return pool
+
+    def inject_signal(self, scale):
+        """Randomly select rotated events from the pool of each source to
+        simulate a signal for each source. The source flux can be scaled by
+        the scale parameter.
+
+        :param scale: Ratio of Injected Flux to source flux.
+        :return: Set of signal events for the given IC Season.
+        """
+        n_inj, n_s = self.simulate_n_s(scale)
+
+        sig_events = np.empty((np.sum(n_s), ),
+                              dtype=self.season.get_background_dtype())
+
+        if len(sig_events) == 0:
+            return sig_events
+
+        if self.injection_cdf is None:
+            self.injection_index, self.injection_cdf = \
+                self.make_injection_cdf(self.sources)
 
-        if not np.logical_and(self.band_mask_cache is not None,
-                              self.band_mask_index == mask_index):
-            self.load_band_mask(mask_index[0])
+        # Each pool covers the positions in the CDF which can be drawn for
+        # its source by draw_cdf_positions
 
-        # band_mask = self.load_band_mask(mask_index[0])
+        if self.pool_starts is None:
+            self.pool_starts = np.searchsorted(
+                self.injection_cdf, np.arange(len(self.sources) + 1),
+                side="right")
 
-        return self.band_mask_cache.getrow(entry["source_index"][0]).toarray(
+        pos = self.draw_cdf_positions(self.injection_cdf, n_s)
 
-        )[0]
+        ends = np.cumsum(n_s)
+
+        for i in np.flatnonzero(n_s):
+            start = ends[i] - n_s[i]
+            sig_events[start:ends[i]] = self.get_pool(i)[
+                pos[start:ends[i]] - self.pool_starts[i]]
+
+        # Generates times for each simulated event, drawing from the
+        # Injector time PDF.
+
+        sig_events["time"] = self.sig_time_pdf.simulate_times_multi(
+            self.sources, n_s)
+
+        logging.info("Injected {0} events with an expectation of {1:.2f} "
+                     "events".format(len(sig_events), np.sum(n_inj)))
+
+        return sig_events
 
 
 class EffectiveAreaInjector(BaseInjector):
@@ -619,10 +1031,9 @@ class EffectiveAreaInjector(BaseInjector):
             100
         )[1:]
 
-        y_vals = np.array([
-            self.energy_pdf.integrate_over_E(source_eff_area, upper=np.exp(x))
-            for x in x_vals
-        ])
+        # The integrals for all upper limits are evaluated at once
+        y_vals = self.energy_pdf.integrate_over_E(
+            source_eff_area, upper=np.exp(x_vals))
         y_vals /= max(y_vals)
 
         f = interpolate.interp1d([0.0] + list(y_vals), [start_x] + list(x_vals))
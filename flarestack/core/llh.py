@@ -10,7 +10,7 @@ from flarestack.shared import acceptance_path, llh_energy_hash_pickles, \
     SoB_spline_path, bkg_spline_path
 from flarestack.core.time_pdf import TimePDF, read_t_pdf_dict
 from flarestack.utils.make_SoB_splines import load_spline, \
-    load_bkg_spatial_spline
+    load_bkg_spatial_spline, LazySupportPointCache, load_SoB_grid
 from flarestack.core.energy_pdf import EnergyPDF, read_e_pdf_dict
 from flarestack.core.spatial_pdf import SpatialPDF
 from flarestack.utils.create_acceptance_functions import dec_range,\
@@ -100,6 +100,10 @@ class LLH(object):
 
         self.acceptance, self.energy_weight_f = self.create_energy_functions()
 
+        # Declination-sorted index of the most recent dataset, used to
+        # select spatially-coincident events
+        self.dec_index = None
+
     @classmethod
     def register_subclass(cls, llh_name):
         """Adds a new subclass of EnergyPDF, with class name equal to
@@ -245,6 +249,91 @@ class LLH(object):
 
         return acc_f, energy_weight_f
 
+    def source_acceptance(self, sources, params=None):
+        """Calculates the detector acceptance for all sources at once.
+
+        :param sources: Sources to be considered
+        :param params: Parameter array
+        :return: Array of acceptance values, one for each source
+        """
+        return np.ones(len(sources)) * self.acceptance(sources, params)
+
+    def source_acceptance_gradient(self, sources, params=None):
+        """Calculates the derivative of the detector acceptance of each
+        source with respect to gamma. Unless gamma is fit, the acceptance
+        does not depend on it.
+
+        :param sources: Sources to be considered
+        :param params: Parameter array
+        :return: Array of acceptance derivatives, one for each source
+        """
+        return np.zeros(len(sources))
+
+    def get_dec_index(self, data):
+        """Sorts the events of a dataset by declination, so that all events
+        lying in a declination band can be found with a binary search. The
+        index is only created once for each dataset, and is reused for
+        each source. The dataset must therefore not be modified after the
+        index has been created.
+
+        :param data: Dataset to be indexed
+        :return: Indices which sort the data by declination, sorted
+        declinations
+        """
+        if self.dec_index is None or self.dec_index[0] is not data:
+            order, sorted_dec = self.sort_by_dec(data)
+            self.dec_index = (data, order, sorted_dec)
+
+        return self.dec_index[1], self.dec_index[2]
+
+    def sort_by_dec(self, data):
+        """Finds the indices which sort a dataset by declination. Simulated
+        datasets begin with a scrambled background, whose declinations are
+        the same in every trial. If the dataset begins with the background
+        of the season, the declination index of the background (made once
+        per season) is merged with that of the remaining (signal) events,
+        rather than sorting the full dataset. The result is identical to a
+        stable sort of the full dataset.
+
+        :param data: Dataset to be indexed
+        :return: Indices which sort the data by declination, sorted
+        declinations
+        """
+        base = self.season.background_base
+
+        if base is None or not len(base) <= len(data) or \
+                not np.array_equal(data["dec"][:len(base)], base["dec"]):
+            order = np.argsort(data["dec"], kind="stable")
+            return order, np.array(data["dec"])[order]
+
+        bkg_order, bkg_dec = self.season.get_background_dec_index()
+
+        n_bkg = len(base)
+
+        extra_dec = np.array(data["dec"][n_bkg:])
+        extra_order = np.argsort(extra_dec, kind="stable")
+        extra_dec = extra_dec[extra_order]
+
+        # Position of each additional event in the merged index. Events with
+        # equal declinations are placed after the background, as in a
+        # stable sort.
+
+        pos = np.searchsorted(bkg_dec, extra_dec, side="right") + \
+            np.arange(len(extra_dec))
+
+        is_bkg = np.ones(len(data), dtype=np.bool)
+        is_bkg[pos] = False
+
+        order = np.empty(len(data), dtype=bkg_order.dtype)
+        order[is_bkg] = bkg_order
+        order[pos] = n_bkg + extra_order
+
+        sorted_dec = np.empty(len(data), dtype=bkg_dec.dtype)
+        sorted_dec[is_bkg] = bkg_dec
+        sorted_dec[pos] = extra_dec
+
+        return order, sorted_dec
+
     def select_spatially_coincident_data(self, data, sources):
         """Checks each source, and only identifies events in data which are
         both spatially and time-coincident with the source. Spatial
@@ -253,11 +342,17 @@ class LLH(object):
         Time PDF. Produces a mask for the dataset, which removes all events
         which are not coincident with at least one source.
 
+        The events in the declination band of each source are found from
+        the declination-sorted index of the dataset, so only these events
+        are tested in Right Ascension.
+
         :param data: Dataset to be tested
         :param sources: Sources to be tested
         :return: Mask to remove
         """
-        veto = np.ones_like(data["ra"], dtype=np.bool)
+        order, sorted_dec = self.get_dec_index(data)
+
+        mask = np.zeros(len(data), dtype=np.bool)
 
         for source in sources:
 
@@ -269,8 +364,8 @@ class LLH(object):
             max_dec = min(np.pi / 2., source['dec_rad'] + width)
 
             # Accepts events lying within a 5 degree band of the source
-            dec_mask = np.logical_and(np.greater(data["dec"], min_dec),
-                                      np.less(data["dec"], max_dec))
+            band = order[np.searchsorted(sorted_dec, min_dec, side="right"):
+                         np.searchsorted(sorted_dec, max_dec, side="left")]
 
             # Sets the minimum value of cos(dec)
             cos_factor = np.amin(np.cos([min_dec, max_dec]))
@@ -283,14 +378,12 @@ class LLH(object):
             # Accounts for wrapping effects at ra=0, calculates the distance
             # of each event to the source.
             ra_dist = np.fabs(
-                (data["ra"] - source['ra_rad'] + np.pi) % (2. * np.pi) - np.pi)
-            ra_mask = ra_dist < dPhi / 2.
+                (data["ra"][band] - source['ra_rad'] + np.pi) % (2. * np.pi)
+                - np.pi)
 
-            spatial_mask = dec_mask & ra_mask
+            mask[band[ra_dist < dPhi / 2.]] = True
 
-            veto = veto & ~spatial_mask
-
-        return ~veto
+        return mask
 
     @staticmethod
     def assume_background(n_s, n_coincident, n_all):
@@ -308,6 +401,18 @@ class LLH(object):
         """
         return (n_all - n_coincident) * np.log1p(-n_s / n_all)
 
+    @staticmethod
+    def assume_background_gradient(n_s, n_coincident, n_all):
+        """Derivative of the assume_background log likelihood contribution,
+        with respect to n_s.
+
+        :param n_s: Array of expected number of events
+        :param n_coincident: Number of events that were not assumed to have S=0
+        :param n_all: The total number of events
+        :return: Derivative of Log Likelihood value with respect to n_s
+        """
+        return - (n_all - n_coincident) / (n_all - n_s)
+
     def create_kwargs(self, data, pull_corrector, weight_f=None):
         kwargs = dict()
         return kwargs
@@ -321,7 +426,11 @@ class LLH(object):
 
         kwargs = self.create_kwargs(data, pull_corrector, weight_f)
 
-        def test_statistic(params, weights):
+        def test_statistic(params, weights, return_gradient=False):
+            if return_gradient:
+                return self.calculate_test_statistic_and_gradient(
+                    params, weights, **kwargs)
+
             return self.calculate_test_statistic(
                 params, weights, **kwargs)
 
@@ -330,6 +439,76 @@ class LLH(object):
     def calculate_test_statistic(self, params, weights, **kwargs):
         pass
 
+    def calculate_test_statistic_and_gradient(self, params, weights,
+                                              **kwargs):
+        """Calculates the test statistic, as well as its analytic
+        derivatives. The derivatives are given with respect to the expected
+        number of signal events for each source (n_j = n_s * weight_j),
+        and with respect to gamma for fixed values of n_j. The
+        MinimisationHandler then combines these with the derivatives of the
+        weights, to give the full gradient in the fit parameters.
+
+        :param params: Parameters from Minimisation
+        :param weights: Normalised fraction of n_s allocated to each source
+        :return: 2 * llh value (Equal to Test Statistic), array of TS
+        derivatives for each n_j, TS derivative in gamma
+        """
+        raise NotImplementedError(
+            "Analytic gradients are not implemented for {0}".format(
+                self.__class__.__name__))
+
+    def calculate_fixed_SoB_test_statistic_and_gradient(
+            self, params, weights, SoB, n_coincident, n_all):
+        """Calculates the test statistic, as well as its analytic derivative
+        with respect to the expected number of signal events for each
+        source, for Signal/Background ratios which do not depend on gamma.
+
+        :param params: Parameters from Minimisation
+        :param weights: Normalised fraction of n_s allocated to each source
+        :param SoB: Signal/Background ratios of the coincident events of
+        each source
+        :param n_coincident: Number of events not assumed to be background
+        :param n_all: Total number of events
+        :return: 2 * llh value (Equal to Test Statistic), array of TS
+        derivatives for each n_j, TS derivative in gamma (always 0)
+        """
+        n_s = np.array(params)
+
+        # Calculates the expected number of signal events for each source in
+        # the season
+        all_n_j = (n_s * weights.T[0])
+
+        x = []
+
+        for i, n_j in enumerate(all_n_j):
+            x.append(1 + (n_j / n_all) * (SoB[i] - 1.))
+
+        if np.sum([np.sum(x_row <= 0.) for x_row in x]) > 0:
+            llh_value = -50. + all_n_j
+            n_j_grad = np.ones_like(all_n_j)
+
+        else:
+
+            llh_value = np.array([np.sum(np.log(y)) for y in x])
+
+            llh_value += self.assume_background(
+                all_n_j, n_coincident, n_all)
+
+            # d/dn_j log(1 + n_j/n_all * (SoB - 1)) = (SoB - 1)/(n_all * x)
+
+            n_j_grad = np.array([
+                np.sum((SoB[i] - 1.) / (n_all * y)) for i, y in enumerate(x)])
+
+            n_j_grad = n_j_grad + self.assume_background_gradient(
+                all_n_j, n_coincident, n_all)
+
+            if np.logical_and(np.sum(all_n_j) < 0,
+                              np.sum(llh_value) < np.sum(-50. + all_n_j)):
+                llh_value = -50. + all_n_j
+                n_j_grad = np.ones_like(all_n_j)
+
+        return 2. * np.sum(llh_value), 2. * n_j_grad, 0.
+
     @staticmethod
     def return_llh_parameters(llh_dict):
         seeds = []
@@ -381,14 +560,16 @@ class SpatialLLH(LLH):
         # return lambda x: data_rate
         return lambda x: np.exp(self.bkg_spatial(np.sin(x))) * data_rate
 
-    def create_llh_function(self, data, pull_corrector, weight_f=None):
-        """Creates a likelihood function to minimise, based on the dataset.
+    def create_kwargs(self, data, pull_corrector, weight_f=None):
+        """Creates the cached values required to evaluate the likelihood
+        function for the dataset.
 
         :param data: Dataset
         :param pull_corrector: pull_corrector
-        :return: LLH function that can be minimised
+        :return: Dictionary of cached values
         """
-        n_all = float(len(data))
+        kwargs = dict()
+        kwargs["n_all"] = float(len(data))
         SoB_spacetime = []
 
         assumed_bkg_mask = np.ones(len(data), dtype=np.bool)
@@ -410,17 +591,11 @@ class SpatialLLH(LLH):
                 del sig
                 del bkg
 
-        n_coincident = np.sum(~assumed_bkg_mask)
-
-        SoB_spacetime = np.array(SoB_spacetime)
-
-        def test_statistic(params, weights):
+        kwargs["n_coincident"] = np.sum(~assumed_bkg_mask)
 
-            return self.calculate_test_statistic(
-                params, weights, n_all=n_all, n_coincident=n_coincident,
-                SoB_spacetime=SoB_spacetime)
+        kwargs["SoB_spacetime"] = np.array(SoB_spacetime)
 
-        return test_statistic
+        return kwargs
 
     def calculate_test_statistic(self, params, weights, **kwargs):
         """Calculates the test statistic, given the parameters. Uses numexpr
@@ -460,6 +635,21 @@ class SpatialLLH(LLH):
         # Definition of test statistic
         return 2. * np.sum(llh_value)
 
+    def calculate_test_statistic_and_gradient(self, params, weights,
+                                              **kwargs):
+        """Calculates the test statistic, given the parameters, as well as
+        its analytic derivative with respect to the expected number of
+        signal events for each source. There is no dependence on gamma.
+
+        :param params: Parameters from Minimisation
+        :param weights: Normalised fraction of n_s allocated to each source
+        :return: 2 * llh value (Equal to Test Statistic), array of TS
+        derivatives for each n_j, TS derivative in gamma (always 0)
+        """
+        return self.calculate_fixed_SoB_test_statistic_and_gradient(
+            params, weights, kwargs["SoB_spacetime"], kwargs["n_coincident"],
+            kwargs["n_all"])
+
 
 @LLH.register_subclass('fixed_energy')
 class FixedEnergyLLH(LLH):
@@ -659,6 +849,21 @@ class FixedEnergyLLH(LLH):
         # Definition of test statistic
         return 2. * np.sum(llh_value)
 
+    def calculate_test_statistic_and_gradient(self, params, weights,
+                                              **kwargs):
+        """Calculates the test statistic, given the parameters, as well as
+        its analytic derivative with respect to the expected number of
+        signal events for each source. There is no dependence on gamma.
+
+        :param params: Parameters from Minimisation
+        :param weights: Normalised fraction of n_s allocated to each source
+        :return: 2 * llh value (Equal to Test Statistic), array of TS
+        derivatives for each n_j, TS derivative in gamma (always 0)
+        """
+        return self.calculate_fixed_SoB_test_statistic_and_gradient(
+            params, weights, kwargs["SoB"], kwargs["n_coincident"],
+            kwargs["n_all"])
+
 
 @LLH.register_subclass('standard')
 class StandardLLH(FixedEnergyLLH):
@@ -675,9 +880,34 @@ class StandardLLH(FixedEnergyLLH):
         # Sets precision for energy SoB
         self.precision = .1
 
-        self.SoB_spline_2Ds = load_spline(self.season)
+        # Sets the method used to evaluate the energy SoB. By default,
+        # each event is evaluated with the 2D spline of each gamma value.
+        # With "grid", the splines are instead tabulated on a single regular
+        # (gamma, sinDec, logE) grid, and values are found by interpolation.
+
+        try:
+            self.energy_SoB_backend = llh_dict["energy_SoB_backend"]
+        except KeyError:
+            self.energy_SoB_backend = "spline"
+
+        if self.energy_SoB_backend == "spline":
+            self.SoB_spline_2Ds = load_spline(self.season)
+            logging.debug("Loaded {0} splines.".format(
+                len(self.SoB_spline_2Ds)))
 
-        logging.debug("Loaded {0} splines.".format(len(self.SoB_spline_2Ds)))
+        elif self.energy_SoB_backend == "grid":
+            self.SoB_grid = load_SoB_grid(self.season)
+            logging.debug("Loaded grid with shape {0}.".format(
+                self.SoB_grid.log_SoB.shape))
+
+            # Upper bounds on the Log(Signal/Background) at each grid point,
+            # for each range of gamma
+            self.SoB_grid_upper_bounds = dict()
+
+        else:
+            raise ValueError("Energy SoB backend '{0}' not recognised. "
+                             "Please use 'spline' or 'grid'.".format(
+                                self.energy_SoB_backend))
 
         self.acceptance_f = self.create_acceptance_function()
         self.acceptance = self.new_acceptance
@@ -764,6 +994,9 @@ class StandardLLH(FixedEnergyLLH):
         with open(acc_path, "rb") as f:
             [dec_bins, gamma_bins, acc] = pickle.load(f)
 
+        # Saves the gamma bins, to differentiate the interpolation in gamma
+        self.acceptance_gamma_bins = np.sort(gamma_bins)
+
         f = scipy.interpolate.interp2d(
             dec_bins, gamma_bins, acc.T, kind='linear')
         return f
@@ -786,6 +1019,48 @@ class StandardLLH(FixedEnergyLLH):
 
         return self.acceptance_f(dec, gamma)
 
+    def source_acceptance(self, sources, params=None):
+        """Calculates the detector acceptance for all sources at once, with
+        a single evaluation of the 2D interpolation. The interpolation
+        returns values for sorted declinations, so these are mapped back
+        to the original order of the sources.
+
+        :param sources: Sources to be considered
+        :param params: Parameter array
+        :return: Array of acceptance values, one for each source
+        """
+        dec, inverse = np.unique(sources["dec_rad"], return_inverse=True)
+        gamma = params[-1]
+
+        return np.ravel(self.acceptance_f(dec, gamma))[inverse]
+
+    def source_acceptance_gradient(self, sources, params=None):
+        """Calculates the derivative of the detector acceptance of each
+        source with respect to gamma, by differentiating the 2D
+        interpolation of the acceptance. As the interpolation is linear in
+        gamma, the derivative is the slope between the two gamma bins either
+        side of gamma. Outside the gamma bins, the acceptance is constant.
+
+        :param sources: Sources to be considered
+        :param params: Parameter array
+        :return: Array of acceptance derivatives, one for each source
+        """
+        gamma_bins = self.acceptance_gamma_bins
+        gamma = params[-1]
+
+        if not (gamma_bins[0] <= gamma <= gamma_bins[-1]):
+            return np.zeros(len(sources))
+
+        i = np.clip(np.searchsorted(gamma_bins, gamma, side="right") - 1,
+                    0, len(gamma_bins) - 2)
+        lower, upper = gamma_bins[i], gamma_bins[i + 1]
+
+        dec, inverse = np.unique(sources["dec_rad"], return_inverse=True)
+
+        return np.ravel(
+            (self.acceptance_f(dec, upper) - self.acceptance_f(dec, lower)) /
+            (upper - lower))[inverse]
+
     def create_kwargs(self, data, pull_corrector, weight_f=None):
 
         kwargs = dict()
@@ -841,7 +1116,7 @@ class StandardLLH(FixedEnergyLLH):
                 SoB_energy_cache.append([])
 
         kwargs["n_coincident"] = np.sum(~assumed_background_mask)
-        kwargs["SoB_spacetime_cache"] = np.array(SoB_spacetime)
+        kwargs["SoB_spacetime_cache"] = SoB_spacetime
         kwargs["SoB_energy_cache"] = SoB_energy_cache
         # self.SoB_energy_cache = SoB_energy_cache
         kwargs["pull_corrector"] = pull_corrector
@@ -911,41 +1186,133 @@ class StandardLLH(FixedEnergyLLH):
         # Definition of test statistic
         return 2. * np.sum(llh_value)
 
+    def calculate_test_statistic_and_gradient(self, params, weights,
+                                              **kwargs):
+        """Calculates the test statistic, given the parameters, as well as
+        its analytic derivatives. The derivative with respect to gamma
+        follows from the quadratic Taylor expansion used to estimate the
+        energy and spatial Signal/Background ratios.
+
+        :param params: Parameters from Minimisation
+        :param weights: Normalised fraction of n_s allocated to each source
+        :return: 2 * llh value (Equal to Test Statistic), array of TS
+        derivatives for each n_j, TS derivative in gamma
+        """
+        n_s = np.array(params[:-1])
+        gamma = params[-1]
+
+        # Calculates the expected number of signal events for each source in
+        # the season
+        all_n_j = (n_s * weights.T[0])
+
+        x = []
+        n_j_grad = []
+        gamma_grad = 0.
+
+        for i, n_j in enumerate(all_n_j):
+
+            SoB_spacetime = kwargs["SoB_spacetime_cache"][i]
+
+            if len(SoB_spacetime) == 0:
+                x.append(np.array([1.]))
+                n_j_grad.append(0.)
+
+            else:
+
+                SoB_spacetime, log_SoB_grad = \
+                    kwargs["pull_corrector"].estimate_spatial(
+                        gamma, SoB_spacetime, return_gradient=True)
+
+                # Switches off Energy term for negative n_s, as in
+                # calculate_test_statistic
+
+                if n_j < 0:
+                    SoB = SoB_spacetime
+
+                else:
+                    SoB_energy, log_SoB_energy_grad = \
+                        self.estimate_energy_weights(
+                            gamma, kwargs["SoB_energy_cache"][i],
+                            return_gradient=True)
+
+                    SoB = SoB_energy * SoB_spacetime
+                    log_SoB_grad = log_SoB_grad + log_SoB_energy_grad
+
+                y = 1. + ((n_j / kwargs["n_all"]) * (SoB - 1.))
+                x.append(y)
+
+                n_j_grad.append(np.sum((SoB - 1.) / (kwargs["n_all"] * y)))
+                gamma_grad += np.sum(
+                    n_j * SoB * log_SoB_grad / (kwargs["n_all"] * y))
+
+        n_j_grad = np.array(n_j_grad)
+
+        if np.sum([np.sum(x_row <= 0.) for x_row in x]) > 0:
+            llh_value = -50. + all_n_j
+            n_j_grad = np.ones_like(all_n_j)
+            gamma_grad = 0.
+
+        else:
+
+            llh_value = np.sum([np.sum(np.log(y)) for y in x])
+
+            llh_value += np.sum(self.assume_background(
+                np.sum(all_n_j), kwargs["n_coincident"], kwargs["n_all"]))
+
+            n_j_grad += self.assume_background_gradient(
+                np.sum(all_n_j), kwargs["n_coincident"], kwargs["n_all"])
+
+            if np.logical_and(np.sum(all_n_j) < 0,
+                              np.sum(llh_value) < np.sum(-50. + all_n_j)):
+                llh_value = -50. + all_n_j
+                n_j_grad = np.ones_like(all_n_j)
+                gamma_grad = 0.
+
+        return 2. * np.sum(llh_value), 2. * n_j_grad, 2. * gamma_grad
+
 
 # ==============================================================================
 # Energy Log(Signal/Background) Ratio
 # ==============================================================================
 
     def create_SoB_energy_cache(self, cut_data):
-        """Evaluates the Log(Signal/Background) values for all coincident
-        data. For each value of gamma in self.gamma_support_points, calculates
-        the Log(Signal/Background) values for the coincident data. Then saves
-        each weight array to a dictionary.
+        """Creates a cache of the Log(Signal/Background) values for all
+        coincident data. For each gamma support point, the
+        Log(Signal/Background) values for the coincident data are
+        calculated the first time they are needed, and then saved in the
+        cache. Values are evaluated either from the 2D splines, or by
+        interpolation of the precomputed grid.
 
         :param cut_data: Subset of the data containing only coincident events
-        :return: Dictionary containing SoB values for each event for each
-        gamma value.
+        :return: Dictionary-like cache containing SoB values for each event
+        for each gamma value.
         """
+        log_e = np.array(cut_data["logE"])
+        sin_dec = np.array(cut_data["sinDec"])
 
-        energy_SoB_cache = dict()
+        if self.energy_SoB_backend == "grid":
+            return self.SoB_grid.create_cache(log_e, sin_dec)
 
-        for gamma in list(self.SoB_spline_2Ds.keys()):
-            energy_SoB_cache[gamma] = self.SoB_spline_2Ds[gamma].ev(
-                cut_data["logE"], cut_data["sinDec"])
+        def f(gamma):
+            return self.SoB_spline_2Ds[gamma].ev(log_e, sin_dec)
 
-        return energy_SoB_cache
+        return LazySupportPointCache(f, self.SoB_spline_2Ds.keys())
 
-    def estimate_energy_weights(self, gamma, energy_SoB_cache):
+    def estimate_energy_weights(self, gamma, energy_SoB_cache,
+                                return_gradient=False):
         """Quickly estimates the value of Signal/Background for Gamma.
         Uses pre-calculated values for first and second derivatives.
         Uses a Taylor series to estimate S(gamma), unless SoB has already
-        been calculated for a given gamma.
+        been calculated for a given gamma. If return_gradient is True,
+        the derivative of Log(S(gamma)) with respect to gamma is also
+        returned, as given by the same Taylor series.
 
         :param gamma: Spectral Index
         :param energy_SoB_cache: Weight cache
+        :param return_gradient: Boolean, whether to return the gradient
         :return: Estimated value for S(gamma)
         """
-        if gamma in list(energy_SoB_cache.keys()):
+        if gamma in energy_SoB_cache and not return_gradient:
             val = np.exp(energy_SoB_cache[gamma])
         else:
             g1 = self._around(gamma)
@@ -965,8 +1332,85 @@ class StandardLLH(FixedEnergyLLH):
                 " + (S2 -S0) / (2. * dg) * (gamma - g1) + S1)"
             )
 
+            if return_gradient:
+                grad = numexpr.evaluate(
+                    "(S0 - 2.*S1 + S2) / dg**2 * (gamma - g1)" + \
+                    " + (S2 -S0) / (2. * dg)"
+                )
+                return val, grad
+
         return val
 
+    def estimate_log_energy_weights_upper_bound(self, energy_SoB_cache,
+                                                gamma_min, gamma_max):
+        """Finds an upper bound on the energy Log(Signal/Background) of
+        each entry of a cache, for any gamma between gamma_min and
+        gamma_max. Every value returned by estimate_energy_weights is either
+        a cached value at a support point, or a Taylor series around a node
+        g1 evaluated at most precision/2 away from g1. For the latter, the
+        quadratic is bounded by S1 + |S2 - S0|/4 + max(0, S0 - 2 S1 + S2)/8.
+        Every support point in the range is evaluated.
+
+        :param energy_SoB_cache: Weight cache
+        :param gamma_min: Minimum value of gamma
+        :param gamma_max: Maximum value of gamma
+        :return: Upper bound on Log(S(gamma)) for each entry
+        """
+        dg = self.precision
+
+        support_points = [x for x in energy_SoB_cache
+                          if gamma_min <= x <= gamma_max]
+
+        log_bound = np.max([energy_SoB_cache[x] for x in support_points],
+                           axis=0)
+
+        n_nodes = int(np.around((self._around(gamma_max) -
+                                 self._around(gamma_min)) / dg))
+
+        for i in range(n_nodes + 1):
+            g1 = self._around(self._around(gamma_min) + i * dg)
+            g0 = self._around(g1 - dg)
+            g2 = self._around(g1 + dg)
+
+            S0 = energy_SoB_cache[g0]
+            S1 = energy_SoB_cache[g1]
+            S2 = energy_SoB_cache[g2]
+
+            log_bound = np.maximum(
+                log_bound, S1 + np.fabs(S2 - S0) / 4. +
+                np.maximum(S0 - 2. * S1 + S2, 0.) / 8.)
+
+        return log_bound
+
+    def estimate_energy_weights_upper_bound(self, cut_data, gamma_min,
+                                            gamma_max):
+        """Finds an upper bound on the energy Signal/Background ratio of
+        each event, for any gamma between gamma_min and gamma_max. With the
+        grid backend, the bound is found once for each point of the grid,
+        and then interpolated to the events, so that the energy cache of
+        the events is still only evaluated when needed. With the spline
+        backend, this would require evaluating every support point for
+        every event, so no bound is given.
+
+        :param cut_data: Subset of the data containing only coincident events
+        :param gamma_min: Minimum value of gamma
+        :param gamma_max: Maximum value of gamma
+        :return: Upper bound on S(gamma) for each event, or None
+        """
+        if self.energy_SoB_backend != "grid":
+            return None
+
+        key = (gamma_min, gamma_max)
+
+        if key not in self.SoB_grid_upper_bounds:
+            self.SoB_grid_upper_bounds[key] = \
+                self.estimate_log_energy_weights_upper_bound(
+                    self.SoB_grid.create_node_cache(), gamma_min, gamma_max)
+
+        return np.exp(self.SoB_grid.interpolate(
+            self.SoB_grid_upper_bounds[key], np.array(cut_data["logE"]),
+            np.array(cut_data["sinDec"])))
+
     @staticmethod
     def return_llh_parameters(llh_dict):
         e_pdf = EnergyPDF.create(llh_dict["llh_energy_pdf"])
@@ -1095,6 +1539,54 @@ class StandardOverlappingLLH(StandardLLH):
         # Definition of test statistic
         return 2. * np.sum(llh_value)
 
+    def calculate_test_statistic_and_gradient(self, params, weights,
+                                              **kwargs):
+        """Calculates the test statistic, given the parameters, as well as
+        its analytic derivatives. As all sources contribute to one joint
+        Signal/Background ratio, the derivative with respect to n_j is
+        identical for every source.
+
+        :param params: Parameters from Minimisation
+        :param weights: Normalised fraction of n_s allocated to each source
+        :return: 2 * llh value (Equal to Test Statistic), array of TS
+        derivatives for each n_j, TS derivative in gamma
+        """
+        n_s = np.array(params[:-1])
+        gamma = params[-1]
+
+        SoB_spacetime, log_SoB_grad = kwargs["pull_corrector"].estimate_spatial(
+                gamma, kwargs["SoB_spacetime_cache"], return_gradient=True)
+
+        # Calculates the expected number of signal events for each source in
+        # the season
+        n_j = (n_s * np.sum(weights))
+
+        # Switches off Energy term for negative n_s, as in
+        # calculate_test_statistic
+        if n_j < 0.:
+            SoB = SoB_spacetime
+        else:
+            SoB_energy, log_SoB_energy_grad = self.estimate_energy_weights(
+                gamma, kwargs["SoB_energy_cache"], return_gradient=True)
+            SoB = SoB_energy * SoB_spacetime
+            log_SoB_grad = log_SoB_grad + log_SoB_energy_grad
+
+        x = (1. + ((n_j / kwargs["n_all"]) * (SoB - 1.)))
+
+        llh_value = np.sum(np.log(x))
+
+        llh_value += self.assume_background(
+            n_j, kwargs["n_coincident"], kwargs["n_all"])
+
+        n_j_grad = np.sum((SoB - 1.) / (kwargs["n_all"] * x)) + np.sum(
+            self.assume_background_gradient(
+                n_j, kwargs["n_coincident"], kwargs["n_all"]))
+
+        gamma_grad = np.sum(n_j * SoB * log_SoB_grad / (kwargs["n_all"] * x))
+
+        return 2. * np.sum(llh_value), \
+            2. * n_j_grad * np.ones(len(weights)), 2. * gamma_grad
+
 
 @LLH.register_subclass('standard_matrix')
 class StandardMatrixLLH(StandardOverlappingLLH):
@@ -1183,6 +1675,257 @@ class StandardMatrixLLH(StandardOverlappingLLH):
         return kwargs
 
 
+@LLH.register_subclass('standard_packed')
+class StandardPackedLLH(StandardLLH):
+    """Equivalent to the StandardLLH, but optimised for large numbers of
+    sources. Rather than storing separate caches for each source,
+    the coincident events of all sources are concatenated into contiguous
+    arrays, with an index of offsets marking where the events of each source
+    begin (as in a CSR sparse matrix). The test statistic can then be
+    evaluated with vectorised operations, without looping over sources.
+    The energy Signal/Background ratio is only evaluated once for each
+    coincident event, even if the event is coincident with several sources.
+    """
+
+    def create_kwargs(self, data, pull_corrector, weight_f=None):
+
+        kwargs = dict()
+
+        kwargs["n_all"] = float(len(data))
+
+        source_index = []
+        event_index = []
+        spatial_caches = []
+
+        assumed_background_mask = np.ones(len(data), dtype=np.bool)
+
+        for i, source in enumerate(self.sources):
+
+            s_mask = self.select_spatially_coincident_data(data, [source])
+
+            coincident_data = data[s_mask]
+
+            if len(coincident_data) > 0:
+                # Only bother accepting neutrinos where the spatial
+                # likelihood is greater than 1e-21. This prevents 0s
+                # appearing in dynamic pull corrections, but also speeds
+                # things up (those neutrinos won't contribute anything to the
+                # likelihood!)
+
+                sig = self.signal_pdf(source, coincident_data)
+                nonzero_mask = (sig > spatial_mask_threshold)
+
+                s_mask[s_mask] *= nonzero_mask
+
+                if np.sum(s_mask) > 0:
+
+                    assumed_background_mask *= ~s_mask
+                    coincident_data = data[s_mask]
+
+                    SoB_pdf = lambda x: self.signal_pdf(source, x) / \
+                                        self.background_pdf(source, x)
+
+                    spatial_caches.append(pull_corrector.create_spatial_cache(
+                        coincident_data, SoB_pdf
+                    ))
+
+                    source_index.append(i)
+                    event_index.append(np.nonzero(s_mask)[0])
+
+        coincident_mask = ~assumed_background_mask
+
+        # Maps the index of each event in the dataset onto its index in the
+        # subset of coincident events
+
+        coincident_index = np.cumsum(coincident_mask) - 1
+
+        n_events = np.array([len(x) for x in event_index], dtype=np.int)
+
+        if len(event_index) > 0:
+            event_index = coincident_index[np.concatenate(event_index)]
+        else:
+            event_index = np.array([], dtype=np.int)
+
+        # Concatenates the spatial caches of all sources. If the cache
+        # depends on gamma, the arrays for each gamma value are concatenated.
+
+        if len(spatial_caches) > 0 and isinstance(
+                spatial_caches[0], LazySupportPointCache):
+            SoB_spacetime = LazySupportPointCache(
+                lambda key: np.concatenate([x[key] for x in spatial_caches]),
+                spatial_caches[0].keys())
+        elif len(spatial_caches) > 0 and isinstance(spatial_caches[0], dict):
+            SoB_spacetime = dict()
+            for key in spatial_caches[0].keys():
+                SoB_spacetime[key] = np.concatenate(
+                    [x[key] for x in spatial_caches])
+        elif len(spatial_caches) > 0:
+            SoB_spacetime = np.concatenate(spatial_caches)
+        else:
+            SoB_spacetime = np.array([])
+
+        kwargs["n_coincident"] = np.sum(coincident_mask)
+        kwargs["SoB_spacetime_cache"] = SoB_spacetime
+        kwargs["SoB_energy_cache"] = self.create_SoB_energy_cache(
+            data[coincident_mask])
+        kwargs["event_index"] = event_index
+        kwargs["source_index"] = np.array(source_index, dtype=np.int)
+        kwargs["source_offsets"] = np.cumsum(n_events) - n_events
+        kwargs["event_source_index"] = np.repeat(
+            kwargs["source_index"], n_events)
+        kwargs["pull_corrector"] = pull_corrector
+
+        return kwargs
+
+    def estimate_packed_SoB(self, gamma, n_j, kwargs, return_gradient=False):
+        """Estimates the Signal/Background ratio for every entry of the
+        packed cache. As in the StandardLLH, the energy term is switched
+        off for sources with negative n_j.
+
+        :param gamma: Spectral Index
+        :param n_j: Expected number of signal events for the source of
+        each entry in the packed cache
+        :param kwargs: Packed cache
+        :param return_gradient: Boolean, whether to return the derivative of
+        Log(SoB) with respect to gamma
+        :return: Signal/Background ratio (and gradient) for each entry
+        """
+        # Without coincident events, the cache is empty and only the
+        # background term contributes to the likelihood
+
+        if kwargs["n_coincident"] == 0:
+            if return_gradient:
+                return np.zeros(0), np.zeros(0)
+            return np.zeros(0)
+
+        SoB_spacetime = kwargs["pull_corrector"].estimate_spatial(
+            gamma, kwargs["SoB_spacetime_cache"], return_gradient)
+
+        if return_gradient:
+            SoB_spacetime, log_SoB_grad = SoB_spacetime
+
+        positive_mask = n_j >= 0
+
+        if np.sum(positive_mask) > 0:
+
+            SoB_energy = self.estimate_energy_weights(
+                gamma, kwargs["SoB_energy_cache"], return_gradient)
+
+            if return_gradient:
+                SoB_energy, log_SoB_energy_grad = SoB_energy
+                log_SoB_grad = log_SoB_grad + np.where(
+                    positive_mask,
+                    log_SoB_energy_grad[kwargs["event_index"]], 0.)
+
+            SoB = np.where(positive_mask,
+                           SoB_energy[kwargs["event_index"]] * SoB_spacetime,
+                           SoB_spacetime)
+
+        else:
+            SoB = SoB_spacetime * np.ones_like(n_j)
+
+        if return_gradient:
+            return SoB, log_SoB_grad
+
+        return SoB
+
+    def calculate_test_statistic(self, params, weights, **kwargs):
+        """Calculates the test statistic, given the parameters. All
+        sources are evaluated simultaneously, using the packed cache.
+
+        :param params: Parameters from Minimisation
+        :param weights: Normalised fraction of n_s allocated to each source
+        :return: 2 * llh value (Equal to Test Statistic)
+        """
+        n_s = np.array(params[:-1])
+        gamma = params[-1]
+
+        # Calculates the expected number of signal events for each source in
+        # the season, and the corresponding value for each cache entry
+
+        all_n_j = (n_s * weights.T[0])
+        n_j = all_n_j[kwargs["event_source_index"]]
+
+        SoB = self.estimate_packed_SoB(gamma, n_j, kwargs)
+
+        x = 1. + ((n_j / kwargs["n_all"]) * (SoB - 1.))
+
+        if np.sum(x <= 0.) > 0:
+            llh_value = -50. + all_n_j
+
+        else:
+
+            llh_value = np.sum(np.log(x))
+
+            llh_value += np.sum(self.assume_background(
+                np.sum(all_n_j), kwargs["n_coincident"], kwargs["n_all"]))
+
+            if np.logical_and(np.sum(all_n_j) < 0,
+                              np.sum(llh_value) < np.sum(-50. + all_n_j)):
+                llh_value = -50. + all_n_j
+
+        # Definition of test statistic
+        return 2. * np.sum(llh_value)
+
+    def calculate_test_statistic_and_gradient(self, params, weights,
+                                              **kwargs):
+        """Calculates the test statistic, given the parameters, as well as
+        its analytic derivatives. The derivatives for each source are
+        found with segment sums over the packed cache.
+
+        :param params: Parameters from Minimisation
+        :param weights: Normalised fraction of n_s allocated to each source
+        :return: 2 * llh value (Equal to Test Statistic), array of TS
+        derivatives for each n_j, TS derivative in gamma
+        """
+        n_s = np.array(params[:-1])
+        gamma = params[-1]
+
+        all_n_j = (n_s * weights.T[0])
+        n_j = all_n_j[kwargs["event_source_index"]]
+
+        SoB, log_SoB_grad = self.estimate_packed_SoB(
+            gamma, n_j, kwargs, return_gradient=True)
+
+        x = 1. + ((n_j / kwargs["n_all"]) * (SoB - 1.))
+
+        n_j_grad = np.zeros_like(all_n_j)
+
+        if np.sum(x <= 0.) > 0:
+            llh_value = -50. + all_n_j
+            n_j_grad += 1.
+            gamma_grad = 0.
+
+        else:
+
+            llh_value = np.sum(np.log(x))
+
+            llh_value += np.sum(self.assume_background(
+                np.sum(all_n_j), kwargs["n_coincident"], kwargs["n_all"]))
+
+            # Sums the contribution of each event to the derivative of its
+            # source, using the offsets of the packed cache
+
+            if len(kwargs["source_index"]) > 0:
+                n_j_grad[kwargs["source_index"]] = np.add.reduceat(
+                    (SoB - 1.) / (kwargs["n_all"] * x),
+                    kwargs["source_offsets"])
+
+            n_j_grad += self.assume_background_gradient(
+                np.sum(all_n_j), kwargs["n_coincident"], kwargs["n_all"])
+
+            gamma_grad = np.sum(
+                n_j * SoB * log_SoB_grad / (kwargs["n_all"] * x))
+
+            if np.logical_and(np.sum(all_n_j) < 0,
+                              np.sum(llh_value) < np.sum(-50. + all_n_j)):
+                llh_value = -50. + all_n_j
+                n_j_grad = np.ones_like(all_n_j)
+                gamma_grad = 0.
+
+        return 2. * np.sum(llh_value), 2. * n_j_grad, 2. * gamma_grad
+
+
 def generate_dynamic_flare_class(season, sources, llh_dict):
 
     try:
@@ -1243,6 +1986,14 @@ def generate_dynamic_flare_class(season, sources, llh_dict):
             """
             return 0.
 
+        @staticmethod
+        def assume_background_gradient(n_s, n_coincident, n_all):
+            """Derivative of the (zero) assume_background contribution.
+
+            :return: 0.
+            """
+            return 0.
+
         def signal_pdf(self, source, cut_data):
             """Calculates the value of the signal spatial PDF for a given source
             for each event in the coincident data subsample. If there is a Time PDF
@@ -1311,6 +2062,45 @@ def generate_dynamic_flare_class(season, sources, llh_dict):
             SoB = SoB_space * SoB_energy
             return SoB
 
+        def estimate_significance_upper_bound(self, coincident_data, source,
+                                              pull_corrector, gamma_bounds):
+            """Finds an upper bound on the Signal/Background ratio of each
+            event in the coincident dataset, valid for any value of the fit
+            parameters. This is used to skip flare windows which cannot
+            improve on the best fit. If the spatial term depends on gamma
+            (i.e a dynamic pull correction is used), or the energy term
+            cannot be bounded cheaply (see
+            estimate_energy_weights_upper_bound), no bound is given.
+
+            :param coincident_data: Data overlapping the source
+            :param source: Source to be considered
+            :param pull_corrector: Angular error modifier of the season
+            :param gamma_bounds: Bounds on gamma in the fit (only used if
+            gamma is fit)
+            :return: Upper bound on SoB of events in coincident dataset,
+            or None
+            """
+            SoB_pdf = lambda x: self.signal_pdf(source, x) / \
+                                self.background_pdf(source, x)
+
+            if not self.fit_energy:
+                return SoB_pdf(coincident_data) * \
+                       self.energy_weight_f(coincident_data)
+
+            SoB_energy_bound = self.estimate_energy_weights_upper_bound(
+                coincident_data, gamma_bounds[0], gamma_bounds[1])
+
+            if SoB_energy_bound is None:
+                return None
+
+            spatial_cache = pull_corrector.create_spatial_cache(
+                coincident_data, SoB_pdf)
+
+            if isinstance(spatial_cache, (dict, LazySupportPointCache)):
+                return None
+
+            return spatial_cache * SoB_energy_bound
+
         def find_significant_events(self, coincident_data, source):
             """Finds events in the coincident dataset (spatially and temporally
             overlapping sources), which are significant. This is defined as having a
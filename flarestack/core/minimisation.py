@@ -10,16 +10,23 @@ import scipy.optimize
 from flarestack.core.injector import read_injector_dict
 from flarestack.core.llh import LLH, generate_dynamic_flare_class, read_llh_dict
 from flarestack.shared import name_pickle_output_dir, \
-    inj_dir_name, plot_output_dir, scale_shortener, flux_to_k
+    inj_dir_name, plot_output_dir, scale_shortener, flux_to_k, \
+    save_trial_results
 import matplotlib.pyplot as plt
 import matplotlib.cm as cm
 import matplotlib as mpl
-from flarestack.core.time_pdf import TimePDF, Box, Steady
+from flarestack.core.time_pdf import Box, Steady
 from flarestack.core.angular_error_modifier import BaseAngularErrorModifier
 from flarestack.utils.catalogue_loader import load_catalogue, \
     calculate_source_weight
 from flarestack.utils.asimov_estimator import estimate_discovery_potential
 
+# Precision with which gamma is rounded when caching source acceptances, and
+# the maximum number of cached values
+
+acceptance_gamma_decimals = 10
+max_acceptance_cache_size = 10000
+
 
 def time_smear(inj):
     inj_time = inj["injection_sig_time_pdf"]
@@ -222,7 +229,12 @@ class MinimisationHandler(object):
         scale = mh_dict["scale"]
         steps = int(mh_dict["n_steps"])
 
-        if "fixed_scale" in list(mh_dict.keys()):
+        # An explicit list of scales can be given, with n_trials trials
+        # run at each entry of the list
+
+        if "scale_range" in list(mh_dict.keys()):
+            scale_range = list(mh_dict["scale_range"])
+        elif "fixed_scale" in list(mh_dict.keys()):
             scale_range = [mh_dict["fixed_scale"]]
         else:
             scale_range = np.array(
@@ -313,7 +325,8 @@ class FixedWeightMinimisationHandler(MinimisationHandler):
     """
 
     compatible_llh = ["spatial", "fixed_energy", "standard",
-                      "standard_overlapping", "standard_matrix"]
+                      "standard_overlapping", "standard_matrix",
+                      "standard_packed"]
     compatible_negative_n_s = True
 
     def __init__(self, mh_dict):
@@ -329,6 +342,21 @@ class FixedWeightMinimisationHandler(MinimisationHandler):
         except KeyError:
             self.brute = False
 
+        # Checks if the minimiser should use the analytic gradient of the
+        # test statistic, rather than estimating it numerically
+
+        try:
+            self.analytic_gradient = self.llh_dict["analytic_gradient_bool"]
+        except KeyError:
+            self.analytic_gradient = False
+
+        # Cache for the parameter-independent weights of each source,
+        # for each season, and for the source acceptances (which depend at
+        # most on gamma)
+
+        self.season_weight_cache = dict()
+        self.acceptance_cache = dict()
+
         # self.clean_true_param_values()
 
     def clear(self):
@@ -339,9 +367,9 @@ class FixedWeightMinimisationHandler(MinimisationHandler):
         del self
 
     def dump_results(self, results, scale, seed):
-        """Takes the results of a set of trials, and saves the dictionary as
-        a pickle pkl_file. The flux scale is used as a parent directory, and the
-        pickle pkl_file itself is saved with a name equal to its random seed.
+        """Takes the results of a set of trials, and saves them as a columnar
+        .npz file. The flux scale is used as a parent directory, and the
+        file itself is saved with a name equal to its random seed.
 
         :param results: Dictionary of Minimisation results from trials
         :param scale: Scale of inputted flux
@@ -363,12 +391,11 @@ class FixedWeightMinimisationHandler(MinimisationHandler):
             except OSError:
                 pass
 
-            file_name = os.path.join(write_dir, str(seed) + ".pkl")
+            file_name = os.path.join(write_dir, str(seed) + ".npz")
 
             logging.info("Saving to {0}".format(file_name))
 
-            with open(file_name, "wb") as f:
-                Pickle.dump(results, f)
+            save_trial_results(results, file_name)
 
     def dump_injection_values(self, scale):
 
@@ -401,6 +428,21 @@ class FixedWeightMinimisationHandler(MinimisationHandler):
         def llh_f(scale):
             return -np.sum(raw_f(scale))
 
+        # If analytic gradients are used, the minimiser is passed a
+        # function returning both the value and gradient (jac=True)
+
+        if self.analytic_gradient:
+
+            def llh_f_jac(scale):
+                ts, grad = raw_f(scale, return_gradient=True)
+                return -ts, -grad
+
+            jac = True
+
+        else:
+            llh_f_jac = llh_f
+            jac = None
+
         if self.brute:
 
             brute_range = [
@@ -412,7 +454,7 @@ class FixedWeightMinimisationHandler(MinimisationHandler):
             start_seed = self.p0
 
         res = scipy.optimize.minimize(
-            llh_f, start_seed, bounds=self.bounds)
+            llh_f_jac, start_seed, bounds=self.bounds, jac=jac)
 
         vals = res.x
         flag = res.status
@@ -431,7 +473,7 @@ class FixedWeightMinimisationHandler(MinimisationHandler):
             start_seed[0] = -1.
 
             new_res = scipy.optimize.minimize(
-                llh_f, start_seed, bounds=bounds)
+                llh_f_jac, start_seed, bounds=bounds, jac=jac)
 
             if new_res.status == 0:
                 res = new_res
@@ -459,7 +501,11 @@ class FixedWeightMinimisationHandler(MinimisationHandler):
 
         return res_dict
 
-    def run_single(self, full_dataset, scale, seed):
+    def simulate_and_run(self, scale, seed=None):
+        if seed is None:
+            seed = np.random.randint(low=0, high=99999999)
+        self.set_random_seed(seed)
+        full_dataset = self.prepare_dataset(scale, seed)
 
         param_vals = {}
         for key in self.param_names:
@@ -488,13 +534,6 @@ class FixedWeightMinimisationHandler(MinimisationHandler):
         self.dump_results(results, scale, seed)
         return res_dict
 
-    def simulate_and_run(self, scale, seed=None):
-        if seed is None:
-            seed = np.random.randint(low=0, high=99999999)
-        self.set_random_seed(seed)
-        full_dataset = self.prepare_dataset(scale, seed)
-        return self.run_single(full_dataset, scale, seed)
-
     def run(self, n_trials, scale=1., seed=None):
 
         if seed is None:
@@ -550,35 +589,129 @@ class FixedWeightMinimisationHandler(MinimisationHandler):
 
         self.dump_injection_values(scale)
 
-    def make_season_weight(self, params, season):
+    def run_batch(self, n_trials, scale=1., seed=None):
+        """Runs a set of trials, and returns the results as arrays with one
+        entry per trial. This is a columnar wrapper around run: each dataset
+        is simulated from its own seed, drawn in the same way as for each
+        trial of run, so the results are identical to those of run with the
+        same seed. Unlike run, the results are not saved.
+
+        :param n_trials: Number of trials to run
+        :param scale: Ratio of Injected Flux to source flux
+        :param seed: Random seed used for the full set of trials
+        :return: Dictionary of results arrays
+        """
+
+        if seed is None:
+            seed = int(random.random() * 10 ** 8)
+        np.random.seed(seed)
 
-        src = self.sources
+        n_trials = int(n_trials)
 
-        weight_scale = calculate_source_weight(src)
+        param_vals = dict()
+        for key in self.param_names:
+            param_vals[key] = np.full(n_trials, np.nan)
+        ts_vals = np.zeros(n_trials)
+        flags = np.zeros(n_trials, dtype=np.int)
 
-        # dist_weight = src["distance_mpc"] ** -2
-        # base_weight = src["base_weight"]
+        logging.info("Generating {0} trials!".format(n_trials))
+
+        for i in range(n_trials):
+
+            trial_seed = np.random.randint(low=0, high=99999999)
+            full_dataset = self.prepare_dataset(scale, trial_seed)
+            res_dict = self.run_trial(full_dataset)
+
+            for (key, val) in res_dict["Parameters"].items():
+                param_vals[key][i] = val
+
+            ts_vals[i] = res_dict["TS"]
+            flags[i] = res_dict["Flag"]
+
+        results = {
+            "TS": ts_vals,
+            "Parameters": param_vals,
+            "Flags": flags,
+        }
+
+        return results
+
+    def get_constant_season_weight(self, season):
+        """Returns, for each source, the product of the time weight and the
+        intrinsic source weight for a given season. Neither depends on the
+        fit parameters, so these are only calculated once per season.
+
+        :param season: Season to be considered
+        :return: Array of weights
+        """
+
+        name = season.season_name
+
+        if name not in self.season_weight_cache:
+
+            src = self.sources
+
+            weight_scale = calculate_source_weight(src)
+
+            llh = self.get_likelihood(name)
+
+            time_weights = []
+            source_weights = []
+
+            for source in src:
+                time_weights.append(
+                    llh.sig_time_pdf.effective_injection_time(source))
+                source_weights.append(calculate_source_weight(source) /
+                                      weight_scale)
+
+            self.season_weight_cache[name] = \
+                np.array(time_weights) * np.array(source_weights)
+
+        return self.season_weight_cache[name]
+
+    def get_source_acceptance(self, params, season):
+        """Returns the acceptance of each source for a given season. The
+        acceptance depends at most on gamma (the last parameter), which is
+        rounded to acceptance_gamma_decimals decimal places. The values are
+        then saved, and reused whenever the same gamma value is requested.
+
+        :param params: Parameter array
+        :param season: Season to be considered
+        :return: Array of acceptance values
+        """
 
         llh = self.get_likelihood(season.season_name)
-        acc = []
 
-        time_weights = []
-        source_weights = []
+        if llh.fit_energy:
+            gamma = np.around(float(params[-1]),
+                              decimals=acceptance_gamma_decimals)
+            params = list(params[:-1]) + [gamma]
+        else:
+            gamma = None
+
+        key = (season.season_name, gamma)
+
+        try:
+            return self.acceptance_cache[key]
+        except KeyError:
+            pass
+
+        if len(self.acceptance_cache) > max_acceptance_cache_size:
+            self.acceptance_cache.clear()
+
+        acc = llh.source_acceptance(self.sources, params)
+        self.acceptance_cache[key] = acc
 
-        for source in src:
-            time_weights.append(llh.sig_time_pdf.effective_injection_time(
-                source))
-            acc.append(llh.acceptance(source, params))
-            source_weights.append(calculate_source_weight(source) /
-                                  weight_scale)
+        return acc
 
-        time_weights = np.array(time_weights)
-        source_weights = np.array(source_weights)
+    def make_season_weight(self, params, season):
+
+        # dist_weight = src["distance_mpc"] ** -2
+        # base_weight = src["base_weight"]
 
-        acc = np.array(acc).T[0]
+        acc = self.get_source_acceptance(params, season)
 
-        w = acc * time_weights
-        w *= source_weights
+        w = acc * self.get_constant_season_weight(season)
 
         w = w[:, np.newaxis]
 
@@ -592,15 +725,56 @@ class FixedWeightMinimisationHandler(MinimisationHandler):
         # for the ith season for the jth source is given by:
         #  n_exp = n_s * weight_matrix[i][j]
 
-        weights_matrix = np.ones([len(self.seasons), len(self.sources)])
+        weights_matrix = np.array([
+            self.get_source_acceptance(params, season) *
+            self.get_constant_season_weight(season)
+            for season in self.seasons.values()
+        ])
 
-        for i, season in enumerate(self.seasons.values()):
-            w = self.make_season_weight(params, season)
+        return weights_matrix
 
-            for j, ind_w in enumerate(w):
-                weights_matrix[i][j] = ind_w
+    @staticmethod
+    def normalise_weight_matrix(weights_matrix):
+        """Normalises the weight matrix, so that the sum over all
+        Source+Season pairs is equal to 1.
 
-        return weights_matrix
+        :param weights_matrix: Weight matrix
+        :return: Normalised weight matrix
+        """
+        return weights_matrix / np.sum(weights_matrix)
+
+    @staticmethod
+    def normalise_weight_matrix_gradient(weights_matrix, weights_grad):
+        """Differentiates the normalised weight matrix, given the weight
+        matrix and its derivative before normalisation.
+
+        :param weights_matrix: Weight matrix
+        :param weights_grad: Derivative of weight matrix
+        :return: Derivative of normalised weight matrix
+        """
+        return (weights_grad - weights_matrix * np.sum(weights_grad) /
+                np.sum(weights_matrix)) / np.sum(weights_matrix)
+
+    def make_weight_matrix_gradient(self, params):
+        """Calculates the derivative of the normalised weight matrix with
+        respect to gamma (the last parameter). The weight matrix only
+        depends on gamma through the acceptance, which is differentiated
+        analytically.
+
+        :param params: Parameter array
+        :return: Derivative of normalised weight matrix
+        """
+        weights_matrix = self.make_weight_matrix(params)
+
+        weights_grad = np.array([
+            self.get_likelihood(name).source_acceptance_gradient(
+                self.sources, params) *
+            self.get_constant_season_weight(season)
+            for (name, season) in self.seasons.items()
+        ])
+
+        return self.normalise_weight_matrix_gradient(
+            weights_matrix, weights_grad)
 
     def prepare_dataset(self, scale=1., seed=None):
 
@@ -631,7 +805,9 @@ class FixedWeightMinimisationHandler(MinimisationHandler):
             llh_functions[name] = llh_f
             n_all[name] = len(dataset)
 
-        def f_final(raw_params):
+        fit_gamma = self.get_likelihood(list(self.seasons)[0]).fit_energy
+
+        def f_final(raw_params, return_gradient=False):
 
             # If n_s is less than or equal to 0, set gamma to be 3.7 (equal to
             # atmospheric background). This is continuous at n_s=0, but fixes
@@ -645,17 +821,46 @@ class FixedWeightMinimisationHandler(MinimisationHandler):
             # Calculate relative contribution of each source/season
 
             weights_matrix = self.make_weight_matrix(params)
-            weights_matrix /= np.sum(weights_matrix)
+            weights_matrix = self.normalise_weight_matrix(weights_matrix)
 
             # Having created the weight matrix, loops over each season of
             # data and evaluates the TS function for that season
 
             ts_val = 0
+
+            if not return_gradient:
+                for i, name in enumerate(self.seasons):
+                    w = weights_matrix[i][:, np.newaxis]
+                    ts_val += np.sum(llh_functions[name](params, w))
+
+                return ts_val
+
+            # For negative n_s, gamma is fixed, so the TS has no dependence
+            # on the fitted value of gamma
+
+            vary_gamma = fit_gamma and (params[0] >= 0)
+
+            grad = np.zeros(len(params))
+
+            if vary_gamma:
+                weights_grad = self.make_weight_matrix_gradient(params)
+
             for i, name in enumerate(self.seasons):
                 w = weights_matrix[i][:, np.newaxis]
-                ts_val += np.sum(llh_functions[name](params, w))
+                ts, n_j_grad, gamma_grad = llh_functions[name](
+                    params, w, return_gradient=True)
+
+                ts_val += ts
+
+                # Chain rule, with n_j = n_s * w_j
+
+                grad[0] += np.sum(n_j_grad * weights_matrix[i])
+
+                if vary_gamma:
+                    grad[-1] += gamma_grad + params[0] * np.sum(
+                        n_j_grad * weights_grad[i])
 
-            return ts_val
+            return ts_val, grad
 
         return f_final
 
@@ -982,7 +1187,7 @@ class LargeCatalogueMinimisationHandler(FixedWeightMinimisationHandler):
     but much less burdensome for memory.
     """
 
-    compatible_llh = ["standard_matrix"]
+    compatible_llh = ["standard_matrix", "standard_packed"]
     compatible_negative_n_s = False
 
     def __init__(self, mh_dict):
@@ -1006,7 +1211,8 @@ class LargeCatalogueMinimisationHandler(FixedWeightMinimisationHandler):
 
 @MinimisationHandler.register_subclass('fit_weights')
 class FitWeightMinimisationHandler(FixedWeightMinimisationHandler):
-    compatible_llh = ["spatial", "fixed_energy", "standard"]
+    compatible_llh = ["spatial", "fixed_energy", "standard",
+                      "standard_packed"]
     compatible_negative_n_s = False
 
     def __init__(self, mh_dict):
@@ -1030,7 +1236,10 @@ class FitWeightMinimisationHandler(FixedWeightMinimisationHandler):
             llh_functions[name] = llh_f
             n_all[name] = len(dataset)
 
-        def f_final(params):
+        fit_gamma = self.get_likelihood(list(self.seasons)[0]).fit_energy
+        n_sources = len(self.sources)
+
+        def f_final(params, return_gradient=False):
 
             # Creates a matrix fixing the fraction of the total signal that
             # is expected in each Source+Season pair. The matrix is
@@ -1039,23 +1248,81 @@ class FitWeightMinimisationHandler(FixedWeightMinimisationHandler):
             #  n_exp = n_s * weight_matrix[i][j]
 
             weights_matrix = self.make_weight_matrix(params)
-
-            for i, row in enumerate(weights_matrix.T):
-                if np.sum(row) > 0:
-                    row /= np.sum(row)
+            weights_matrix = self.normalise_weight_matrix(weights_matrix)
 
             # Having created the weight matrix, loops over each season of
             # data and evaluates the TS function for that season
 
             ts_val = 0
+
+            if not return_gradient:
+                for i, name in enumerate(self.seasons):
+                    w = weights_matrix[i][:, np.newaxis]
+                    ts_val += llh_functions[name](params, w)
+
+                return ts_val
+
+            grad = np.zeros(len(params))
+            n_s = np.array(params[:n_sources])
+
+            if fit_gamma:
+                weights_grad = self.make_weight_matrix_gradient(params)
+
             for i, name in enumerate(self.seasons):
                 w = weights_matrix[i][:, np.newaxis]
-                ts_val += llh_functions[name](params, w)
+                ts, n_j_grad, gamma_grad = llh_functions[name](
+                    params, w, return_gradient=True)
+
+                ts_val += ts
 
-            return ts_val
+                # Chain rule, with n_j = n_s_j * w_j
+
+                grad[:n_sources] += n_j_grad * weights_matrix[i]
+
+                if fit_gamma:
+                    grad[-1] += gamma_grad + np.sum(
+                        n_j_grad * n_s * weights_grad[i])
+
+            return ts_val, grad
 
         return f_final
 
+    @staticmethod
+    def normalise_weight_matrix(weights_matrix):
+        """Normalises the weight matrix, so that the weights of each source
+        sum to 1 over all seasons.
+
+        :param weights_matrix: Weight matrix
+        :return: Normalised weight matrix
+        """
+        weights_matrix = np.array(weights_matrix)
+
+        for i, row in enumerate(weights_matrix.T):
+            if np.sum(row) > 0:
+                row /= np.sum(row)
+
+        return weights_matrix
+
+    @staticmethod
+    def normalise_weight_matrix_gradient(weights_matrix, weights_grad):
+        """Differentiates the normalised weight matrix, in which the weights
+        of each source sum to 1 over all seasons, given the weight matrix
+        and its derivative before normalisation.
+
+        :param weights_matrix: Weight matrix
+        :param weights_grad: Derivative of weight matrix
+        :return: Derivative of normalised weight matrix
+        """
+        weights_grad = np.array(weights_grad)
+
+        for i, row in enumerate(np.array(weights_matrix).T):
+            if np.sum(row) > 0:
+                weights_grad[:, i] = (
+                    weights_grad[:, i] - row * np.sum(weights_grad[:, i]) /
+                    np.sum(row)) / np.sum(row)
+
+        return weights_grad
+
     @staticmethod
     def source_param_name(source):
         return "n_s ({0})".format(source["source_name"])
@@ -1082,18 +1349,12 @@ class FitWeightMinimisationHandler(FixedWeightMinimisationHandler):
         inj_params = {}
 
         for source in self.sources:
-            name = source["source_name"]
             key = self.source_param_name(source)
             n_inj = 0
             for season_name in self.seasons.keys():
                 try:
-                    names = [x[0] for x in self.get_injector(season_name).n_exp["source_name"]]
-
-                    if isinstance(names[0], bytes):
-                        names = [x.decode() for x in names]
-
-                    mask = np.array([x == name for x in names])
-                    n_inj += np.sum(self.get_injector(season_name).n_exp["n_exp"][mask] * scale)
+                    n_inj += self.get_injector(season_name).get_expectation(
+                        source, scale)
 
                 # If source not overlapping season, will not be in dict
                 except KeyError:
@@ -1134,21 +1395,38 @@ class FlareMinimisationHandler(FixedWeightMinimisationHandler):
                                  "time PDFs that are uniform over "
                                  "fixed periods.")
 
+        # Checks if flare windows should be skipped when an upper bound on
+        # their TS is below the best TS found so far. Pruning does not change
+        # the result of the search, only the number of windows fitted.
+
+        try:
+            self.flare_pruning = self.llh_dict["flare_pruning_bool"]
+        except KeyError:
+            self.flare_pruning = True
+
     def run_trial(self, full_dataset):
 
         datasets = dict()
 
-        livetime_calcs = dict()
-
-        time_dict = {
-            "time_pdf_name": "custom_source_box"
-        }
+        livetime_pdfs = dict()
 
         results = {
             "Parameters": dict(),
             "Flag": []
         }
 
+        # Sorts the event times of each dataset once, so that the number of
+        # events in any flare window can be found with a binary search
+
+        sorted_times = dict()
+
+        for (name, data) in full_dataset.items():
+            sorted_times[name] = np.sort(data["time"])
+
+        def n_in_window(times, t_start, t_end):
+            return np.searchsorted(times, t_end, side="right") - \
+                   np.searchsorted(times, t_start, side="left")
+
         # Loop over each data season
 
         for (name, season) in self.seasons.items():
@@ -1159,7 +1437,7 @@ class FlareMinimisationHandler(FixedWeightMinimisationHandler):
             data = full_dataset[name]
             llh = self.get_likelihood(name)
 
-            livetime_calcs[name] = TimePDF.create(time_dict, season.get_time_pdf())
+            livetime_pdfs[name] = season.get_time_pdf()
 
             # Loops over each source in catalogue
 
@@ -1207,6 +1485,18 @@ class FlareMinimisationHandler(FixedWeightMinimisationHandler):
 
                     new_entry["N_all"] = len(data)
 
+                    # Upper bound on the S/B of each coincident event, for
+                    # any value of the fit parameters
+
+                    p0, bounds, names = self.source_fit_parameter_info(
+                        self.mh_dict, source)
+
+                    new_entry["SoB Upper Bound"] = \
+                        llh.estimate_significance_upper_bound(
+                            coincident_data, source,
+                            self.get_angular_error_modifier(name),
+                            bounds[-1])
+
                     datasets[source_name][name] = new_entry
 
         stacked_ts = 0.0
@@ -1228,7 +1518,31 @@ class FlareMinimisationHandler(FixedWeightMinimisationHandler):
                 all_times.extend(new_times)
                 n_tot += len(season_dict["Coincident Data"])
 
-            all_times = np.array(sorted(all_times))
+            all_times = np.unique(all_times)
+
+            # The TS of any flare window is at most the sum of
+            # 2 log(S/B) over all coincident events in the window with
+            # S/B > 1, plus the (negative) marginalisation term. The events
+            # are sorted by time, so that this sum is given by a cumulative
+            # sum for any window. If no bound is available, or pruning is
+            # disabled, no window is skipped.
+
+            bound_times = []
+            bound_log_SoB = []
+
+            for season_dict in source_dict.values():
+                SoB_bound = season_dict["SoB Upper Bound"]
+                if SoB_bound is None or not self.flare_pruning:
+                    bound_times = None
+                    break
+                bound_times.extend(season_dict["Coincident Data"]["time"])
+                bound_log_SoB.extend(np.log(np.maximum(SoB_bound, 1.)))
+
+            if bound_times is not None:
+                order = np.argsort(bound_times)
+                bound_times = np.array(bound_times)[order]
+                cumulative_log_SoB = np.concatenate(
+                    ([0.], np.cumsum(np.array(bound_log_SoB)[order])))
 
             # Minimum flare duration (days)
             min_flare = 0.25
@@ -1255,174 +1569,166 @@ class FlareMinimisationHandler(FixedWeightMinimisationHandler):
             # Loop over all flares, and check which combinations have a
             # flare length between the maximum and minimum values
 
-            pairs = []
-
             # print "There are", len(all_times), "significant neutrinos",
             # print "out of", n_tot, "neutrinos"
 
-            for x in all_times:
-                for y in all_times:
-                    if y > x:
-                        pairs.append((x, y))
+            n_times = len(all_times)
 
-            # If there is are no pairs meeting this criteria, skip
+            # If there are no pairs of significant events, skip
 
-            if len(pairs) == 0:
+            if n_times < 2:
                 logging.debug("Continuing because no pairs")
                 continue
 
-            all_res = []
-            all_ts = []
-            all_f = []
-            all_pairs = []
+            best_ts = -np.inf
+            best_fit = None
 
-            # Loop over each possible significant neutrino pair
+            # Loop over each possible significant neutrino pair. Windows are
+            # ordered by start time, and then by end time.
 
-            for i, pair in enumerate(pairs):
-                t_start = pair[0]
-                t_end = pair[1]
+            for i in range(n_times - 1):
 
-                # Calculate the length of the neutrino flare in livetime
+                t_start = all_times[i]
+                end_times = all_times[i + 1:]
 
-                flare_time = np.array(
-                    (t_start, t_end),
-                    dtype=[
-                        ("start_time_mjd", np.float),
-                        ("end_time_mjd", np.float),
-                    ]
-                )
+                # Calculate the livetime of each season in every window
+                # starting at t_start, converted to seconds. A flare only
+                # overlaps with a season if this livetime is positive.
 
-                flare_length = np.sum([
-                    time_pdf.effective_injection_time(flare_time)
-                    for time_pdf in livetime_calcs.values()]
-                )
+                season_lengths = dict([
+                    (name, time_pdf.livetime_between(t_start, end_times) * (
+                        60 * 60 * 24))
+                    for (name, time_pdf) in livetime_pdfs.items()
+                ])
 
-                # If the flare is between the minimum and maximum length
+                # The total length increases with the end time, so the windows
+                # with an allowed length (between the minimum and maximum
+                # values) are a contiguous range.
 
-                if flare_length < min_flare:
-                    continue
-                elif flare_length > max_flare:
-                    continue
+                flare_lengths = np.sum(list(season_lengths.values()), axis=0)
 
+                j_min = np.searchsorted(flare_lengths, min_flare, side="left")
+                j_max = np.searchsorted(flare_lengths, max_flare, side="right")
 
-                # Marginalisation term is length of flare in livetime
-                # divided by max flare length in livetime. Accounts
-                # for the additional short flares that can be fitted
-                # into a given window
+                if bound_times is not None:
+                    bound_start = cumulative_log_SoB[np.searchsorted(
+                        bound_times, t_start, side="left")]
 
-                overall_marginalisation = flare_length / max_flare
+                for j in range(j_min, j_max):
 
-                # Each flare is evaluated accounting for the
-                # background on the sky (the non-coincident
-                # data), which is given by the number of
-                # neutrinos on the sky during the given
-                # flare. (NOTE THAT IT IS NOT EQUAL TO THE
-                # NUMBER OF NEUTRINOS IN THE SKY OVER THE
-                # ENTIRE SEARCH WINDOW)
+                    t_end = end_times[j]
+                    flare_length = flare_lengths[j]
 
-                n_all = np.sum([np.sum(~np.logical_or(
-                    np.less(data["time"], t_start),
-                    np.greater(data["time"], t_end)))
-                                for data in full_dataset.values()])
+                    # Marginalisation term is length of flare in livetime
+                    # divided by max flare length in livetime. Accounts
+                    # for the additional short flares that can be fitted
+                    # into a given window
 
-                llhs = dict()
+                    overall_marginalisation = flare_length / max_flare
 
-                # Loop over data seasons
+                    # Skips flares which cannot exceed the best TS found so far
 
-                for (name, season_dict) in sorted(source_dict.items()):
+                    if bound_times is not None:
+                        ts_bound = 2 * np.log(overall_marginalisation) + 2 * (
+                            cumulative_log_SoB[np.searchsorted(
+                                bound_times, t_end, side="right")] -
+                            bound_start)
 
-                    llh = self.get_likelihood(name)
+                        if ts_bound <= best_ts:
+                            continue
 
-                    # Check that flare overlaps with season
+                    # Each flare is evaluated accounting for the
+                    # background on the sky (the non-coincident
+                    # data), which is given by the number of
+                    # neutrinos on the sky during the given
+                    # flare. (NOTE THAT IT IS NOT EQUAL TO THE
+                    # NUMBER OF NEUTRINOS IN THE SKY OVER THE
+                    # ENTIRE SEARCH WINDOW)
 
-                    inj_time = llh.sig_time_pdf.effective_injection_time(
-                        flare_time
-                    )
+                    n_all = np.sum([n_in_window(times, t_start, t_end)
+                                    for times in sorted_times.values()])
 
-                    if not inj_time > 0:
-                        continue
+                    llhs = dict()
 
-                    coincident_data = season_dict["Coincident Data"]
+                    # Loop over data seasons
 
-                    data = full_dataset[name]
+                    for (name, season_dict) in sorted(source_dict.items()):
 
-                    n_season = np.sum(~np.logical_or(
-                        np.less(data["time"], t_start),
-                        np.greater(data["time"], t_end)))
+                        # Check that flare overlaps with season
 
-                    # Removes non-coincident data
+                        if not season_lengths[name][j] > 0:
+                            continue
 
-                    flare_veto = np.logical_or(
-                        np.less(coincident_data["time"], t_start),
-                        np.greater(coincident_data["time"], t_end)
-                    )
+                        llh = self.get_likelihood(name)
 
-                    # Checks to make sure that there are
-                    # neutrinos in the sky at all. There should
-                    # be, due to the definition of the flare window.
+                        coincident_data = season_dict["Coincident Data"]
 
-                    if n_all > 0:
-                        pass
-                    else:
-                        raise Exception("Events are leaking somehow!")
+                        n_season = n_in_window(
+                            sorted_times[name], t_start, t_end)
 
-                    # Creates the likelihood function for the flare
+                        # Removes non-coincident data
 
-                    flare_f = llh.create_flare_llh_function(
-                        coincident_data, flare_veto, n_all, src, n_season,
-                        self.get_angular_error_modifier(season_dict["season_name"])
-                    )
+                        flare_veto = np.logical_or(
+                            np.less(coincident_data["time"], t_start),
+                            np.greater(coincident_data["time"], t_end)
+                        )
 
-                    llhs[season_dict["season_name"]] = {
-                        "f": flare_f,
-                        "flare length": flare_length
-                    }
+                        # Checks to make sure that there are
+                        # neutrinos in the sky at all. There should
+                        # be, due to the definition of the flare window.
 
-                # From here, we have normal minimisation behaviour
+                        if n_all > 0:
+                            pass
+                        else:
+                            raise Exception("Events are leaking somehow!")
 
-                def f_final(params):
+                        # Creates the likelihood function for the flare
 
-                    # Marginalisation is done once, not per-season
+                        flare_f = llh.create_flare_llh_function(
+                            coincident_data, flare_veto, n_all, src, n_season,
+                            self.get_angular_error_modifier(
+                                season_dict["season_name"])
+                        )
 
-                    ts = 2 * np.log(overall_marginalisation)
+                        llhs[season_dict["season_name"]] = {
+                            "f": flare_f,
+                            "flare length": flare_length
+                        }
 
-                    for llh_dict in llhs.values():
-                        ts += llh_dict["f"](params)
+                    # From here, we have normal minimisation behaviour
 
-                    return -ts
+                    def f_final(params):
 
-                res = scipy.optimize.fmin_l_bfgs_b(
-                    f_final, p0, bounds=bounds,
-                    approx_grad=True)
+                        # Marginalisation is done once, not per-season
 
-                all_res.append(res)
-                all_ts.append(-res[1])
-                all_f.append(f_final)
-                all_pairs.append(pair)
+                        ts = 2 * np.log(overall_marginalisation)
 
-            max_ts = max(all_ts)
-            stacked_ts += max_ts
-            index = all_ts.index(max_ts)
+                        for llh_dict in llhs.values():
+                            ts += llh_dict["f"](params)
 
-            best_start = all_pairs[index][0]
-            best_end = all_pairs[index][1]
+                        return -ts
 
-            best_time = np.array(
-                (best_start, best_end),
-                dtype=[
-                    ("start_time_mjd", np.float),
-                    ("end_time_mjd", np.float),
-                ]
-            )
+                    res = scipy.optimize.fmin_l_bfgs_b(
+                        f_final, p0, bounds=bounds,
+                        approx_grad=True)
+
+                    if -res[1] > best_ts:
+                        best_ts = -res[1]
+                        best_fit = (res, t_start, t_end, flare_length)
+
+            # If no flare has an allowed length, skip
+
+            if best_fit is None:
+                logging.debug("Continuing because no allowed flares")
+                continue
+
+            stacked_ts += best_ts
+
+            res, best_start, best_end, best_length = best_fit
 
-            best_length = np.sum([
-                time_pdf.effective_injection_time(best_time)
-                for time_pdf in livetime_calcs.values()]
-            ) / (60 * 60 * 24)
+            best_length /= (60 * 60 * 24)
 
-            best = [x for x in all_res[index][0]] + [
-                best_start, best_end, best_length
-            ]
+            best = [x for x in res[0]] + [best_start, best_end, best_length]
 
             p0, bounds, names = self.source_parameter_info(self.mh_dict, src)
 
@@ -1433,13 +1739,13 @@ class FlareMinimisationHandler(FixedWeightMinimisationHandler):
                 key = names[i]
                 results["Parameters"][key] = x
 
-            results["Flag"] += [all_res[index][2]["warnflag"]]
+            results["Flag"] += [res[2]["warnflag"]]
 
-            del all_res, all_f, all_times
+            del all_times
 
         results["TS"] = stacked_ts
 
-        del datasets, full_dataset, livetime_calcs
+        del datasets, full_dataset, livetime_pdfs
 
         return results
 
@@ -1,13 +1,54 @@
 import pickle
 import logging
-import time
 from logging.handlers import QueueHandler, QueueListener
 import argparse
 from flarestack.core.minimisation import MinimisationHandler, read_mh_dict
-from multiprocessing import JoinableQueue, Process, Queue, Value
+from flarestack.core.injector import RotatedPoolInjector
+from multiprocessing import JoinableQueue, Process, Queue
 import random
 import numpy as np
 
+# Default number of trials sent to a worker as a single unit of work
+default_chunk_size = 10
+
+
+def empty_results(param_names):
+    """Creates an empty results dictionary, in the format used for the
+    pickle files of trials.
+
+    :param param_names: Names of fit parameters
+    :return: Results dictionary
+    """
+    return {
+        "TS": [],
+        "Parameters": dict([(key, []) for key in param_names]),
+        "Flags": [],
+    }
+
+
+def add_trial_to_results(results, res_dict):
+    """Appends the output of a single trial to a results dictionary.
+
+    :param results: Results dictionary
+    :param res_dict: Output of MinimisationHandler.run_trial
+    """
+    for (key, val) in res_dict["Parameters"].items():
+        results["Parameters"][key].append(val)
+    results["TS"].append(res_dict["TS"])
+    results["Flags"].append(res_dict["Flag"])
+
+
+def merge_results(results, new_results):
+    """Appends all trials of one results dictionary to another.
+
+    :param results: Results dictionary to be extended
+    :param new_results: Results dictionary to be added
+    """
+    for (key, val) in new_results["Parameters"].items():
+        results["Parameters"][key] += val
+    results["TS"] += new_results["TS"]
+    results["Flags"] += new_results["Flags"]
+
 
 def generate_dynamic_mh_class(mh_dict):
 
@@ -37,19 +78,37 @@ class MultiProcessor:
     queue = None
     results = dict()
 
-    def __init__(self, n_cpu, **kwargs):
+    def __init__(self, n_cpu, chunk_size=default_chunk_size, **kwargs):
         self.queue = JoinableQueue()
+        self.result_queue = Queue()
         self.log_queue = Queue()
-        self.n_tasks = Value('i', 0)
-        kwargs["n_tasks"] = self.n_tasks
-
-        self.processes = [Process(target=self.run_trial, kwargs=kwargs)
-                          for _ in range(int(n_cpu))]
+        self.chunk_size = max(int(chunk_size), 1)
 
         self.mh = MinimisationHandler.create(kwargs["mh_dict"])
         for season in self.mh.seasons.keys():
             inj = self.mh.get_injector(season)
             inj.calculate_n_exp()
+            if self.mh.seasons[season].background_base is None:
+                self.mh.seasons[season].load_background_model()
+            self.mh.get_likelihood(season)
+            self.mh.get_angular_error_modifier(season)
+
+        # Everything is loaded before the workers are forked, so that they
+        # share the read-only arrays of the parent through copy-on-write,
+        # and the MC memory-mapped from the data cache through the page
+        # cache, rather than each loading a copy.
+
+        # The MinimisationHandler which fits trials in the workers is also
+        # created before forking, and uses the likelihoods and angular error
+        # modifiers loaded above, so that workers do not load them again
+
+        self.mpmh = generate_dynamic_mh_class(kwargs["mh_dict"])
+        self.mpmh._llhs = self.mh._llhs
+        self.mpmh._aem = self.mh._aem
+
+        self.processes = [Process(target=self.run_trial, kwargs=kwargs)
+                          for _ in range(int(n_cpu))]
+
         self.mh_dict = kwargs["mh_dict"]
         self.scales = []
 
@@ -81,51 +140,99 @@ class MultiProcessor:
         logger = logging.getLogger()
         logger.addHandler(qh)
 
-        mh_dict = kwargs["mh_dict"]
-
-        mpmh = generate_dynamic_mh_class(mh_dict)
-
-        n_tasks = kwargs["n_tasks"]
+        mpmh = self.mpmh
 
         while True:
             item = self.queue.get()
             if item is None:
+                self.queue.task_done()
                 break
 
-            (scale, seed) = item
+            (scale, seeds) = item
+
+            # Each chunk of trials is sent back as a single result, so that
+            # the parent process can write them in batches
+
+            try:
+                results = empty_results(mpmh.param_names)
 
-            full_dataset = self.mh.prepare_dataset(scale, seed)
+                for seed in seeds:
+                    full_dataset = self.mh.prepare_dataset(scale, seed)
+                    res_dict = mpmh.run_trial(full_dataset)
+                    add_trial_to_results(results, res_dict)
 
-            mpmh.run_single(full_dataset, scale, seed)
-            with n_tasks.get_lock():
-                n_tasks.value -= 1
+            except Exception:
+                logging.exception("Failed running trials with scale {0} "
+                                  "and seeds {1}".format(scale, seeds))
+                results = None
+
+            self.result_queue.put((scale, seeds, results))
             self.queue.task_done()
 
+        # Worker processes exit without running exit handlers, so rotated
+        # pools saved to disk by the injectors are removed here
+
+        for season in self.mh.seasons.keys():
+            inj = self.mh.get_injector(season)
+            if isinstance(inj, RotatedPoolInjector):
+                inj.clear_pools()
+
     def fill_queue(self):
+        """Splits all trials into chunks of chunk_size trials with the same
+        scale, and adds them to the queue. The results of each chunk are
+        collected from the result queue as soon as they are returned, and
+        written to a file named after the first seed of the chunk. If any
+        chunk fails, an exception is raised once all other chunks have been
+        written.
+        """
         scale_range, n_trials = self.mh.trial_params(self.mh_dict)
 
         self.scales = scale_range
 
+        chunks = []
+
         for scale in scale_range:
-            for _ in range(n_trials):
-                self.add_to_queue((scale, int(random.random() * 10 ** 8)))
+            seeds = [int(random.random() * 10 ** 8) for _ in range(n_trials)]
+            for start in range(0, n_trials, self.chunk_size):
+                chunks.append((scale, seeds[start:start + self.chunk_size]))
+
+        for chunk in chunks:
+            self.add_to_queue(chunk)
 
         n_tasks = (len(scale_range) * n_trials)
-        with self.n_tasks.get_lock():
-            self.n_tasks.value += n_tasks
 
-        logging.info("Added {0} trials to queue. Now processing.".format(n_tasks))
+        logging.info("Added {0} trials to queue in {1} chunks. "
+                     "Now processing.".format(n_tasks, len(chunks)))
+
+        failed = []
+
+        for i in range(len(chunks)):
+            (scale, seeds, results) = self.result_queue.get()
+
+            if results is None:
+                failed.append((scale, seeds))
+            else:
+                self.mh.dump_results(results, scale, seeds[0])
+
+            logging.info("{0} of {1} chunks remaining.".format(
+                len(chunks) - i - 1, len(chunks)))
+
+        if len(failed) > 0:
+            raise RuntimeError(
+                "{0} of {1} chunks failed, so {2} of {3} trials were not "
+                "saved. Failed scales and seeds: {4}".format(
+                    len(failed), len(chunks),
+                    np.sum([len(seeds) for (_, seeds) in failed]), n_tasks,
+                    failed))
 
-        while self.n_tasks.value > 0.:
-            logging.info("{0} tasks remaining.".format(self.n_tasks.value))
-            time.sleep(30)
         logging.info("Finished processing {0} tasks.".format(n_tasks))
 
     def terminate(self):
-        """ wait until queue is empty and terminate processes """
-        self.queue.join()
+        """ stop the workers once the queue is empty and terminate processes """
+        for _ in self.processes:
+            self.add_to_queue(None)
         for p in self.processes:
-            p.terminate()
+            p.join()
 
         self.dump_all_injection_values()
 
@@ -135,10 +242,11 @@ class MultiProcessor:
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.terminate()
 
-def run_multiprocess(n_cpu, mh_dict):
-    with MultiProcessor(n_cpu=n_cpu, mh_dict=mh_dict) as r:
+
+def run_multiprocess(n_cpu, mh_dict, chunk_size=default_chunk_size):
+    with MultiProcessor(n_cpu=n_cpu, mh_dict=mh_dict,
+                        chunk_size=chunk_size) as r:
         r.fill_queue()
-        r.terminate()
         del r
 
 if __name__ == '__main__':
@@ -147,6 +255,8 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument("-f", "--file", help="Path for analysis pkl_file")
     parser.add_argument("-n", "--n_cpu", default=min(os.cpu_count()-1, 32))
+    parser.add_argument("-c", "--chunk_size", default=default_chunk_size,
+                        help="Number of trials in each unit of work")
     cfg = parser.parse_args()
 
     logging.info("N CPU available {0}".format(os.cpu_count()))
@@ -154,4 +264,5 @@ if __name__ == '__main__':
     with open(cfg.file, "rb") as f:
         mh_dict = pickle.load(f)
 
-    run_multiprocess(n_cpu=cfg.n_cpu, mh_dict=mh_dict)
+    run_multiprocess(n_cpu=cfg.n_cpu, mh_dict=mh_dict,
+                     chunk_size=int(cfg.chunk_size))
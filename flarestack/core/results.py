@@ -1,4 +1,5 @@
 import os
+import zipfile
 import pickle as Pickle
 import numpy as np
 import math
@@ -6,9 +7,10 @@ import scipy
 import scipy.stats
 import matplotlib.pyplot as plt
 from flarestack.shared import name_pickle_output_dir, plot_output_dir, \
-    k_to_flux, inj_dir_name, scale_shortener
+    k_to_flux, inj_dir_name, scale_shortener, load_trial_results, \
+    merge_trial_results, save_trial_results
 from flarestack.core.ts_distributions import plot_background_ts_distribution, \
-    plot_fit_results
+    plot_fit_results, background_ts_threshold
 from flarestack.utils.neutrino_astronomy import calculate_astronomy
 from flarestack.core.minimisation import MinimisationHandler
 from flarestack.utils.catalogue_loader import load_catalogue
@@ -16,9 +18,63 @@ import sys
 import logging
 
 
+def fit_sensitivity_curve(x, y, threshold=0.9):
+    """Fits a 1-exponential decay function to the fraction of trials with
+    an overfluctuation, as a function of the flux scale, and finds the
+    scale at which the fitted fraction reaches the threshold.
+
+    :param x: Array of flux scales
+    :param y: Fraction of overfluctuations at each flux scale
+    :param threshold: Fraction of overfluctuations (0.9 for sensitivity)
+    :return: Scale at threshold, and fitted function
+    """
+
+    b = (1 - min(y))
+
+    def f(x, a):
+        value = (1 - b * np.exp(-a * x))
+        return value
+
+    best_a = scipy.optimize.curve_fit(
+        f, x, y,  p0=[1./max(x)])[0][0]
+
+    def best_f(x):
+        return f(x, best_a)
+
+    return (1./best_a) * np.log(b / (1 - threshold)), best_f
+
+
+def fit_disc_curve(x, y, threshold=0.5):
+    """Fits a gamma CDF to the fraction of trials above the discovery TS
+    threshold, as a function of the flux scale, and finds the scale at
+    which the fitted fraction reaches the threshold.
+
+    :param x: Array of flux scales
+    :param y: Fraction of trials above the discovery TS threshold
+    :param threshold: Fraction of trials (0.5 for discovery potential)
+    :return: Scale at threshold, and fitted function
+    """
+
+    def f(x, a, b, c):
+        value = scipy.stats.gamma.cdf(x, a, b, c)
+        return value
+
+    res = scipy.optimize.curve_fit(
+        f, x, y,  p0=[6, -0.1 * max(x), 0.1 * max(x)])
+
+    best_a = res[0][0]
+    best_b = res[0][1]
+    best_c = res[0][2]
+
+    def best_f(x):
+        return f(x, best_a, best_b, best_c)
+
+    return scipy.stats.gamma.ppf(threshold, best_a, best_b, best_c), best_f
+
+
 class ResultsHandler(object):
 
-    def __init__(self, rh_dict):
+    def __init__(self, rh_dict, do_plots=False):
 
         self.sources = load_catalogue(rh_dict["catalogue"])
 
@@ -29,6 +85,9 @@ class ResultsHandler(object):
         self.plot_dir = plot_output_dir(self.name)
         self.merged_dir = os.path.join(self.pickle_output_dir, "merged")
 
+        # Plots are only made if requested, either here or with make_all_plots
+        self.do_plots = do_plots
+
         # Checks if the code should search for flares. By default, this is
         # not done.
         # try:
@@ -90,6 +149,15 @@ class ResultsHandler(object):
         # else:
         #     self.inj = None
 
+        self.update()
+
+    def update(self):
+        """Merges any results files which have been written since the last
+        update, and recalculates the sensitivity and discovery potential.
+        Can be called repeatedly while trials are still running. Plots are
+        only made if do_plots is True.
+        """
+
         try:
             self.merge_pickle_data()
         except FileNotFoundError:
@@ -109,7 +177,20 @@ class ResultsHandler(object):
         except ValueError as e:
             logging.warning("TypeError for discovery potential: \n {0}".format(e))
 
-        self.plot_bias()
+        if self.do_plots:
+            self.plot_bias()
+
+    def make_all_plots(self):
+        """Makes the plots of the TS distributions, fit parameters,
+        sensitivity, discovery potential and bias for all results.
+        """
+        do_plots = self.do_plots
+        self.do_plots = True
+
+        try:
+            self.update()
+        finally:
+            self.do_plots = do_plots
 
     def astro_values(self, e_pdf_dict):
         """Function to convert the values calculated for sensitivity and
@@ -183,6 +264,12 @@ class ResultsHandler(object):
         return inj_values
 
     def merge_pickle_data(self):
+        """Merges the results files of each scale, together with any
+        previously-merged results, into a single columnar .npz file per
+        scale. The merged files are written before any of the individual
+        results files are removed. Scales which are already loaded, and
+        which have no new results files, are not read or written again.
+        """
 
         all_sub_dirs = [x for x in os.listdir(self.pickle_output_dir)
                         if x[0] != "." and x != "merged"]
@@ -195,45 +282,58 @@ class ResultsHandler(object):
         for sub_dir_name in all_sub_dirs:
             sub_dir = os.path.join(self.pickle_output_dir,  sub_dir_name)
 
-            files = os.listdir(sub_dir)
+            merged_path = os.path.join(self.merged_dir, sub_dir_name + ".npz")
 
-            merged_path = os.path.join(self.merged_dir, sub_dir_name + ".pkl")
+            # Merged results from older versions were saved as pickles
 
-            if os.path.isfile(merged_path):
-                with open(merged_path, "rb") as mp:
-                    merged_data = Pickle.load(mp)
-            else:
-                merged_data = {}
+            legacy_merged_path = os.path.join(
+                self.merged_dir, sub_dir_name + ".pkl")
+
+            merged_paths = [x for x in [merged_path, legacy_merged_path]
+                            if os.path.isfile(x)]
 
-            for filename in files:
-                path = os.path.join(sub_dir, filename)
+            paths = [os.path.join(sub_dir, x) for x in sorted(os.listdir(sub_dir))
+                     if os.path.splitext(x)[1] in [".npz", ".pkl"]]
 
+            key = scale_shortener(float(sub_dir_name))
+
+            all_results = []
+            loaded_paths = []
+
+            # Previously-merged results are kept in memory
+
+            if key in self.results:
+                if len(paths) == 0:
+                    continue
+                all_results.append(self.results[key])
+                merged_paths = []
+
+            for path in merged_paths + paths:
                 try:
-                    with open(path, "rb") as f:
-                        data = Pickle.load(f)
-                except EOFError:
+                    all_results.append(load_trial_results(path))
+                except (EOFError, OSError, ValueError, zipfile.BadZipFile):
                     logging.warning("Failed loading: {0}".format(path))
                     continue
-                os.remove(path)
-
-                if merged_data == {}:
-                    merged_data = data
-                else:
-                    for (key, info) in data.items():
-                        if isinstance(info, list):
-                            merged_data[key] += info
-                        else:
-                            for (param_name, params) in info.items():
-                                try: merged_data[key][param_name] += params
-                                except KeyError as m:
-                                    logging.warning('Keys [{key}][{param_name}] not found in \n {merged_data}')
-                                    raise KeyError(m)
-
-            with open(merged_path, "wb") as mp:
-                Pickle.dump(merged_data, mp)
-
-            if len(list(merged_data.keys())) > 0:
-                self.results[scale_shortener(float(sub_dir_name))] = merged_data
+                loaded_paths.append(path)
+
+            if len(all_results) == 0:
+                continue
+
+            try:
+                merged_data = merge_trial_results(all_results)
+            except KeyError as m:
+                logging.warning("Parameters do not match for all results "
+                                "in {0}".format(sub_dir))
+                raise KeyError(m)
+
+            save_trial_results(merged_data, merged_path)
+
+            for path in loaded_paths:
+                if path != merged_path:
+                    os.remove(path)
+
+            if len(merged_data["TS"]) > 0:
+                self.results[key] = merged_data
 
         if len(list(self.results.keys())) == 0:
             logging.warning("No data was found by ResultsHandler object! \n")
@@ -337,7 +437,8 @@ class ResultsHandler(object):
                 y.append(frac)
                 x_acc.append(float(scale))
 
-                self.make_plots(scale)
+                if self.do_plots:
+                    self.make_plots(scale)
 
             # raw_input("prompt")
 
@@ -347,38 +448,29 @@ class ResultsHandler(object):
 
         threshold = 0.9
 
-        b = (1 - min(y))
-
-        def f(x, a):
-            value = (1 - b * np.exp(-a * x))
-            return value
+        sol, best_f = fit_sensitivity_curve(x, y, threshold)
 
-        best_a = scipy.optimize.curve_fit(
-            f, x, y,  p0=[1./max(x)])[0][0]
-
-        def best_f(x):
-            return f(x, best_a)
-
-        fit = k_to_flux((1./best_a) * np.log(b / (1 - threshold)))
+        fit = k_to_flux(sol)
 
         if fit > max(x_flux):
             extrapolated = True
         else:
             extrapolated = False
 
-        xrange = np.linspace(0.0, 1.1 * max(x), 1000)
+        if self.do_plots:
+            xrange = np.linspace(0.0, 1.1 * max(x), 1000)
 
-        plt.figure()
-        plt.scatter(x_flux, y, color="black")
-        plt.plot(k_to_flux(xrange), best_f(xrange), color="blue")
-        plt.axhline(threshold, lw=1, color="red", linestyle="--")
-        plt.axvline(fit, lw=2, color="red")
-        plt.ylim(0., 1.)
-        plt.xlim(0., k_to_flux(max(xrange)))
-        plt.ylabel('Overfluctuations above TS=' + "{:.2f}".format(ts_val))
-        plt.xlabel(r"Flux strength [ GeV$^{-1}$ cm$^{-2}$ s$^{-1}$]")
-        plt.savefig(savepath)
-        plt.close()
+            plt.figure()
+            plt.scatter(x_flux, y, color="black")
+            plt.plot(k_to_flux(xrange), best_f(xrange), color="blue")
+            plt.axhline(threshold, lw=1, color="red", linestyle="--")
+            plt.axvline(fit, lw=2, color="red")
+            plt.ylim(0., 1.)
+            plt.xlim(0., k_to_flux(max(xrange)))
+            plt.ylabel('Overfluctuations above TS=' + "{:.2f}".format(ts_val))
+            plt.xlabel(r"Flux strength [ GeV$^{-1}$ cm$^{-2}$ s$^{-1}$]")
+            plt.savefig(savepath)
+            plt.close()
 
         return fit, extrapolated
 
@@ -394,8 +486,12 @@ class ResultsHandler(object):
 
         bkg_ts = bkg_dict["TS"]
 
-        disc_threshold = plot_background_ts_distribution(
-            bkg_ts, ts_path, ts_type=self.ts_type)
+        if self.do_plots:
+            disc_threshold = plot_background_ts_distribution(
+                bkg_ts, ts_path, ts_type=self.ts_type)
+        else:
+            disc_threshold = background_ts_threshold(
+                bkg_ts, ts_type=self.ts_type)[0]
 
         self.disc_ts_threshold = disc_threshold
 
@@ -439,24 +535,13 @@ class ResultsHandler(object):
 
         for i, y_val in enumerate([y, y_25]):
 
-            def f(x, a, b, c):
-                value = scipy.stats.gamma.cdf(x, a, b, c)
-                return value
-
-            res = scipy.optimize.curve_fit(
-                f, x, y_val,  p0=[6, -0.1 * max(x), 0.1 * max(x)])
-
-            best_a = res[0][0]
-            best_b = res[0][1]
-            best_c = res[0][2]
-
-            def best_f(x):
-                return f(x, best_a, best_b, best_c)
-
-            sol = scipy.stats.gamma.ppf(0.5, best_a, best_b, best_c)
+            sol, best_f = fit_disc_curve(x, y_val, threshold)
             setattr(self, ["disc_potential", "disc_potential_25"][i],
                     k_to_flux(sol))
 
+            if not self.do_plots:
+                continue
+
             xrange = np.linspace(0.0, 1.1 * max(x), 1000)
 
             savepath = self.plot_dir + "disc" + ["", "_25"][i] + ".pdf"
@@ -95,15 +95,32 @@ class SignalSpatialPDF:
         phi3 = ra3 - np.pi
         zen3 = np.pi/2. - dec3
 
-        # Rotate each ra1 and dec1 towards the pole?
-        x = np.array([hp.rotator.rotateDirection(
-            hp.rotator.get_rotation_matrix((dp, -dz, 0.))[0], z, p)
-            for z, p, dz, dp in zip(zen1, phi1, zen2, phi2)])
+        # Rotate each ra1 and dec1 towards the pole, such that each ra2 and
+        # dec2 lies exactly on the pole. This is the batched equivalent of
+        # applying hp.rotator.get_rotation_matrix((phi2, -zen2, 0.)) to each
+        # event individually, i.e a rotation by -phi2 around the z axis
+        # followed by a rotation of -zen2 around the y axis.
+        x, y, z = hp.rotator.dir2vec(zen1, phi1)
+
+        cos_phi2 = np.cos(phi2)
+        sin_phi2 = np.sin(phi2)
+        cos_zen2 = np.cos(zen2)
+        sin_zen2 = np.sin(zen2)
+
+        x_rot = cos_phi2 * x + sin_phi2 * y
+        y_rot = cos_phi2 * y - sin_phi2 * x
+
+        zen_pole, phi_pole = hp.rotator.vec2dir(
+            cos_zen2 * x_rot - sin_zen2 * z,
+            y_rot,
+            sin_zen2 * x_rot + cos_zen2 * z
+        )
 
         # Rotate **all** these vectors towards ra3, dec3 (source_path)
         zen, phi = hp.rotator.rotateDirection(np.dot(
             hp.rotator.get_rotation_matrix((-phi3, 0, 0))[0],
-            hp.rotator.get_rotation_matrix((0, zen3, 0.))[0]), x[:, 0], x[:, 1])
+            hp.rotator.get_rotation_matrix((0, zen3, 0.))[0]),
+            np.atleast_1d(zen_pole), np.atleast_1d(phi_pole))
 
         dec = np.pi/2. - zen
 
@@ -54,12 +54,33 @@ def read_t_pdf_dict(t_pdf_dict):
     return t_pdf_dict
 
 
+# Number of points at which the cumulative distribution of each source is
+# tabulated, to simulate times by interpolation
+inverse_cdf_n_points = int(1e4)
+
+# Maximum number of tabulated cumulative distributions kept by each time
+# PDF. Each row holds inverse_cdf_n_points values, so this bounds the table
+# at ~40 MB. Once full, the least recently used rows are replaced.
+max_inverse_cdf_rows = 500
+
+# Fields of a source which determine its time PDF. The cumulative
+# distribution of a source is memoized by its name and these fields, so that
+# a source with the same name but different times is tabulated again.
+inverse_cdf_time_fields = ["ref_time_mjd", "start_time_mjd", "end_time_mjd"]
+
+
 class TimePDF(object):
     subclasses = {}
 
     def __init__(self, t_pdf_dict, livetime_pdf=None):
         self.t_dict = t_pdf_dict
 
+        # Tabulated cumulative distributions used to simulate times. The
+        # table of the i-th row is offset by 2i, so that all rows can be
+        # searched at once. Identical tables (e.g for Steady PDFs) are only
+        # stored once.
+        self.clear_inverse_cdf()
+
         if livetime_pdf is not None:
             self.livetime_f = lambda x: livetime_pdf.livetime_f(x)# * livetime_pdf.livetime
             self.livetime_pdf = livetime_pdf
@@ -112,23 +133,20 @@ class TimePDF(object):
 
         return f
 
-    def inverse_interpolate(self, source):
+    def inverse_cdf(self, source):
         """Calculates the values for the integral of the signal PDF within
         the season. Then rescales these values, such that the start of the
-        season yields 0, and then end of the season yields 1. Creates a
-        function to interpolate between these values. Then, for a number
-        between 0 and 1, the interpolated function will return the MJD time
-        at which that fraction of the cumulative distribution was reached.
+        season yields 0, and then end of the season yields 1.
 
         :param source: Source to be considered
-        :return: Interpolated function
+        :return: Array of times in MJD, and the cumulative fraction at each
         """
         max_int = self.product_integral(self.sig_t1(source), source)
         min_int = self.product_integral(self.sig_t0(source), source)
         fraction = max_int - min_int
 
         t_range = np.linspace(self.sig_t0(source), self.sig_t1(source),
-                              int(1e4))
+                              inverse_cdf_n_points)
         cumu = (self.product_integral(t_range, source) - min_int) / fraction
 
         # Checks to ensure the cumulative fraction spans 0 to 1
@@ -137,8 +155,182 @@ class TimePDF(object):
         elif min(cumu) < 0:
             raise Exception("Cumulative Distribution extends below 0.")
 
+        return t_range, cumu
+
+    def inverse_interpolate(self, source):
+        """Creates a function to interpolate the cumulative distribution of
+        the signal PDF within the season. For a number between 0 and 1,
+        the interpolated function will return the MJD time at which that
+        fraction of the cumulative distribution was reached.
+
+        :param source: Source to be considered
+        :return: Interpolated function
+        """
+        t_range, cumu = self.inverse_cdf(source)
         return interp1d(cumu, t_range, kind='linear')
 
+    def clear_inverse_cdf(self):
+        """Removes all tabulated cumulative distributions, e.g when the
+        sources are replaced.
+        """
+        self.inverse_cdf_rows = dict()
+        self.inverse_cdf_hashes = dict()
+        self.inverse_cdf_row_keys = dict()
+        self.inverse_cdf_table = np.zeros((0, inverse_cdf_n_points))
+        self.inverse_cdf_edges = np.zeros((0, 2))
+        self.inverse_cdf_last_used = np.zeros(0, dtype=np.int)
+        self.inverse_cdf_clock = 0
+        self.n_inverse_cdf = 0
+
+    def evict_inverse_cdf(self):
+        """Removes the least recently used row of the stacked table, so that
+        it can be replaced. Rows used for the current set of sources are
+        never removed.
+
+        :return: Row which was removed, or None if all rows are in use
+        """
+        last_used = self.inverse_cdf_last_used[:self.n_inverse_cdf]
+        row = int(np.argmin(last_used))
+
+        if last_used[row] >= self.inverse_cdf_clock:
+            return None
+
+        (key, memo_keys) = self.inverse_cdf_row_keys.pop(row)
+
+        self.inverse_cdf_hashes[key].remove(row)
+        if len(self.inverse_cdf_hashes[key]) == 0:
+            del self.inverse_cdf_hashes[key]
+
+        for memo_key in memo_keys:
+            del self.inverse_cdf_rows[memo_key]
+
+        return row
+
+    def add_inverse_cdf(self, source):
+        """Tabulates the cumulative distribution of a source, and adds it to
+        the stacked table, unless an identical table is already present.
+
+        :param source: Source to be considered
+        :return: Row of the table for the source
+        """
+        t_range, cumu = self.inverse_cdf(source)
+        edges = np.array([t_range[0], t_range[-1]])
+
+        key = hash((edges.tobytes(), cumu.tobytes()))
+
+        # Each row is compared with the offset table it would have, as
+        # removing the offset from a stored row is not exact
+
+        for row in self.inverse_cdf_hashes.get(key, []):
+            if np.array_equal(self.inverse_cdf_edges[row], edges) and \
+                    np.array_equal(self.inverse_cdf_table[row],
+                                   cumu + 2. * row):
+                return row
+
+        row = None
+
+        if self.n_inverse_cdf >= max_inverse_cdf_rows:
+            row = self.evict_inverse_cdf()
+
+        if row is None:
+            row = self.n_inverse_cdf
+            self.n_inverse_cdf += 1
+
+        # The table is grown by doubling, so that adding rows one at a
+        # time remains cheap. Growth stops at max_inverse_cdf_rows, unless
+        # more rows are needed to simulate a single set of sources.
+
+        if row == len(self.inverse_cdf_table):
+            n_new = max(row, 1)
+            if row < max_inverse_cdf_rows:
+                n_new = min(n_new, max_inverse_cdf_rows - row)
+            self.inverse_cdf_table = np.concatenate((
+                self.inverse_cdf_table,
+                np.zeros((n_new, inverse_cdf_n_points))))
+            self.inverse_cdf_edges = np.concatenate((
+                self.inverse_cdf_edges, np.zeros((n_new, 2))))
+            self.inverse_cdf_last_used = np.concatenate((
+                self.inverse_cdf_last_used, np.zeros(n_new, dtype=np.int)))
+
+        self.inverse_cdf_table[row] = cumu + 2. * row
+        self.inverse_cdf_edges[row] = edges
+        self.inverse_cdf_hashes.setdefault(key, []).append(row)
+        self.inverse_cdf_row_keys[row] = (key, [])
+
+        return row
+
+    def get_inverse_cdf_rows(self, sources):
+        """Returns the row of the stacked table of cumulative distributions
+        for each source. The table of each source is only calculated the
+        first time it is needed, and is memoized by the source name and time
+        fields. Sources without a name are not memoized.
+
+        :param sources: Sources to be considered
+        :return: Array of rows
+        """
+        rows = np.zeros(len(sources), dtype=np.int)
+
+        self.inverse_cdf_clock += 1
+
+        for i, source in enumerate(sources):
+
+            try:
+                key = (source["source_name"],) + tuple(
+                    float(source[x]) for x in inverse_cdf_time_fields
+                    if x in source.dtype.names)
+            except (AttributeError, IndexError, KeyError, TypeError,
+                    ValueError):
+                key = None
+
+            if key is None:
+                rows[i] = self.add_inverse_cdf(source)
+            else:
+                if key not in self.inverse_cdf_rows:
+                    row = self.add_inverse_cdf(source)
+                    self.inverse_cdf_rows[key] = row
+                    self.inverse_cdf_row_keys[row][1].append(key)
+                rows[i] = self.inverse_cdf_rows[key]
+
+            self.inverse_cdf_last_used[rows[i]] = self.inverse_cdf_clock
+
+        return rows
+
+    def simulate_times_multi(self, sources, n_s):
+        """Randomly draws times for the events of several sources at once,
+        all lying within the current season. The times of all sources are
+        drawn by interpolating a single stacked table of their cumulative
+        distributions.
+
+        :param sources: Sources being considered
+        :param n_s: Number of event times to be simulated for each source
+        :return: Array of times in MJD, ordered by source
+        """
+        n_s = np.asarray(n_s, dtype=np.int)
+        mask = n_s > 0
+
+        rows = self.get_inverse_cdf_rows(
+            [x for (i, x) in enumerate(sources) if mask[i]])
+
+        event_rows = np.repeat(rows, n_s[mask])
+
+        n_points = inverse_cdf_n_points
+        table = self.inverse_cdf_table[:self.n_inverse_cdf].ravel()
+
+        target = np.random.uniform(0., 1., len(event_rows)) + 2. * event_rows
+
+        pos = np.searchsorted(table, target, side="right")
+        pos = np.clip(pos - event_rows * n_points, 1, n_points - 1)
+
+        hi = event_rows * n_points + pos
+        lo = hi - 1
+
+        frac = (target - table[lo]) / (table[hi] - table[lo])
+
+        t0 = self.inverse_cdf_edges[event_rows, 0]
+        t1 = self.inverse_cdf_edges[event_rows, 1]
+
+        return t0 + (pos - 1 + frac) * (t1 - t0) / (n_points - 1)
+
     def simulate_times(self, source, n_s):
         """Randomly draws times for n_s events for a given source,
         all lying within the current season. The values are based on an
@@ -148,11 +340,7 @@ class TimePDF(object):
         :param n_s: Number of event times to be simulated
         :return: Array of times in MJD for a given source
         """
-        f = self.inverse_interpolate(source)
-
-        sims = f(np.random.uniform(0., 1., n_s))
-
-        return sims
+        return self.simulate_times_multi([source], [n_s])
 
     def f(self, t, source):
         raise NotImplementedError(
@@ -199,6 +387,12 @@ class TimePDF(object):
     def effective_injection_time(self, source=None):
         raise NotImplementedError
 
+    def livetime_between(self, t_start, t_end):
+        raise NotImplementedError(
+            "No 'livetime_between' has been implemented for {0}".format(
+                self.__class__.__name__
+            ))
+
     def get_livetime(self):
         raise NotImplementedError
 
@@ -452,6 +646,25 @@ class FixedRefBox(Box):
         """
         return min(self.fixed_ref + self.post_window, self.t1)
 
+    def livetime_between(self, t_start, t_end):
+        """Calculates the livetime (in days) between each pair of start and
+        end times, for a box that is used as the livetime of a season with
+        no downtime. Times outside the box are clipped to the box
+        boundaries, and windows with negative length are given a livetime
+        of 0.
+
+        :param t_start: Array of window start times (MJD)
+        :param t_end: Array of window end times (MJD)
+        :return: Array of livetimes in days
+        """
+        if self.livetime_pdf is not None:
+            raise Exception("Livetime PDF already provided.")
+
+        t0 = np.clip(t_start, self.sig_t0(), self.sig_t1())
+        t1 = np.clip(t_end, self.sig_t0(), self.sig_t1())
+
+        return np.maximum(t1 - t0, 0.)
+
 
 @TimePDF.register_subclass('fixed_end_box')
 class FixedEndBox(Box):
@@ -510,6 +723,21 @@ class FixedEndBox(Box):
             l_to_mjd = lambda x: x + self.sig_t0()
             return mjd_to_l, l_to_mjd
 
+    def livetime_between(self, t_start, t_end):
+        """Calculates the livetime (in days) between each pair of start and
+        end times, using the MJD to livetime conversion of the box.
+
+        :param t_start: Array of window start times (MJD)
+        :param t_end: Array of window end times (MJD)
+        :return: Array of livetimes in days
+        """
+        mjd_to_livetime, _ = self.get_mjd_conversion()
+
+        t0 = np.clip(t_start, self.sig_t0(), self.sig_t1())
+        t1 = np.clip(t_end, self.sig_t0(), self.sig_t1())
+
+        return np.maximum(mjd_to_livetime(t1) - mjd_to_livetime(t0), 0.)
+
 @TimePDF.register_subclass('custom_source_box')
 class CustomSourceBox(Box):
     """The simplest time-dependent case for a Time PDF. Used for a source that
@@ -571,6 +799,8 @@ class DetectorOnOffList(TimePDF):
                 t_pdf_dict.keys()
             ))
         self.t0, self.t1, self._livetime, self.season_f, self.mjd_to_livetime, self.livetime_to_mjd = self.parse_list()
+        self.cumulative_mjd, self.cumulative_livetime = \
+            self.parse_cumulative_livetime()
 
     def parse_list(self):
         t0 = min(self.on_off_list["start"])
@@ -593,6 +823,41 @@ class DetectorOnOffList(TimePDF):
     def parse_list(self):
         raise NotImplementedError
 
+    def parse_cumulative_livetime(self):
+        """Converts the on/off list into the cumulative livetime at the
+        start and stop of each period, so that the livetime at any time can
+        be found by linear interpolation.
+
+        :return: Array of times (MJD) and array of cumulative livetime (days)
+        """
+        n = len(self.on_off_list)
+
+        mjd = np.empty(2 * n)
+        mjd[0::2] = self.on_off_list["start"]
+        mjd[1::2] = self.on_off_list["stop"]
+
+        livetime = np.empty(2 * n)
+        livetime[1::2] = np.cumsum(self.on_off_list["length"])
+        livetime[0::2] = livetime[1::2] - self.on_off_list["length"]
+
+        order = np.argsort(mjd, kind="stable")
+
+        return mjd[order], livetime[order]
+
+    def livetime_between(self, t_start, t_end):
+        """Calculates the livetime (in days) between each pair of start and
+        end times, using the precomputed cumulative livetime of the on/off
+        list. Windows with negative length are given a livetime of 0.
+
+        :param t_start: Array of window start times (MJD)
+        :param t_end: Array of window end times (MJD)
+        :return: Array of livetimes in days
+        """
+        l0 = np.interp(t_start, self.cumulative_mjd, self.cumulative_livetime)
+        l1 = np.interp(t_end, self.cumulative_mjd, self.cumulative_livetime)
+
+        return np.maximum(l1 - l0, 0.)
+
     def get_livetime(self):
         return self._livetime
 
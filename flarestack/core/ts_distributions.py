@@ -249,13 +249,6 @@ def fit_background_ts(ts_array, ts_type):
 
     if ts_type == "Flare":
 
-        plt.hist([ts_array[mask], np.zeros(np.sum(~mask))],
-                 bins=n_bins, lw=2, histtype='step',
-                 color=['black', "grey"],
-                 label=['TS > 0', "TS <= 0"],
-                 density=True,
-                 stacked=True)
-
         chi2 = Chi2_LeftTruncated(ts_array)
 
         if chi2._res.success:
@@ -280,13 +273,6 @@ def fit_background_ts(ts_array, ts_type):
 
     elif ts_type == "Fit Weights":
 
-        plt.hist([ts_array[mask], np.zeros(np.sum(~mask))],
-                 bins=n_bins, lw=2, histtype='step',
-                 color=['black', "grey"],
-                 label=['TS > 0', "TS <= 0"],
-                 dennsity=True,
-                 stacked=True)
-
         chi2 = Chi2_one_side_free(ts_array[ts_array > 0.])
 
         if chi2._res.success:
@@ -312,13 +298,6 @@ def fit_background_ts(ts_array, ts_type):
 
     elif ts_type in ["Standard", "Negative n_s"]:
 
-        plt.hist([ts_array[mask], np.zeros(np.sum(~mask))],
-                 bins=n_bins, lw=2, histtype='step',
-                 color=['black', "grey"],
-                 label=['TS > 0', "TS <= 0"],
-                 density=True,
-                 stacked=True)
-
         chi2 = Chi2_one_side(ts_array[ts_array > 0.])
 
         df = chi2._f.args[0]
@@ -364,6 +343,29 @@ def plot_expanded_negative(ts_array, path):
     plt.close()
 
 
+def background_ts_threshold(ts_array, ts_type="Standard"):
+    """Fits the background TS distribution, and finds the TS threshold
+    required for a 5 sigma discovery. Nothing is plotted.
+
+    :param ts_array: Array of background TS values
+    :param ts_type: Type of TS distribution to be fitted
+    :return: 5 sigma TS threshold, and the fitted chi2 degrees of freedom,
+    location, scale and fraction of overfluctuations
+    """
+    ts_array = np.array(ts_array)
+    ts_array = ts_array[~np.isnan(ts_array)]
+
+    df, loc, scale, frac_over = fit_background_ts(ts_array, ts_type)
+
+    frac_under = 1 - frac_over
+
+    five_sigma = (raw_five_sigma - frac_under) / (1. - frac_under)
+
+    disc_potential = scipy.stats.chi2.ppf(five_sigma, df, loc, scale)
+
+    return disc_potential, df, loc, scale, frac_over
+
+
 def plot_background_ts_distribution(ts_array, path, ts_type="Standard",
                                     ts_val=None):
 
@@ -383,7 +385,17 @@ def plot_background_ts_distribution(ts_array, path, ts_type="Standard",
 
     fig = plt.figure()
 
-    df, loc, scale, frac_over = fit_background_ts(ts_array, ts_type)
+    mask = ts_array > 0.0
+
+    plt.hist([ts_array[mask], np.zeros(np.sum(~mask))],
+             bins=n_bins, lw=2, histtype='step',
+             color=['black', "grey"],
+             label=['TS > 0', "TS <= 0"],
+             density=True,
+             stacked=True)
+
+    disc_potential, df, loc, scale, frac_over = background_ts_threshold(
+        ts_array, ts_type)
 
     frac_under = 1 - frac_over
 
@@ -393,8 +405,6 @@ def plot_background_ts_distribution(ts_array, path, ts_type="Standard",
 
     max_ts = np.max(ts_array)
 
-    disc_potential = scipy.stats.chi2.ppf(five_sigma, df, loc, scale)
-
     x_range = np.linspace(0., max(max_ts, disc_potential), 100)
 
     plt.plot(x_range, frac_over * scipy.stats.chi2.pdf(x_range, df, loc, scale),
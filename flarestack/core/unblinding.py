@@ -8,7 +8,7 @@ from flarestack.core.injector import MockUnblindedInjector, \
 from flarestack.core.results import ResultsHandler
 from flarestack.core.time_pdf import TimePDF
 from flarestack.shared import name_pickle_output_dir, plot_output_dir, \
-    analysis_pickle_path, limit_output_path
+    analysis_pickle_path, limit_output_path, load_trial_results
 import pickle
 from flarestack.core.ts_distributions import plot_background_ts_distribution
 import matplotlib.pyplot as plt
@@ -250,13 +250,16 @@ def create_unblinder(unblind_dict, mock_unblind=True, full_plots=False,
                 ts_array = list()
 
                 for subdir in os.listdir(self.pickle_dir):
-                    merged_pkl = self.pickle_dir + subdir + "/merged/0.pkl"
+                    merged_path = self.pickle_dir + subdir + "/merged/0.npz"
 
-                    logging.debug("Loading {0}".format(merged_pkl))
+                    # Merged results from older versions were saved as pickles
 
-                    with open(merged_pkl) as mp:
+                    if not os.path.isfile(merged_path):
+                        merged_path = os.path.splitext(merged_path)[0] + ".pkl"
 
-                        merged_data = pickle.load(mp)
+                    logging.debug("Loading {0}".format(merged_path))
+
+                    merged_data = load_trial_results(merged_path)
 
                     ts_array += list(merged_data["TS"])
 
@@ -9,6 +9,7 @@ from flarestack.utils.make_SoB_splines import make_background_spline
 from flarestack.utils.create_acceptance_functions import make_acceptance_season
 from flarestack.core.time_pdf import TimePDF, DetectorOnOffList, FixedEndBox, \
     FixedRefBox
+from flarestack.icecube_utils.dataset_loader import remove_data_cache
 
 
 class DatasetHolder:
@@ -116,7 +117,9 @@ class Season:
         self.season_name = season_name
         self.sample_name = sample_name
         self.exp_path = exp_path
-        self.loaded_background = None
+        self.background_base = None
+        self.background_buffer = None
+        self.background_dec_index = None
         self.pseudo_mc_path = None
         self.background_dtype = None
         self._time_pdf = None
@@ -125,8 +128,40 @@ class Season:
 
     def load_background_model(self):
         """Generic function to load background data to memory. It is useful
-        for Injector, but does not always need to be used."""
-        self.loaded_background = self.get_background_model()
+        for Injector, but does not always need to be used. Only a contiguous
+        copy of the background, containing only the fields of the
+        experimental data, is kept. Scrambled datasets are made from this
+        copy, and the full background model is then discarded."""
+        background = self.get_background_model()
+
+        self.background_base = np.empty(len(background),
+                                        dtype=self.get_background_dtype())
+        for name in self.background_base.dtype.names:
+            self.background_base[name] = background[name]
+
+        del background
+
+        self.background_buffer = None
+        self.background_dec_index = None
+
+    def get_background_dec_index(self):
+        """Returns the indices which sort the background by declination,
+        and the sorted declinations. Scrambling only changes the Right
+        Ascension and time of events, so the index is the same for every
+        scrambled background, and is only created once for each season.
+
+        :return: Indices which sort the background by declination, sorted
+        declinations
+        """
+        if self.background_base is None:
+            self.load_background_model()
+
+        if self.background_dec_index is None:
+            order = np.argsort(self.background_base["dec"], kind="stable")
+            self.background_dec_index = (
+                order, np.array(self.background_base["dec"])[order])
+
+        return self.background_dec_index
 
     def set_subselection_fraction(self, subselection_fraction):
         if float(subselection_fraction) > 1.:
@@ -137,7 +172,8 @@ class Season:
 
     def get_background_dtype(self):
         if self.background_dtype is None:
-            exp = self.get_exp_data()
+            # Only the header of the data is read
+            exp = self.load_data(self.exp_path, header_only=True)
             self.background_dtype = exp.dtype
             del exp
         return self.background_dtype
@@ -153,24 +189,42 @@ class Season:
         ).copy()
         return exp
 
-    def pseudo_background(self):
+    def pseudo_background(self, reuse_buffer=False):
         """Scrambles the raw dataset to "blind" the data. Assigns a flat Right
         Ascension distribution, and randomly redistributes the arrival times
         in the dataset. Returns a shuffled dataset, which can be used for
         blinded analysis.
+
+        Only the 'ra' and 'time' fields are generated for each trial. By
+        default, these are written to a single copy of the background. If
+        reuse_buffer is True, they are instead written to a buffer which
+        is kept between calls, so that no other field is ever copied. The
+        returned array is then overwritten by the next call, and must not
+        be modified.
+
+        :param reuse_buffer: Boolean to scramble into a reusable buffer
         :return: data: The scrambled dataset
         """
-        if self.loaded_background is None:
+        if self.background_base is None:
             self.load_background_model()
-        data = np.copy(self.loaded_background)
+
+        base = self.background_base
+
+        if not reuse_buffer:
+            data = np.copy(base)
+        else:
+            if self.background_buffer is None:
+                self.background_buffer = np.copy(base)
+            data = self.background_buffer
+
         # Assigns a flat random distribution for Right Ascension
         data['ra'] = np.random.uniform(0, 2 * np.pi, size=len(data))
         # Randomly reorders the times
-        np.random.shuffle(data["time"])
-        return np.array(data[list(self.get_background_dtype().names)].copy())[:,]
+        data["time"] = base["time"][np.random.permutation(len(data))]
+        return data
 
-    def simulate_background(self):
-        data = self.pseudo_background()
+    def simulate_background(self, reuse_buffer=False):
+        data = self.pseudo_background(reuse_buffer=reuse_buffer)
         if self._subselection_fraction is not None:
             data = np.random.choice(data, int(len(data) * self._subselection_fraction))
         return data
@@ -221,8 +275,23 @@ class Season:
     def clean_season_cache(self):
         self._time_pdf = None
 
+    def clear_data_cache(self):
+        """Removes the processed copies of the data of the season, saved when
+        it is memory-mapped. These are otherwise kept indefinitely.
+        """
+        for path in self.all_paths:
+            remove_data_cache(path)
+
     def load_data(self, path, **kwargs):
-        return np.load(path)
+        try:
+            mmap_mode = kwargs["mmap_mode"]
+        except KeyError:
+            mmap_mode = None
+
+        if kwargs.get("header_only", False):
+            return np.array(np.load(path, mmap_mode="r")[:0])
+
+        return np.load(path, mmap_mode=mmap_mode)
 
     def make_injector(self, sources, **inj_kwargs):
         pass
@@ -44,7 +44,7 @@ class NTSeason(IceCubeSeason):
         mc = rename_fields(mc, {"conv": "weight"})
         return mc
 
-    def simulate_background(self):
+    def simulate_background(self, reuse_buffer=False):
         base = self.get_background_model()
 
         n_exp = np.sum(base["weight"])
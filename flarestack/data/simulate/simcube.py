@@ -102,10 +102,16 @@ class SimCubeSeason(SimSeason):
         sim_events = np.empty((0,),
                               dtype=self.event_dtype)
 
+        # The energy integrals for all declination bands are evaluated at once
+
+        all_fluence_ints, log_e_range = self.energy_integrals(
+            0.5 * (self.sin_dec_bins[:-1] + self.sin_dec_bins[1:]))
+
         for i, lower_sin_dec in enumerate(self.sin_dec_bins[:-1]):
             upper_sin_dec = self.sin_dec_bins[i + 1]
             new_events = self.simulate_dec_range(
-                fluence,lower_sin_dec, upper_sin_dec)
+                fluence,lower_sin_dec, upper_sin_dec,
+                fluence_ints=all_fluence_ints[i], log_e_range=log_e_range)
 
             logging.info("Simulated {0} events between sin(dec)={1} and "
                   "sin(dec)={2}".format(
@@ -120,16 +126,41 @@ class SimCubeSeason(SimSeason):
 
         return sim_events
 
-    def simulate_dec_range(self, fluence, lower_sin_dec, upper_sin_dec):
+    def energy_integrals(self, sin_dec):
+        """Integrates the product of the effective area and the background
+        energy PDF over each energy bin, for an array of declinations at
+        once.
+
+        :param sin_dec: Array of sin(declination) values
+        :return: Array of integrals, with one row per declination, and the
+        log10(energy) bin edges
+        """
+        sin_dec = np.asarray(sin_dec)[:, np.newaxis]
+
+        def source_eff_area(e):
+            return self.effective_area_f(
+                np.log10(e), sin_dec) * self.bkg_energy_pdf.f(e)
+
+        fluence_ints, log_e_range = \
+            self.bkg_energy_pdf.piecewise_integrate_over_energy(
+                source_eff_area)
+
+        fluence_ints = np.broadcast_to(
+            fluence_ints, (len(sin_dec), fluence_ints.shape[-1]))
+
+        return fluence_ints, log_e_range
+
+    def simulate_dec_range(self, fluence, lower_sin_dec, upper_sin_dec,
+                           fluence_ints=None, log_e_range=None):
         mean_sin_dec = 0.5 * (lower_sin_dec + upper_sin_dec)
         solid_angle = 2 * np.pi * (upper_sin_dec - lower_sin_dec)
         sim_fluence = fluence * solid_angle # GeV^-1 cm^-2
 
-        def source_eff_area(e):
-            return self.effective_area_f(
-                np.log10(e), mean_sin_dec) * self.bkg_energy_pdf.f(e)
+        if fluence_ints is None:
+            fluence_ints, log_e_range = self.energy_integrals([mean_sin_dec])
+            fluence_ints = fluence_ints[0]
 
-        int_eff_a = self.bkg_energy_pdf.integrate_over_E(source_eff_area)
+        int_eff_a = np.sum(fluence_ints)
 
         # Effective areas are given in m2, but flux is in per cm2
 
@@ -149,17 +180,10 @@ class SimCubeSeason(SimSeason):
         new_events["dec"] = np.arcsin(new_events["sinDec"])
         new_events["time"] = self.get_time_pdf().simulate_times([], n_sim)
 
-        fluence_ints, log_e_range = \
-            self.bkg_energy_pdf.piecewise_integrate_over_energy(
-            source_eff_area
-        )
-        fluence_ints = fluence_ints
-
         fluence_ints = np.array(fluence_ints)
         fluence_ints /= np.sum(fluence_ints)
 
-        fluence_cumulative = [np.sum(fluence_ints[:i])
-                              for i, _ in enumerate(fluence_ints)]
+        fluence_cumulative = [0.] + list(np.cumsum(fluence_ints)[:-1])
 
         fluence_cumulative = [0.] + fluence_cumulative + [1.]
 
@@ -167,8 +191,8 @@ class SimCubeSeason(SimSeason):
 
         sim_true_e = interp1d(fluence_cumulative, log_e_range)
 
-        true_e_vals = np.array(
-            [10**sim_true_e(random.random()) for _ in range(n_sim)])
+        true_e_vals = 10**sim_true_e(
+            np.array([random.random() for _ in range(n_sim)]))
 
         new_events["logE"] = self.energy_proxy_map(true_e_vals)
 
@@ -1,25 +1,65 @@
+import os
+import logging
 import numpy as np
 from numpy.lib.recfunctions import append_fields, rename_fields
-from flarestack.shared import min_angular_err
+from flarestack.shared import min_angular_err, data_cache_path
 from scipy.interpolate import interp1d
 
-def data_loader(data_path, floor=True, cut_fields=True):
+def data_loader(data_path, floor=True, cut_fields=True, mmap_mode=None,
+                header_only=False):
     """Helper function to load data for a given season/set of season.
     Adds sinDec field if this is not available, and combines multiple years
     of data is appropriate (different sets of data from the same icecube
     configuration should be given as a list)
 
+    If mmap_mode is specified (e.g 'r'), the processed dataset is instead
+    saved to disk the first time it is needed, and is then opened as a
+    memory-map. Nothing is read until it is accessed, and the memory is
+    shared between all processes using the same dataset.
+
+    If header_only is True, only the header of the original file is read,
+    and an empty dataset with the processed dtype is returned.
+
     :param data_path: Path to data or list of paths to data
     :param cut_fields: Boolean to remove unused fields from datasets on loading
+    :param mmap_mode: Mode with which to memory-map the processed dataset
+    :param header_only: Boolean to return an empty dataset with the dtype
     :return: Loaded Dataset (experimental or MC)
     """
 
+    if header_only:
+        if isinstance(data_path, list):
+            data_path = data_path[0]
+        dataset = np.array(np.load(data_path, mmap_mode="r")[:0])
+        return process_dataset(dataset, floor, cut_fields)
+
+    if mmap_mode is not None:
+        path = make_data_cache(data_path, floor, cut_fields)
+        return np.load(path, mmap_mode=mmap_mode)
+
     if isinstance(data_path, list):
         dataset = np.concatenate(
             tuple([np.load(x) for x in data_path]))
     else:
         dataset = np.load(data_path)
 
+    return process_dataset(dataset, floor, cut_fields)
+
+
+def process_dataset(dataset, floor=True, cut_fields=True):
+    """Converts a raw dataset to the standard flarestack format. Adds a
+    sinDec field if this is not available, renames fields to the standard
+    names, saves the original angular error as 'raw_sigma' and applies the
+    minimum angular error floor. Any change to this processing must be
+    accompanied by an increment of data_cache_version in flarestack.shared,
+    so that previously cached datasets are remade.
+
+    :param dataset: Raw dataset
+    :param floor: Boolean to apply the minimum angular error floor
+    :param cut_fields: Boolean to remove unused fields from datasets
+    :return: Processed dataset
+    """
+
     if "sinDec" not in dataset.dtype.names:
 
         new_dtype = np.dtype([("sinDec", np.float)])
@@ -67,6 +107,61 @@ def data_loader(data_path, floor=True, cut_fields=True):
     return dataset
 
 
+def make_data_cache(data_path, floor=True, cut_fields=True):
+    """Saves the processed version of a dataset, if this has not been done
+    already, or if the original data has been modified since. The file is
+    written under a temporary name and then moved, so that parallel
+    processes never read an incomplete file.
+
+    :param data_path: Path to data or list of paths to data
+    :param floor: Boolean to apply the minimum angular error floor
+    :param cut_fields: Boolean to remove unused fields from datasets
+    :return: Path to processed dataset
+    """
+
+    path = data_cache_path(data_path, floor, cut_fields)
+
+    if isinstance(data_path, list):
+        raw_paths = data_path
+    else:
+        raw_paths = [data_path]
+
+    if os.path.isfile(path):
+        if os.path.getmtime(path) >= max(
+                [os.path.getmtime(x) for x in raw_paths]):
+            return path
+
+    dataset = data_loader(data_path, floor=floor, cut_fields=cut_fields)
+
+    logging.info("Saving processed data to {0}".format(path))
+
+    temp_path = "{0}.{1}.tmp".format(path, os.getpid())
+
+    with open(temp_path, "wb") as f:
+        np.save(f, np.ascontiguousarray(dataset))
+
+    os.replace(temp_path, path)
+
+    return path
+
+
+def remove_data_cache(data_path, floor=True, cut_fields=True):
+    """Removes the processed copy of a dataset saved by make_data_cache, if
+    it exists. Cached copies are never removed automatically, so this
+    should be used for datasets which are themselves temporary.
+
+    :param data_path: Path to data or list of paths to data
+    :param floor: Boolean to apply the minimum angular error floor
+    :param cut_fields: Boolean to remove unused fields from datasets
+    """
+    path = data_cache_path(data_path, floor, cut_fields)
+
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
 def grl_loader(season):
 
     if isinstance(season.grl_path, list):
@@ -33,6 +33,7 @@ log_dir = cluster_dir + "logs/"
 
 cache_dir = storage_dir + "cache/"
 cat_cache_dir = cache_dir + "catalogue_cache/"
+data_cache_dir = cache_dir + "data_cache/"
 
 public_dataset_dir = input_dir + "public_datasets/"
 sim_dataset_dir = input_dir + "sim_datasets/"
@@ -68,7 +69,7 @@ all_dirs = [
     log_dir, catalogue_dir, acc_f_dir, energy_spline_dir, pickle_dir, plots_dir,
     SoB_spline_dir, analysis_dir, illustration_dir, transients_dir,
     bkg_spline_dir, dataset_plot_dir, limits_dir, pull_dir, floor_dir,
-    cache_dir, cat_cache_dir, public_dataset_dir, energy_proxy_dir,
+    cache_dir, cat_cache_dir, data_cache_dir, public_dataset_dir, energy_proxy_dir,
     eff_a_plot_dir, med_ang_res_dir, ang_res_plot_dir, energy_proxy_plot_dir,
     sim_dataset_dir
 ]
@@ -115,6 +116,12 @@ min_angular_err = np.deg2rad(0.2)
 
 base_floor_quantile = 0.25
 
+# Version of the processing applied to datasets saved in the data cache.
+# This must be incremented whenever process_dataset is changed, so that
+# cached datasets made with the old processing are not reused.
+
+data_cache_version = 1
+
 
 def floor_pickle(floor_dict):
     hash_dict = dict(floor_dict)
@@ -147,35 +154,25 @@ def llh_energy_hash_pickles(llh_dict, season):
     return SoB_path, acc_path
 
 
-band_mask_chunk_size = 100
-
-
-def band_mask_hash_dir(catalogue):
-    return cat_cache_dir + str(zlib.adler32(catalogue)) + "/"
-
-
-def band_mask_cache_name(season, catalogue):
-    n_chunks = int((len(catalogue) + band_mask_chunk_size - 1) \
-               / band_mask_chunk_size)
-    logging.info("Breaking catalogue into {0} chunks of {1}".format(n_chunks, band_mask_chunk_size))
-
-    cats = []
-    mask_indices = []
-    source_indices = []
-
-    for i in range(n_chunks):
-        cat = catalogue[(i*band_mask_chunk_size):((i+1) * band_mask_chunk_size)]
-        cats.append(cat)
-        mask_indices += [i for _ in range(band_mask_chunk_size)]
-        source_indices += [x for x in range(band_mask_chunk_size)]
+def data_cache_path(data_path, floor, cut_fields):
+    """Path to the preprocessed copy of a dataset, which is saved once and
+    then memory-mapped when loaded. The name depends on the original path(s),
+    on the processing options and on the version of the processing. Cached
+    copies are not removed automatically (see remove_data_cache).
 
-    paths = [band_mask_hash_dir(cat) + season.sample_name + "/" +
-             season.season_name + ".npz" for cat in cats]
-
-    mask_indices = mask_indices[:len(catalogue)]
-    source_indices = source_indices[:len(catalogue)]
-
-    return cats, paths, mask_indices, source_indices
+    :param data_path: Path to data or list of paths to data
+    :param floor: Boolean to apply the minimum angular error floor
+    :param cut_fields: Boolean to remove unused fields from datasets
+    :return: Path to cached data
+    """
+    hash_dict = {
+        "data_path": data_path,
+        "floor": floor,
+        "cut_fields": cut_fields,
+        "min_angular_err": min_angular_err,
+        "data_cache_version": data_cache_version
+    }
+    return data_cache_dir + str(deterministic_hash(hash_dict)) + ".npy"
 
 
 def name_pickle_output_dir(name):
@@ -215,6 +212,11 @@ def SoB_spline_path(season):
            season.season_name + '.pkl'
 
 
+def SoB_grid_path(season):
+    return SoB_spline_dir + season.sample_name + "/" + \
+           season.season_name + '_grid.npz'
+
+
 def bkg_spline_path(season):
     return bkg_spline_dir + season.sample_name + "/" + \
            season.season_name + '.pkl'
@@ -267,6 +269,10 @@ def flux_to_k(flux):
     return flux / k_flux_factor
 
 
+# Prefix for the parameter columns of saved trial results
+trial_param_prefix = "Parameters/"
+
+
 def scale_shortener(scale):
     """Function to trim number of significant figures for flux scales when
     required for dictionary keys or saving pickle files.
@@ -277,6 +283,76 @@ def scale_shortener(scale):
     return '{0:.4G}'.format(float(scale))
 
 
+def save_trial_results(results, path):
+    """Saves the results of a set of trials as a columnar .npz file, with
+    one array each for the TS, the flags and every fit parameter. The file
+    is first written under a temporary name, so that no partially-written
+    results are ever read.
+
+    :param results: Dictionary of Minimisation results from trials
+    :param path: Path of .npz file
+    """
+    columns = {
+        "TS": np.array(results["TS"]),
+        "Flags": np.array(results["Flags"])
+    }
+
+    for (key, val) in results["Parameters"].items():
+        columns[trial_param_prefix + key] = np.array(val)
+
+    temp_path = path + ".tmp"
+
+    with open(temp_path, "wb") as f:
+        np.savez(f, **columns)
+
+    os.replace(temp_path, path)
+
+
+def load_trial_results(path):
+    """Loads the results of a set of trials, saved either as a columnar .npz
+    file or (for older results) as a pickle file.
+
+    :param path: Path of results file
+    :return: Dictionary of Minimisation results, with one array per column
+    """
+    if os.path.splitext(path)[1] == ".pkl":
+        with open(path, "rb") as f:
+            data = pickle.load(f)
+        return {
+            "TS": np.array(data["TS"]),
+            "Parameters": dict([(key, np.array(val)) for (key, val)
+                                in data["Parameters"].items()]),
+            "Flags": np.array(data["Flags"])
+        }
+
+    with np.load(path, allow_pickle=True) as f:
+        return {
+            "TS": f["TS"],
+            "Parameters": dict([
+                (key[len(trial_param_prefix):], f[key]) for key in f.files
+                if key.startswith(trial_param_prefix)]),
+            "Flags": f["Flags"]
+        }
+
+
+def merge_trial_results(all_results):
+    """Concatenates the results of several sets of trials, column by column.
+
+    :param all_results: List of results dictionaries
+    :return: Merged results dictionary
+    """
+    def concatenate(columns):
+        return np.concatenate([np.atleast_1d(x) for x in columns])
+
+    return {
+        "TS": concatenate([x["TS"] for x in all_results]),
+        "Parameters": dict([
+            (key, concatenate([x["Parameters"][key] for x in all_results]))
+            for key in all_results[0]["Parameters"].keys()]),
+        "Flags": concatenate([x["Flags"] for x in all_results])
+    }
+
+
 def analysis_pickle_path(name):
     """Converts a unique Minimisation Handler name to a corresponding analysis
     config pickle. This pickle can be used to run a Minimisation Handler.
@@ -4,7 +4,7 @@ import os
 import scipy.interpolate
 import pickle as Pickle
 from flarestack.shared import gamma_precision, SoB_spline_path, \
-    bkg_spline_path, dataset_plot_dir, get_base_sob_plot_dir
+    bkg_spline_path, dataset_plot_dir, get_base_sob_plot_dir, SoB_grid_path
 from flarestack.core.energy_pdf import PowerLaw
 from flarestack.icecube_utils.dataset_loader import data_loader
 import matplotlib.pyplot as plt
@@ -26,6 +26,53 @@ gamma_points = np.arange(0.7, 4.3, gamma_precision)
 gamma_support_points = set([_around(i) for i in gamma_points])
 
 
+class LazySupportPointCache(object):
+    """Dictionary-like cache of arrays evaluated at gamma support points.
+    Rather than evaluating every support point up front, the value for a
+    given support point is only calculated the first time it is accessed.
+    As the minimiser typically only visits a few gamma values, only the
+    corresponding nodes (and their neighbours used in the Taylor
+    expansion) are ever evaluated. The number of cache hits and misses are
+    counted, to monitor the performance of the cache.
+    """
+
+    def __init__(self, f, support_points):
+        """
+        :param f: Function to evaluate the array for a given support point
+        :param support_points: Gamma values which can be evaluated
+        """
+        self.f = f
+        self.support_points = set(support_points)
+        self.cache = dict()
+        self.hits = 0
+        self.misses = 0
+
+    def __getitem__(self, gamma):
+        try:
+            val = self.cache[gamma]
+            self.hits += 1
+        except KeyError:
+            if gamma not in self.support_points:
+                raise KeyError("{0} is not a support point of the "
+                               "cache".format(gamma))
+            val = self.f(gamma)
+            self.cache[gamma] = val
+            self.misses += 1
+        return val
+
+    def __contains__(self, gamma):
+        return gamma in self.support_points
+
+    def __iter__(self):
+        return iter(sorted(self.support_points))
+
+    def __len__(self):
+        return len(self.support_points)
+
+    def keys(self):
+        return sorted(self.support_points)
+
+
 def create_2d_hist(sin_dec, log_e, sin_dec_bins, log_e_bins, weights):
     """Creates a 2D histogram for a set of data (Experimental or Monte
     Carlo), in which the dataset is binned by sin(Declination) and
@@ -416,6 +463,201 @@ def load_spline(season):
     return res
 
 
+# Number of grid points per histogram bin, in each dimension, for the
+# Log(Signal/Background) grid
+
+SoB_grid_oversampling = 4
+
+
+class SoBGrid(object):
+    """Log(Signal/Background) values for every gamma support point, evaluated
+    on a regular (gamma, sin(Declination), Log(Energy)) grid and stored as a
+    single array. Values are found by linear interpolation on the grid,
+    which can be done for all events at once. Events lying outside the
+    grid are assigned the value at the edge of the grid.
+    """
+
+    def __init__(self, gamma, sin_dec, log_e, log_SoB):
+        """
+        :param gamma: Gamma values of grid
+        :param sin_dec: Sin(Declination) values of grid
+        :param log_e: Log(Energy/GeV) values of grid
+        :param log_SoB: Log(Signal/Background) array, with shape
+        (n_gamma, n_sin_dec, n_log_e)
+        """
+        self.gamma = np.array(gamma)
+        self.sin_dec = np.array(sin_dec)
+        self.log_e = np.array(log_e)
+        self.log_SoB = np.array(log_SoB).reshape(len(self.gamma), -1)
+
+    @staticmethod
+    def axis_weights(axis, x):
+        """Finds the index of the lower grid point, and the linear
+        interpolation weight of the upper grid point, for each value of x.
+
+        :param axis: Regularly-spaced grid values
+        :param x: Values to be interpolated
+        :return: Lower index, weight of upper grid point
+        """
+        step = (axis[-1] - axis[0]) / (len(axis) - 1.)
+        pos = np.clip((np.asarray(x) - axis[0]) / step, 0., len(axis) - 1.)
+        index = np.minimum(pos.astype(np.int), len(axis) - 2)
+        return index, pos - index
+
+    def interpolation_weights(self, log_e, sin_dec):
+        """Finds the four neighbouring grid points for each event, and the
+        bilinear interpolation weight for each of them. These do not depend
+        on gamma, so need only be calculated once for each event.
+
+        :param log_e: Log(Energy/GeV) of events
+        :param sin_dec: Sin(Declination) of events
+        :return: Flattened grid indices and weights, with shape (4, n_events)
+        """
+        i_s, w_s = self.axis_weights(self.sin_dec, sin_dec)
+        i_e, w_e = self.axis_weights(self.log_e, log_e)
+
+        n_e = len(self.log_e)
+
+        index = np.array([
+            i_s * n_e + i_e,
+            i_s * n_e + i_e + 1,
+            (i_s + 1) * n_e + i_e,
+            (i_s + 1) * n_e + i_e + 1
+        ])
+
+        weights = np.array([
+            (1. - w_s) * (1. - w_e),
+            (1. - w_s) * w_e,
+            w_s * (1. - w_e),
+            w_s * w_e
+        ])
+
+        return index, weights
+
+    def ev(self, gamma, log_e, sin_dec):
+        """Evaluates Log(Signal/Background) for all events, at any value of
+        gamma, by trilinear interpolation.
+
+        :param gamma: Spectral Index
+        :param log_e: Log(Energy/GeV) of events
+        :param sin_dec: Sin(Declination) of events
+        :return: Log(Signal/Background) values
+        """
+        index, weights = self.interpolation_weights(log_e, sin_dec)
+        i_g, w_g = self.axis_weights(self.gamma, gamma)
+
+        return (1. - w_g) * np.sum(self.log_SoB[i_g][index] * weights,
+                                   axis=0) + \
+            w_g * np.sum(self.log_SoB[i_g + 1][index] * weights, axis=0)
+
+    def interpolate(self, values, log_e, sin_dec):
+        """Interpolates an array with one value per (sin(Declination),
+        Log(Energy)) grid point to the given events. As the bilinear
+        weights are positive and sum to 1, an upper bound on the values at
+        the grid points is also an upper bound on any interpolated value.
+
+        :param values: Array with one entry per grid point
+        :param log_e: Log(Energy/GeV) of events
+        :param sin_dec: Sin(Declination) of events
+        :return: Interpolated values for each event
+        """
+        index, weights = self.interpolation_weights(log_e, sin_dec)
+        return np.sum(values[index] * weights, axis=0)
+
+    def create_node_cache(self):
+        """Creates a cache of the Log(Signal/Background) values at the grid
+        points themselves, for each gamma value of the grid.
+
+        :return: Dictionary-like cache containing SoB values for each grid
+        point for each gamma value.
+        """
+        gamma_index = dict(
+            [(gamma, i) for i, gamma in enumerate(self.gamma.tolist())])
+
+        return LazySupportPointCache(
+            lambda gamma: self.log_SoB[gamma_index[gamma]],
+            gamma_index.keys())
+
+    def create_cache(self, log_e, sin_dec):
+        """Creates a cache of Log(Signal/Background) values for the given
+        events, at each gamma value of the grid. The interpolation weights
+        are calculated once, and each gamma value is then only evaluated
+        when first needed.
+
+        :param log_e: Log(Energy/GeV) of events
+        :param sin_dec: Sin(Declination) of events
+        :return: Dictionary-like cache containing SoB values for each event
+        for each gamma value.
+        """
+        index, weights = self.interpolation_weights(log_e, sin_dec)
+
+        gamma_index = dict(
+            [(gamma, i) for i, gamma in enumerate(self.gamma.tolist())])
+
+        def f(gamma):
+            return np.sum(self.log_SoB[gamma_index[gamma]][index] * weights,
+                          axis=0)
+
+        return LazySupportPointCache(f, gamma_index.keys())
+
+
+def make_SoB_grid(season, splines=None):
+    """Evaluates the Log(Signal/Background) splines of a season on a regular
+    grid of sin(Declination) and Log(Energy), for every gamma support
+    point, and saves the resulting array.
+
+    :param season: Season to be evaluated
+    :param splines: Dictionary of splines (loaded if not given)
+    """
+    if splines is None:
+        splines = load_spline(season)
+
+    path = SoB_grid_path(season)
+
+    gamma = np.array(sorted(splines.keys()))
+
+    sin_dec = np.linspace(
+        season.sin_dec_bins[0], season.sin_dec_bins[-1],
+        SoB_grid_oversampling * (len(season.sin_dec_bins) - 1) + 1)
+
+    log_e = np.linspace(
+        season.log_e_bins[0], season.log_e_bins[-1],
+        SoB_grid_oversampling * (len(season.log_e_bins) - 1) + 1)
+
+    log_SoB = np.array([splines[x](log_e, sin_dec).T for x in gamma])
+
+    logging.info("Saving to {0}".format(path))
+
+    try:
+        os.makedirs(os.path.dirname(path))
+    except OSError:
+        pass
+
+    np.savez(path, gamma=gamma, sin_dec=sin_dec, log_e=log_e,
+             log_SoB=log_SoB)
+
+
+def load_SoB_grid(season):
+    """Loads the Log(Signal/Background) grid of a season. The grid is
+    created from the splines if it does not exist, or if the splines have
+    been updated since the grid was created.
+
+    :param season: Season to be loaded
+    :return: SoBGrid object
+    """
+    path = SoB_grid_path(season)
+    spline_path = SoB_spline_path(season)
+
+    if not os.path.isfile(path) or (
+            os.path.getmtime(path) < os.path.getmtime(spline_path)):
+        make_SoB_grid(season)
+
+    logging.debug("Loading from {0}".format(path))
+
+    with np.load(path) as f:
+        return SoBGrid(f["gamma"], f["sin_dec"], f["log_e"], f["log_SoB"])
+
+
 def load_bkg_spatial_spline(season):
     path = bkg_spline_path(season)
 
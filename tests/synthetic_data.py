@@ -0,0 +1,144 @@
+"""Synthetic seasons and catalogues for tests which simulate and fit trials,
+without relying on the published IceCube datasets. All data is generated
+from a fixed seed, so that a season with a given name always contains the
+same events.
+"""
+import os
+import glob
+import shutil
+import numpy as np
+from flarestack.data import SeasonWithMC, Dataset
+from flarestack.icecube_utils.dataset_loader import data_loader, \
+    remove_data_cache
+from flarestack.utils.prepare_catalogue import cat_dtype
+from flarestack.shared import get_base_sob_plot_dir
+
+
+class SyntheticSeason(SeasonWithMC):
+    """Season with uniformly distributed experimental data and MC with a
+    true energy spectrum of E^-1, lasting one year.
+    """
+
+    def __init__(self, temp_dir, season_name="synthetic", n_exp=int(2e4),
+                 n_mc=int(6e4), seed=1):
+        exp_path = os.path.join(temp_dir, season_name + "_exp.npy")
+        mc_path = os.path.join(temp_dir, season_name + "_mc.npy")
+
+        make_season_files(exp_path, mc_path, n_exp, n_mc, seed)
+
+        SeasonWithMC.__init__(
+            self, season_name,
+            "SyntheticSample_{0}_{1}_{2}".format(n_exp, n_mc, seed),
+            exp_path, mc_path
+        )
+        self.sin_dec_bins = np.linspace(-1., 1., 21)
+        self.log_e_bins = np.linspace(1., 8., 25)
+
+        # Plots of the background spline are saved to this directory
+
+        try:
+            os.makedirs(get_base_sob_plot_dir(self))
+        except OSError:
+            pass
+
+    def load_data(self, path, **kwargs):
+        return data_loader(path, **kwargs)
+
+
+def make_season_files(exp_path, mc_path, n_exp, n_mc, seed):
+    """Saves synthetic experimental data and MC to the given paths.
+
+    :param exp_path: Path for experimental data
+    :param mc_path: Path for MC
+    :param n_exp: Number of experimental events
+    :param n_mc: Number of MC events
+    :param seed: Random seed
+    """
+    rng = np.random.RandomState(seed)
+
+    exp_dtype = [("ra", np.float), ("dec", np.float), ("logE", np.float),
+                 ("sigma", np.float), ("time", np.float)]
+
+    exp = np.empty(n_exp, dtype=exp_dtype)
+    exp["ra"] = rng.uniform(0., 2 * np.pi, n_exp)
+    exp["dec"] = np.arcsin(rng.uniform(-1., 1., n_exp))
+    exp["logE"] = 2. + rng.exponential(0.6, n_exp)
+    exp["sigma"] = np.deg2rad(rng.uniform(0.1, 3., n_exp))
+    exp["time"] = rng.uniform(55000., 55365., n_exp)
+    np.save(exp_path, exp)
+
+    mc = np.empty(n_mc, dtype=exp_dtype + [
+        ("trueRa", np.float), ("trueDec", np.float), ("trueE", np.float),
+        ("ow", np.float)])
+    mc["trueRa"] = rng.uniform(0., 2 * np.pi, n_mc)
+    mc["trueDec"] = np.arcsin(rng.uniform(-1., 1., n_mc))
+    mc["sigma"] = np.deg2rad(rng.uniform(0.1, 2., n_mc))
+    mc["ra"] = (mc["trueRa"] + rng.normal(0., 1., n_mc) * mc["sigma"]) % \
+        (2 * np.pi)
+    mc["dec"] = np.clip(
+        mc["trueDec"] + rng.normal(0., 1., n_mc) * mc["sigma"],
+        -np.pi / 2. + 1.e-6, np.pi / 2. - 1.e-6)
+    mc["trueE"] = 10. ** rng.uniform(2., 7., n_mc)
+    mc["logE"] = np.log10(mc["trueE"]) + rng.normal(0., 0.3, n_mc)
+    mc["time"] = 0.
+    mc["ow"] = mc["trueE"] * 1.e3
+    np.save(mc_path, mc)
+
+
+def make_dataset(temp_dir, *season_names, **kwargs):
+    """Creates a Dataset of synthetic seasons.
+
+    :param temp_dir: Directory for the season files
+    :param season_names: Names of the seasons
+    :return: Dataset
+    """
+    dataset = Dataset()
+
+    for i, name in enumerate(season_names or ["synthetic"]):
+        dataset.add_season(SyntheticSeason(temp_dir, name, seed=i + 1,
+                                           **kwargs))
+
+    return dataset
+
+
+def make_catalogue(temp_dir, n_sources=1, seed=3, start_time_mjd=55100.,
+                   end_time_mjd=55200.):
+    """Saves a catalogue of sources at random positions.
+
+    :param temp_dir: Directory for the catalogue
+    :param n_sources: Number of sources
+    :param seed: Random seed
+    :param start_time_mjd: Start time of each source
+    :param end_time_mjd: End time of each source
+    :return: Path to catalogue
+    """
+    rng = np.random.RandomState(seed)
+
+    cat = np.empty(n_sources, dtype=cat_dtype)
+    cat["ra_rad"] = rng.uniform(0., 2 * np.pi, n_sources)
+    cat["dec_rad"] = np.arcsin(rng.uniform(-0.8, 0.8, n_sources))
+    cat["base_weight"] = 1.
+    cat["injection_weight_modifier"] = 1.
+    cat["ref_time_mjd"] = start_time_mjd
+    cat["start_time_mjd"] = start_time_mjd
+    cat["end_time_mjd"] = end_time_mjd
+    cat["distance_mpc"] = rng.uniform(1., 10., n_sources)
+    cat["source_name"] = ["source_{0}".format(i) for i in range(n_sources)]
+
+    path = os.path.join(temp_dir, "catalogue_{0}_{1}.npy".format(
+        n_sources, seed))
+    np.save(path, cat)
+
+    return path
+
+
+def remove_synthetic_data(temp_dir):
+    """Removes a directory of synthetic data, and the processed copies of
+    the data saved when it was memory-mapped.
+
+    :param temp_dir: Directory for the season files
+    """
+    for path in glob.glob(os.path.join(temp_dir, "*.npy")):
+        remove_data_cache(path)
+
+    shutil.rmtree(temp_dir)
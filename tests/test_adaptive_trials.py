@@ -0,0 +1,139 @@
+"""Test the adaptive allocation of trials, using a stub MinimisationHandler
+with a known fraction of signal-like trials at each flux scale, and the
+interpolated crossing used when the sensitivity or discovery potential curve
+cannot be fitted.
+"""
+import logging
+import random
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+from flarestack.core.adaptive_trials import AdaptiveTrials, \
+    interpolate_crossing, adaptive_window
+from flarestack.shared import k_to_flux
+
+
+class StubMinimisationHandler(object):
+    """Returns a TS far above the discovery threshold with a probability
+    of 1 - exp(-scale), and otherwise a TS drawn from a chi2 distribution
+    with one degree of freedom. Above the background median, the fraction
+    of trials is then 1 - 0.5 exp(-scale), reaching 90% at a scale of
+    ln(5). Above the 5 sigma threshold, the fraction of trials is
+    1 - exp(-scale), reaching 50% at a scale of ln(2).
+    """
+    param_names = ["n_s"]
+
+    def __init__(self, pickle_output_dir):
+        self.pickle_output_dir = pickle_output_dir
+        self.n_trials = dict()
+
+    def prepare_dataset(self, scale, seed):
+        return scale, np.random.RandomState(seed)
+
+    def run_trial(self, full_dataset):
+        (scale, rng) = full_dataset
+
+        self.n_trials[scale] = self.n_trials.get(scale, 0) + 1
+
+        if rng.uniform() < 1. - np.exp(-scale):
+            ts = 1.e3
+        else:
+            ts = rng.chisquare(1.)
+
+        return {"TS": ts, "Parameters": {"n_s": 0.}, "Flag": 0}
+
+    def dump_results(self, results, scale, seed):
+        pass
+
+    def dump_injection_values(self, scale):
+        pass
+
+
+class TestAdaptiveTrials(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_run(self):
+
+        logging.info("Testing adaptive allocation of trials.")
+
+        tolerance = 0.1
+
+        mh_dict = {"scale": 4., "n_steps": 5, "n_trials": 50}
+
+        # The stub replaces the MinimisationHandler built from mh_dict
+
+        stub = StubMinimisationHandler(self.temp_dir)
+
+        with mock.patch("flarestack.core.adaptive_trials.MinimisationHandler."
+                        "create", return_value=stub):
+            at = AdaptiveTrials(mh_dict, n_background=1000,
+                                n_trials_per_round=600, tolerance=tolerance,
+                                n_cpu=1)
+
+        # Seeds of each set of trials are drawn with the random module
+
+        random.seed(5)
+
+        sens, disc = at.run()
+
+        true_sens = np.log(5.)
+        true_disc = np.log(2.)
+
+        self.assertLess(at.sensitivity_error, tolerance)
+        self.assertLess(at.disc_potential_error, tolerance)
+
+        self.assertAlmostEqual(sens / k_to_flux(1.), true_sens,
+                               delta=3 * tolerance * true_sens)
+        self.assertAlmostEqual(disc / k_to_flux(1.), true_disc,
+                               delta=3 * tolerance * true_disc)
+
+        # Later rounds are placed close to each crossing, rather than on the
+        # initial grid of scales, which has at most 100 trials close to
+        # either crossing
+
+        n_trials = at.mh.n_trials
+
+        self.assertEqual(n_trials[0.], 1000)
+
+        for scale in [1., 2., 3., 4.]:
+            self.assertEqual(n_trials[scale], 50)
+
+        for crossing in [true_sens, true_disc]:
+            n_near = np.sum([
+                n for (scale, n) in n_trials.items()
+                if crossing / adaptive_window <= scale <=
+                crossing * adaptive_window])
+            self.assertGreater(n_near, 200)
+
+        self.assertEqual(
+            np.sum(list(n_trials.values())),
+            np.sum([len(x) for x in at.ts.values()]))
+
+    def test_interpolate_crossing(self):
+
+        logging.info("Testing interpolated crossing.")
+
+        x = np.array([0., 1., 2., 3., 4.])
+
+        crossing, f = interpolate_crossing(x, [0., 0.2, 0.4, 0.8, 1.], 0.5)
+        self.assertAlmostEqual(crossing, 2.25)
+        self.assertAlmostEqual(f(crossing), 0.5)
+
+        # Fractions are made non-decreasing before interpolating
+
+        crossing, f = interpolate_crossing(x, [0., 0.6, 0.3, 0.8, 1.], 0.5)
+        self.assertAlmostEqual(crossing, 1. - 1. / 6.)
+
+        crossing, f = interpolate_crossing(x, [0., 0.1, 0.2, 0.3, 0.4], 0.5)
+        self.assertTrue(np.isnan(crossing))
+
+
+if __name__ == '__main__':
+    unittest.main()
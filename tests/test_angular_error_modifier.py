@@ -0,0 +1,140 @@
+"""Test that the angular error floors and pull corrections, which are
+evaluated for all events at once, give the same values and shapes as an
+evaluation for each event in turn. Each class is built directly from
+synthetic support points, so no pickled floor or pull files are required.
+"""
+import logging
+import unittest
+import numpy as np
+from scipy.interpolate import interp1d, RectBivariateSpline
+from flarestack.core.angular_error_modifier import BaseFloorClass, \
+    StaticFloor, QuantileFloor0D, QuantileFloorEParam0D, \
+    BaseMedianAngularErrorModifier, MedianPullEParam0D, MedianPull2D, \
+    MedianPullEParam2D
+from flarestack.shared import min_angular_err
+
+log_e_points = np.linspace(1., 7., 13)
+sin_dec_points = np.linspace(-1., 1., 11)
+gamma_points = np.linspace(1., 4., 7)
+
+floor_grid = np.random.RandomState(0).uniform(
+    0.001, 0.01, (len(log_e_points), len(gamma_points)))
+pull_grid = np.random.RandomState(1).normal(
+    0., 0.2, (len(log_e_points), len(sin_dec_points)))
+pull_0d = 0.1
+gamma = [2.5]
+
+
+def simulate_events(n_events, seed=42):
+    rng = np.random.RandomState(seed)
+    data = np.empty(n_events, dtype=[
+        ("logE", np.float), ("sinDec", np.float), ("raw_sigma", np.float),
+        ("sigma", np.float)])
+    data["logE"] = rng.uniform(1., 7., n_events)
+    data["sinDec"] = rng.uniform(-1., 1., n_events)
+    data["raw_sigma"] = rng.uniform(0., 0.02, n_events)
+    data["sigma"] = data["raw_sigma"]
+    return data
+
+
+def make_class(cls, **attributes):
+    """Builds a floor or pull class without loading or creating its pickle.
+    """
+    obj = cls.__new__(cls)
+    for (key, val) in attributes.items():
+        setattr(obj, key, val)
+    return obj
+
+
+floor_0d_e_f = interp1d(gamma_points, floor_grid[0])
+floor_1d_e_f = RectBivariateSpline(
+    log_e_points, gamma_points, np.log(floor_grid), kx=1, ky=1, s=0)
+pull_2d_f = RectBivariateSpline(log_e_points, sin_dec_points, pull_grid)
+
+# Each floor and pull function, evaluated for each event in turn
+
+per_event_functions = {
+    "BaseFloorClass": lambda data: np.array([0. for _ in data]),
+    "StaticFloor": lambda data: np.array([min_angular_err for _ in data]),
+    "QuantileFloor0D": lambda data: np.array([floor_grid[0, 0] for _ in data]),
+    "QuantileFloorEParam0D": lambda data: np.array(
+        [floor_0d_e_f(gamma) for _ in data]),
+    "QuantileFloorEParam1D": lambda data: np.array(
+        [np.exp(floor_1d_e_f(x["logE"], gamma[0])[0]) for x in data]).T,
+    "BaseMedianAngularErrorModifier": lambda data: np.array(
+        [1. for _ in data]),
+    "MedianPullEParam0D": lambda data: np.array([pull_0d for _ in data]),
+    "MedianPull2D": lambda data: np.array(
+        [pull_2d_f(x["logE"], x["sinDec"])[0][0] for x in data]),
+    "MedianPullEParam2D": lambda data: np.array(
+        [pull_2d_f(x["logE"], x["sinDec"])[0][0] for x in data]),
+}
+
+floor_0d = make_class(QuantileFloor0D).create_function(floor_grid[0, 0])
+floor_0d_e = make_class(QuantileFloorEParam0D).create_function(
+    [gamma_points, floor_grid[0]])
+
+# QuantileFloor1D is registered twice, and the class registered as
+# 'quantile_floor_1d_e' is only accessible through the registry
+
+floor_1d_e = make_class(
+    BaseFloorClass.subclasses["quantile_floor_1d_e"]).create_function(
+    [log_e_points, gamma_points, floor_grid])
+
+functions = {
+    "BaseFloorClass": make_class(BaseFloorClass).floor,
+    "StaticFloor": make_class(StaticFloor, min_error=min_angular_err).floor,
+    "QuantileFloor0D": lambda data: floor_0d(data, gamma),
+    "QuantileFloorEParam0D": lambda data: floor_0d_e(data, gamma),
+    "QuantileFloorEParam1D": lambda data: floor_1d_e(data, gamma),
+    "BaseMedianAngularErrorModifier": make_class(
+        BaseMedianAngularErrorModifier).create_static(),
+    "MedianPullEParam0D": make_class(MedianPullEParam0D).create_dynamic(
+        pull_0d),
+    "MedianPull2D": make_class(MedianPull2D, pickled_data=[
+        log_e_points, sin_dec_points, pull_grid]).create_static(),
+    "MedianPullEParam2D": make_class(MedianPullEParam2D).create_dynamic(
+        [log_e_points, sin_dec_points, pull_grid]),
+}
+
+
+class TestAngularErrorModifier(unittest.TestCase):
+
+    def test_functions(self):
+
+        logging.info("Testing floor and pull functions.")
+
+        for n_events in [1, 10, 1000]:
+
+            data = simulate_events(n_events)
+
+            for (name, f) in functions.items():
+                res = np.asarray(f(data))
+                true = per_event_functions[name](data)
+
+                self.assertEqual(res.shape, true.shape, msg=name)
+                np.testing.assert_allclose(res, true, rtol=1e-12, atol=0.,
+                                           err_msg=name)
+
+    def test_apply_floor(self):
+
+        logging.info("Testing application of a static floor.")
+
+        data = simulate_events(1000)
+
+        static_floor = make_class(StaticFloor, min_error=0.01)
+
+        res = static_floor.apply_static(data.copy())
+
+        for (x, y) in zip(data, res):
+            if x["raw_sigma"] < 0.01:
+                true = np.sqrt(0.01 ** 2. + x["raw_sigma"] ** 2.)
+            else:
+                true = x["raw_sigma"]
+
+            self.assertAlmostEqual(y["sigma"], true, places=15)
+            self.assertEqual(y["raw_sigma"], y["sigma"])
+
+
+if __name__ == '__main__':
+    unittest.main()
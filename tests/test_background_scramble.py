@@ -0,0 +1,72 @@
+"""Test the scrambling of experimental data used to generate background
+datasets.
+"""
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from flarestack.data import Season
+
+
+class TestBackgroundScramble(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        path = os.path.join(self.temp_dir, "exp.npy")
+
+        np.random.seed(3)
+        n_events = 500
+
+        data = np.empty(n_events, dtype=[
+            ("ra", np.float), ("dec", np.float), ("logE", np.float),
+            ("sigma", np.float), ("time", np.float)])
+        data["ra"] = np.random.uniform(0., 2 * np.pi, n_events)
+        data["dec"] = np.arcsin(np.random.uniform(-1., 1., n_events))
+        data["logE"] = np.random.uniform(2., 6., n_events)
+        data["sigma"] = np.deg2rad(np.random.uniform(0.2, 2., n_events))
+        data["time"] = np.random.uniform(55000., 55365., n_events)
+
+        np.save(path, data)
+
+        self.data = data
+        self.season = Season("test", "TestSample", path)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_scramble(self):
+
+        logging.info("Testing background scrambling.")
+
+        for reuse_buffer in [False, True]:
+
+            scramble = self.season.pseudo_background(reuse_buffer=reuse_buffer)
+
+            self.assertEqual(scramble.dtype,
+                             self.season.get_background_dtype())
+
+            for name in ["dec", "logE", "sigma"]:
+                np.testing.assert_array_equal(scramble[name], self.data[name])
+
+            np.testing.assert_array_equal(np.sort(scramble["time"]),
+                                          np.sort(self.data["time"]))
+
+            self.assertFalse(np.array_equal(scramble["ra"], self.data["ra"]))
+            self.assertTrue(np.all(scramble["ra"] >= 0.))
+            self.assertTrue(np.all(scramble["ra"] < 2 * np.pi))
+
+        # Check that only one buffer is used, and that the base is unchanged
+
+        buffer = self.season.pseudo_background(reuse_buffer=True)
+        self.assertTrue(buffer is scramble)
+        self.assertFalse(
+            self.season.pseudo_background(reuse_buffer=False) is buffer)
+
+        np.testing.assert_array_equal(self.season.background_base["time"],
+                                      self.data["time"])
+
+
+if __name__ == '__main__':
+    unittest.main()
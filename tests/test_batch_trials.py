@@ -0,0 +1,113 @@
+"""Test that run_batch gives the same results as trials run one at a time
+by MinimisationHandler.run, using a synthetic season of data.
+"""
+import logging
+import tempfile
+import unittest
+import numpy as np
+from flarestack.core.minimisation import MinimisationHandler
+from synthetic_data import make_dataset, make_catalogue, remove_synthetic_data
+
+llh_dict = {
+    "llh_name": "standard",
+    "llh_energy_pdf": {
+        "energy_pdf_name": "power_law"
+    },
+    "llh_sig_time_pdf": {
+        "time_pdf_name": "steady"
+    },
+    "llh_bkg_time_pdf": {
+        "time_pdf_name": "steady",
+    }
+}
+
+inj_dict = {
+    "injection_energy_pdf": {
+        "energy_pdf_name": "power_law",
+        "gamma": 2.0
+    },
+    "injection_sig_time_pdf": {
+        "time_pdf_name": "steady"
+    }
+}
+
+# The test statistic is evaluated to the last few bits of a double, which can
+# differ from run to run (e.g. in the angular distances of the spatial PDF).
+# The minimiser uses finite-difference steps, and amplifies these differences
+# to the precision to which it finds the minimum, so the fitted parameters
+# are compared at the tolerance of the minimiser rather than exactly.
+
+param_tolerance = 1.e-4
+ts_tolerance = 1.e-6
+
+
+class TestBatchTrials(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+        mh_dict = {
+            "name": "tests/test_batch_trials/",
+            "mh_name": "fixed_weights",
+            "dataset": make_dataset(self.temp_dir),
+            "catalogue": make_catalogue(self.temp_dir, 3),
+            "llh_dict": llh_dict,
+            "inj_dict": inj_dict
+        }
+
+        self.mh = MinimisationHandler.create(mh_dict)
+
+    def tearDown(self):
+        remove_synthetic_data(self.temp_dir)
+
+    def test_batch(self):
+
+        logging.info("Testing run_batch.")
+
+        n_trials = 5
+        scale = 0.05
+        seed = 12
+
+        results = self.mh.run_batch(n_trials, scale=scale, seed=seed)
+
+        self.assertEqual(len(results["TS"]), n_trials)
+        self.assertEqual(len(results["Flags"]), n_trials)
+
+        for key in self.mh.param_names:
+            self.assertEqual(len(results["Parameters"][key]), n_trials)
+
+        # Trials of run are simulated and fitted one at a time, with a
+        # new seed drawn for each trial
+
+        np.random.seed(seed)
+
+        for i in range(n_trials):
+            res_dict = self.mh.simulate_and_run(scale)
+            self.assertAlmostEqual(results["TS"][i], res_dict["TS"],
+                                   delta=ts_tolerance)
+
+            for (key, val) in res_dict["Parameters"].items():
+                self.assertAlmostEqual(results["Parameters"][key][i], val,
+                                       delta=param_tolerance)
+
+    def test_dec_index(self):
+
+        logging.info("Testing the declination index of simulated datasets.")
+
+        name = list(self.mh.seasons.keys())[0]
+        llh = self.mh.get_likelihood(name)
+
+        for scale in [0., 0.05]:
+            data = self.mh.prepare_dataset(scale, seed=3)[name]
+
+            order, sorted_dec = llh.sort_by_dec(data)
+
+            true_order = np.argsort(data["dec"], kind="stable")
+
+            np.testing.assert_array_equal(order, true_order)
+            np.testing.assert_array_equal(sorted_dec,
+                                          data["dec"][true_order])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+"""Test that the selection of spatially-coincident events, using a
+declination-sorted index of the data, agrees with a direct selection.
+"""
+import logging
+import unittest
+import numpy as np
+from flarestack.core.llh import LLH
+from flarestack.data import Season
+
+
+def select_directly(data, source):
+    """Reference selection, testing every event for the source box."""
+    width = np.deg2rad(5.)
+    min_dec = max(-np.pi / 2., source['dec_rad'] - width)
+    max_dec = min(np.pi / 2., source['dec_rad'] + width)
+    dec_mask = np.logical_and(np.greater(data["dec"], min_dec),
+                              np.less(data["dec"], max_dec))
+    cos_factor = np.amin(np.cos([min_dec, max_dec]))
+    dPhi = np.amin([2. * np.pi, 2. * width / cos_factor])
+    ra_dist = np.fabs(
+        (data["ra"] - source['ra_rad'] + np.pi) % (2. * np.pi) - np.pi)
+    return dec_mask & (ra_dist < dPhi / 2.)
+
+
+class TestCoincidentSelection(unittest.TestCase):
+
+    def setUp(self):
+        np.random.seed(9)
+        n_events = 10000
+
+        self.data = np.empty(n_events, dtype=[("ra", np.float),
+                                              ("dec", np.float)])
+        self.data["ra"] = np.random.uniform(0., 2 * np.pi, n_events)
+        self.data["dec"] = np.arcsin(np.random.uniform(-1., 1., n_events))
+
+        n_sources = 30
+
+        self.sources = np.empty(n_sources, dtype=[("ra_rad", np.float),
+                                                  ("dec_rad", np.float)])
+        self.sources["ra_rad"] = np.random.uniform(0., 2 * np.pi, n_sources)
+        self.sources["dec_rad"] = np.arcsin(
+            np.random.uniform(-1., 1., n_sources))
+        self.sources[0] = (0.01, 1.55)
+        self.sources[1] = (6.2, -0.3)
+
+        # The selection does not depend on any of the LLH PDFs
+        self.llh = LLH.__new__(LLH)
+        self.llh.dec_index = None
+        self.llh.season = Season("test", "TestSample", None)
+
+    def test_selection(self):
+
+        logging.info("Testing selection of spatially-coincident data.")
+
+        total = np.zeros(len(self.data), dtype=np.bool)
+
+        for source in self.sources:
+            mask = self.llh.select_spatially_coincident_data(
+                self.data, [source])
+            true_mask = select_directly(self.data, source)
+            np.testing.assert_array_equal(mask, true_mask)
+            total |= true_mask
+
+        np.testing.assert_array_equal(
+            self.llh.select_spatially_coincident_data(
+                self.data, self.sources), total)
+
+    def test_index_update(self):
+
+        logging.info("Testing that the index is remade for a new dataset.")
+
+        self.llh.select_spatially_coincident_data(self.data, self.sources)
+
+        new_data = np.copy(self.data)
+        new_data["dec"] *= -1.
+
+        for source in self.sources[:5]:
+            np.testing.assert_array_equal(
+                self.llh.select_spatially_coincident_data(new_data, [source]),
+                select_directly(new_data, source))
+
+
+if __name__ == '__main__':
+    unittest.main()
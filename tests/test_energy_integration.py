@@ -0,0 +1,55 @@
+"""Test the array-based integration over energy of EnergyPDF.
+"""
+import logging
+import unittest
+import numpy as np
+from flarestack.core.energy_pdf import EnergyPDF
+
+
+class TestEnergyIntegration(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def test_integrate_over_E(self):
+
+        logging.info("Testing vectorised integration over energy.")
+
+        e_pdf = EnergyPDF.create({
+            "energy_pdf_name": "power_law",
+            "gamma": 2.0
+        })
+
+        def scalar_f(e):
+            return float(e_pdf.f(e)) * (1. + np.log(e))
+
+        def array_f(e):
+            return e_pdf.f(e) * (1. + np.log(e))
+
+        # Functions which only accept scalars are evaluated in turn
+
+        self.assertAlmostEqual(
+            e_pdf.integrate_over_E(scalar_f) / e_pdf.integrate_over_E(array_f),
+            1., places=12)
+
+        # Several upper limits are integrated at once
+
+        upper = np.array([500., 1.e4, 1.e6])
+
+        np.testing.assert_allclose(
+            e_pdf.integrate_over_E(array_f, upper=upper),
+            [e_pdf.integrate_over_E(array_f, upper=x) for x in upper],
+            rtol=1e-12)
+
+        # Several integrands (e.g declinations) are integrated at once
+
+        scale = np.array([[1.], [2.], [3.]])
+
+        np.testing.assert_allclose(
+            e_pdf.integrate_over_E(lambda e: scale * array_f(e)),
+            np.ravel(scale) * e_pdf.integrate_over_E(array_f),
+            rtol=1e-12)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+"""Test that skipping flare windows with an upper bound on their TS below the
+best TS found so far does not change the result of the flare search, using a
+synthetic season of data.
+"""
+import logging
+import tempfile
+import unittest
+import numpy as np
+from flarestack.core.minimisation import MinimisationHandler
+from synthetic_data import make_dataset, make_catalogue, remove_synthetic_data
+
+llh_dict = {
+    "llh_name": "standard",
+    "llh_energy_pdf": {
+        "energy_pdf_name": "power_law"
+    },
+    "llh_sig_time_pdf": {
+        "time_pdf_name": "steady"
+    },
+    "llh_bkg_time_pdf": {
+        "time_pdf_name": "steady",
+    },
+    "energy_SoB_backend": "grid"
+}
+
+inj_dict = {
+    "injection_energy_pdf": {
+        "energy_pdf_name": "power_law",
+        "gamma": 2.0
+    },
+    "injection_sig_time_pdf": {
+        "time_pdf_name": "box",
+        "pre_window": 0.,
+        "post_window": 20.
+    }
+}
+
+
+class TestFlarePruning(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+        self.mh_dict = {
+            "name": "tests/test_flare_pruning/",
+            "mh_name": "flare",
+            "dataset": make_dataset(self.temp_dir, n_exp=int(5e3)),
+            "catalogue": make_catalogue(self.temp_dir),
+            "llh_dict": llh_dict,
+            "inj_dict": inj_dict
+        }
+
+    def tearDown(self):
+        remove_synthetic_data(self.temp_dir)
+
+    def test_pruning(self):
+
+        logging.info("Testing flare search with and without pruning.")
+
+        mh = MinimisationHandler.create(self.mh_dict)
+
+        unpruned_dict = dict(self.mh_dict)
+        unpruned_dict["llh_dict"] = dict(llh_dict, flare_pruning_bool=False)
+
+        unpruned_mh = MinimisationHandler.create(unpruned_dict)
+
+        self.assertTrue(mh.flare_pruning)
+        self.assertFalse(unpruned_mh.flare_pruning)
+
+        for (scale, seed) in [(0., 1), (0.5, 2)]:
+
+            dataset = mh.prepare_dataset(scale, seed)
+
+            res = mh.run_trial(dataset)
+            unpruned_res = unpruned_mh.run_trial(dataset)
+
+            logging.info("Best fit values {0}".format(res["Parameters"]))
+
+            self.assertAlmostEqual(res["TS"], unpruned_res["TS"], places=8)
+
+            for (key, val) in unpruned_res["Parameters"].items():
+                self.assertAlmostEqual(res["Parameters"][key], val, places=8)
+
+            self.assertTrue(np.isfinite(res["TS"]))
+
+    def test_energy_upper_bound(self):
+
+        logging.info("Testing the upper bound on the energy S/B.")
+
+        mh = MinimisationHandler.create(self.mh_dict)
+
+        name = list(mh.seasons.keys())[0]
+        llh = mh.get_likelihood(name)
+        data = mh.prepare_dataset(0., 1)[name]
+
+        gamma_min, gamma_max = 1.0, 4.0
+
+        bound = llh.estimate_energy_weights_upper_bound(
+            data, gamma_min, gamma_max)
+
+        energy_cache = llh.create_SoB_energy_cache(data)
+
+        for gamma in np.linspace(gamma_min, gamma_max, 31):
+            val = llh.estimate_energy_weights(gamma, energy_cache)
+            self.assertTrue(np.all(val <= bound * (1. + 1.e-12)))
+
+        # With splines, the bound is not cheap, so none is given
+
+        spline_dict = dict(self.mh_dict)
+        spline_dict["llh_dict"] = dict(llh_dict, energy_SoB_backend="spline")
+
+        spline_mh = MinimisationHandler.create(spline_dict)
+
+        self.assertIsNone(
+            spline_mh.get_likelihood(name).estimate_energy_weights_upper_bound(
+                data, gamma_min, gamma_max))
+
+
+if __name__ == '__main__':
+    unittest.main()
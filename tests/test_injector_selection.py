@@ -0,0 +1,155 @@
+"""Test the vectorised selection of MC events for signal injection, and the
+expected number of events used to select them, using a synthetic season of
+data.
+"""
+import logging
+import tempfile
+import unittest
+import numpy as np
+from flarestack.core.injector import MCInjector, LowMemoryInjector
+from flarestack.utils.catalogue_loader import load_catalogue
+from synthetic_data import SyntheticSeason, make_catalogue, \
+    remove_synthetic_data
+
+
+class TestInjectorSelection(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        remove_synthetic_data(self.temp_dir)
+
+    def test_draw_from_cdf(self):
+
+        logging.info("Testing vectorised selection of injected events.")
+
+        np.random.seed(42)
+
+        # Two sources, each with its own band of MC events. The first event
+        # of each band has no weight, and so should never be selected.
+
+        index = np.array([3, 5, 7, 2, 4])
+        weights = [np.array([0., 1., 3.]), np.array([0., 1.])]
+
+        cdf = np.concatenate([
+            np.cumsum(w) / np.sum(w) + i for i, w in enumerate(weights)])
+
+        n_s = np.array([40000, 1000])
+
+        selected = MCInjector.draw_from_cdf(index, cdf, n_s)
+
+        self.assertEqual(len(selected), np.sum(n_s))
+        self.assertTrue(np.all(np.isin(selected[:n_s[0]], [5, 7])))
+        np.testing.assert_array_equal(selected[n_s[0]:], 4)
+
+        self.assertAlmostEqual(
+            np.mean(selected[:n_s[0]] == 7), 0.75, delta=0.01)
+
+        # Sources without injected events are skipped
+
+        selected = MCInjector.draw_from_cdf(index, cdf, np.array([0, 10]))
+        np.testing.assert_array_equal(selected, 4)
+
+        # Sources without any weighted MC have no CDF, so drawing events for
+        # them raises an error rather than taking events of another source
+
+        with self.assertRaises(ValueError):
+            MCInjector.draw_from_cdf(
+                np.array([7, 8]), np.array([1.5, 2.]), np.array([3, 0]))
+
+        with self.assertRaises(ValueError):
+            MCInjector.draw_from_cdf(
+                np.array([7, 8]), np.array([0.5, 1.]), np.array([1, 2]))
+
+        selected = MCInjector.draw_from_cdf(
+            np.array([7, 8]), np.array([1.5, 2.]), np.array([0, 3]))
+        self.assertTrue(np.all(np.isin(selected, [7, 8])))
+
+    def test_source_index_map(self):
+
+        logging.info("Testing lookup of sources by name.")
+
+        sources = np.array(
+            [(b"src_a", 1.), (b"src_b", 2.)],
+            dtype=[("source_name", "a30"), ("dec_rad", np.float)]
+        )
+
+        index_map = MCInjector.make_source_index_map(sources)
+
+        self.assertEqual(index_map, {"src_a": 0, "src_b": 1})
+        self.assertEqual(index_map[sources[1]["source_name"].decode()], 1)
+
+    def test_n_exp(self):
+
+        logging.info("Testing expected number of injected events.")
+
+        season = SyntheticSeason(self.temp_dir)
+        sources = load_catalogue(make_catalogue(self.temp_dir, 3))
+
+        inj = MCInjector.create(season, sources, **{
+            "injection_energy_pdf": {
+                "energy_pdf_name": "power_law",
+                "gamma": 2.5
+            },
+            "injection_sig_time_pdf": {
+                "time_pdf_name": "steady"
+            }
+        })
+
+        # The oneweight sum of the MC of each source is equal to the
+        # expected number of events, which is proportional to the scale
+
+        for source in sources:
+            n_exp = inj.calculate_n_exp_single(source)
+
+            self.assertGreater(n_exp, 0.)
+
+            for scale in [1., 0.3]:
+                source_mc = inj.calculate_single_source(source, scale)
+                self.assertAlmostEqual(
+                    scale * n_exp / np.sum(source_mc["ow"]), 1., places=10)
+
+    def test_fixed_n_empty_band(self):
+
+        logging.info("Testing fixed_n injection for a source without MC.")
+
+        season = SyntheticSeason(self.temp_dir)
+        sources = load_catalogue(make_catalogue(self.temp_dir, 3))
+
+        inj_kwargs = {
+            "fixed_n": 5,
+            "injection_energy_pdf": {
+                "energy_pdf_name": "power_law",
+                "gamma": 2.5
+            },
+            "injection_sig_time_pdf": {
+                "time_pdf_name": "steady"
+            }
+        }
+
+        for injector_name in [None, "low_memory_injector"]:
+            if injector_name is None:
+                inj = MCInjector.create(season, sources, **inj_kwargs)
+            else:
+                inj = MCInjector.create(season, sources,
+                                        injector_name=injector_name,
+                                        **inj_kwargs)
+
+            # Removes the weight of all MC in the band of the first source
+
+            _, min_dec, max_dec, _ = inj.get_dec_and_omega(sources[0])
+            band = inj.get_band_mask(sources[0], min_dec, max_dec)
+
+            inj.mc_weights = np.copy(inj.mc_weights)
+            inj.mc_weights[band] = 0.
+            if isinstance(inj, LowMemoryInjector):
+                inj.sort_mc()
+            inj.n_exp = inj.calculate_n_exp()
+
+            with self.assertRaises(ValueError):
+                inj.inject_signal(1.)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,165 @@
+"""A standard time-integrated analysis is performed, using one year of
+IceCube data (IC86_1). The test statistic and its gradient are also
+compared to those of the StandardLLH, using a synthetic season of data.
+"""
+import logging
+import tempfile
+import unittest
+import numpy as np
+from flarestack.core.llh import LLH
+from flarestack.core.minimisation import MinimisationHandler
+from flarestack.data.public import icecube_ps_3_year
+from flarestack.core.unblinding import create_unblinder
+from flarestack.analyses.tde.shared_TDE import tde_catalogue_name
+from synthetic_data import make_dataset, make_catalogue, remove_synthetic_data
+
+# Initialise Injectors/LLHs
+
+llh_dict = {
+    "llh_name": "standard_packed",
+    "llh_sig_time_pdf": {
+        "time_pdf_name": "steady"
+    },
+    "llh_bkg_time_pdf": {
+        "time_pdf_name": "steady"
+    },
+    "llh_energy_pdf": {
+        "energy_pdf_name": "power_law"
+    }
+}
+
+name = "tests/test_likelihood_standard_packed/"
+
+# Loop over sin(dec) values
+
+catalogue = tde_catalogue_name("jetted")
+
+
+# Reference best fit of a previous unblinding with the packed LLH. The fit
+# is only checked loosely against it, while the agreement with the
+# StandardLLH is tested directly below.
+
+true_parameters = [3.70369960756338, 4.0]
+
+
+class TestTimeIntegrated(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def test_declination_sensitivity(self):
+
+        logging.info("Testing 'standard_packed' LLH class")
+
+        # Test stacking
+
+        unblind_dict = {
+            "mh_name": "fixed_weights",
+            "dataset": icecube_ps_3_year.get_seasons("IC86-2011"),
+            "catalogue": catalogue,
+            "llh_dict": llh_dict,
+        }
+
+        ub = create_unblinder(unblind_dict)
+        key = [x for x in ub.res_dict.keys() if x != "TS"][0]
+        res = ub.res_dict[key]
+        for i, x in enumerate(res["x"]):
+            self.assertAlmostEqual(x, true_parameters[i], delta=5)
+
+        logging.info("Best fit values {0}".format(list(res)))
+        logging.info("Reference best fit {0}".format(true_parameters))
+
+
+class TestPackedAgreement(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+        mh_dict = {
+            "name": "tests/test_likelihood_standard_packed_agreement/",
+            "mh_name": "fixed_weights",
+            "dataset": make_dataset(self.temp_dir),
+            "catalogue": make_catalogue(self.temp_dir, 5),
+            "llh_dict": dict(llh_dict, llh_name="standard"),
+            "inj_dict": {
+                "injection_energy_pdf": {
+                    "energy_pdf_name": "power_law",
+                    "gamma": 2.0
+                },
+                "injection_sig_time_pdf": {
+                    "time_pdf_name": "steady"
+                }
+            }
+        }
+
+        self.mh = MinimisationHandler.create(mh_dict)
+
+        self.name = list(self.mh.seasons)[0]
+        self.standard_llh = self.mh.get_likelihood(self.name)
+        self.packed_llh = LLH.create(
+            self.mh.seasons[self.name], self.mh.sources, llh_dict)
+
+    def tearDown(self):
+        remove_synthetic_data(self.temp_dir)
+
+    def compare(self, data):
+        """Checks that the packed and standard LLHs give the same test
+        statistic and gradient for the given data.
+
+        :param data: Dataset
+        :return: Number of coincident events
+        """
+        aem = self.mh.get_angular_error_modifier(self.name)
+
+        standard_kwargs = self.standard_llh.create_kwargs(
+            data, aem, self.mh.make_season_weight)
+        packed_kwargs = self.packed_llh.create_kwargs(
+            data, aem, self.mh.make_season_weight)
+
+        self.assertEqual(packed_kwargs["n_coincident"],
+                         standard_kwargs["n_coincident"])
+
+        for params in [[3.0, 2.2], [0.5, 3.1], [-2.0, 3.7]]:
+            weights = self.mh.normalise_weight_matrix(
+                self.mh.make_weight_matrix(params))[0][:, np.newaxis]
+
+            ts = self.standard_llh.calculate_test_statistic(
+                params, weights, **standard_kwargs)
+            packed_ts = self.packed_llh.calculate_test_statistic(
+                params, weights, **packed_kwargs)
+
+            self.assertAlmostEqual(packed_ts, ts, delta=1.e-6 * (
+                1. + abs(ts)))
+
+            res = self.standard_llh.calculate_test_statistic_and_gradient(
+                params, weights, **standard_kwargs)
+            packed_res = self.packed_llh.calculate_test_statistic_and_gradient(
+                params, weights, **packed_kwargs)
+
+            self.assertAlmostEqual(packed_res[0], res[0], delta=1.e-6 * (
+                1. + abs(res[0])))
+            np.testing.assert_allclose(packed_res[1], res[1], rtol=1.e-6,
+                                       atol=1.e-8)
+            self.assertAlmostEqual(packed_res[2], res[2], delta=1.e-6 * (
+                1. + abs(res[2])))
+
+        return standard_kwargs["n_coincident"]
+
+    def test_agreement(self):
+
+        logging.info("Testing agreement of 'standard_packed' and 'standard' "
+                     "LLH classes")
+
+        data = self.mh.prepare_dataset(scale=0.05, seed=42)[self.name]
+
+        self.assertGreater(self.compare(data), 0)
+
+        # Without any coincident events, only the background term remains
+
+        far_data = data[np.abs(data["sinDec"]) > 0.97]
+
+        self.assertEqual(self.compare(far_data), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+"""Test the vectorised livetime calculation for flare windows, using the
+GoodRunList of one year of IceCube data (IC86_1), and for the box time PDFs
+used as the livetime of simulated seasons.
+"""
+import logging
+import unittest
+import numpy as np
+from flarestack.data.public import icecube_ps_3_year
+from flarestack.core.time_pdf import TimePDF
+
+
+class TestLivetimeBetween(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def test_livetime_between(self):
+
+        logging.info("Testing vectorised livetime of flare windows.")
+
+        season = icecube_ps_3_year.get_seasons("IC86-2011")["IC86-2011"]
+        livetime_pdf = season.get_time_pdf()
+
+        time_pdf = TimePDF.create(
+            {"time_pdf_name": "custom_source_box"}, livetime_pdf)
+
+        np.random.seed(42)
+
+        # Include windows which extend beyond the season
+
+        t = np.random.uniform(
+            livetime_pdf.sig_t0() - 10., livetime_pdf.sig_t1() + 10.,
+            (2, 100))
+        t_start = np.min(t, axis=0)
+        t_end = np.max(t, axis=0)
+
+        livetimes = livetime_pdf.livetime_between(t_start, t_end)
+
+        for i in range(len(t_start)):
+            flare_time = np.array(
+                (t_start[i], t_end[i]),
+                dtype=[
+                    ("start_time_mjd", np.float),
+                    ("end_time_mjd", np.float),
+                ]
+            )
+            true = time_pdf.effective_injection_time(flare_time) / (
+                    60 * 60 * 24)
+            self.assertAlmostEqual(livetimes[i], true, places=6)
+
+        # Windows with negative length have no livetime
+
+        np.testing.assert_array_equal(
+            livetime_pdf.livetime_between(t_end, t_start), 0.)
+
+        self.assertAlmostEqual(
+            livetime_pdf.livetime_between(
+                livetime_pdf.sig_t0(), livetime_pdf.sig_t1()),
+            livetime_pdf.get_livetime(), places=6)
+
+    def test_box_livetime_between(self):
+
+        logging.info("Testing vectorised livetime of boxes.")
+
+        t_pdf_dicts = [
+            {
+                "time_pdf_name": "fixed_ref_box",
+                "fixed_ref_time_mjd": 55000.,
+                "pre_window": 0.,
+                "post_window": 100.
+            },
+            {
+                "time_pdf_name": "fixed_end_box",
+                "start_time_mjd": 55000.,
+                "end_time_mjd": 55100.
+            }
+        ]
+
+        t_start = np.array([54990., 55010., 55050., 55090., 55110.])
+        t_end = np.array([55020., 55015., 55120., 55200., 55120.])
+
+        for t_pdf_dict in t_pdf_dicts:
+            livetime_pdf = TimePDF.create(t_pdf_dict)
+
+            np.testing.assert_allclose(
+                livetime_pdf.livetime_between(t_start, t_end),
+                [20., 5., 50., 10., 0.])
+
+            self.assertAlmostEqual(
+                livetime_pdf.livetime_between(54000., 56000.), 100.)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+"""Test that the analytic gradients of the test statistic agree with a
+numerical estimate, using one year of IceCube data (IC86_1).
+"""
+import logging
+import unittest
+import numpy as np
+from flarestack.data.public import icecube_ps_3_year
+from flarestack.core.minimisation import MinimisationHandler
+from flarestack.analyses.tde.shared_TDE import tde_catalogue_name
+
+llh_names = ["standard", "standard_overlapping", "standard_matrix",
+             "standard_packed", "fixed_energy", "spatial"]
+
+catalogue = tde_catalogue_name("jetted")
+
+
+class TestLLHGradient(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def test_gradient(self):
+
+        for llh_name in llh_names:
+
+            logging.info("Testing gradient of '{0}' LLH class".format(
+                llh_name))
+
+            llh_dict = {
+                "llh_name": llh_name,
+                "llh_sig_time_pdf": {
+                    "time_pdf_name": "steady"
+                },
+                "llh_bkg_time_pdf": {
+                    "time_pdf_name": "steady",
+                },
+                "analytic_gradient_bool": True
+            }
+
+            if llh_name != "spatial":
+                llh_dict["llh_energy_pdf"] = {
+                    "energy_pdf_name": "power_law",
+                    "gamma": 2.0
+                }
+
+            mh_dict = {
+                "name": "tests/test_llh_gradient/",
+                "mh_name": "fixed_weights",
+                "dataset": icecube_ps_3_year.get_seasons("IC86-2011"),
+                "catalogue": catalogue,
+                "llh_dict": llh_dict,
+                "inj_dict": {
+                    "injection_energy_pdf": {
+                        "energy_pdf_name": "power_law",
+                        "gamma": 2.0
+                    },
+                    "injection_sig_time_pdf": {
+                        "time_pdf_name": "steady"
+                    }
+                }
+            }
+
+            mh = MinimisationHandler.create(mh_dict)
+            f = mh.trial_function(mh.prepare_dataset(scale=5., seed=42))
+
+            for params in [[3.0, 2.2], [0.5, 3.1]]:
+                params = np.array(params[:len(mh.p0)])
+
+                ts, grad = f(params, return_gradient=True)
+
+                self.assertAlmostEqual(ts, f(params), places=8)
+
+                step = 1.e-6
+
+                for i, unit in enumerate(np.eye(len(params))):
+                    num_grad = (f(params + step * unit) -
+                                f(params - step * unit)) / (2. * step)
+                    self.assertAlmostEqual(grad[i], num_grad, delta=1.e-3 * (
+                        1. + abs(num_grad)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+"""Test that the LowMemoryInjector finds the same declination bands and
+expected number of events as boolean masks of the MC, using a synthetic
+season of data.
+"""
+import logging
+import tempfile
+import unittest
+import numpy as np
+from flarestack.core.injector import MCInjector
+from flarestack.utils.catalogue_loader import load_catalogue
+from synthetic_data import SyntheticSeason, make_catalogue, \
+    remove_synthetic_data
+
+inj_dict = {
+    "injection_energy_pdf": {
+        "energy_pdf_name": "power_law",
+        "gamma": 2.0
+    },
+    "injection_sig_time_pdf": {
+        "time_pdf_name": "steady"
+    }
+}
+
+
+class TestLowMemoryInjector(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.season = SyntheticSeason(self.temp_dir)
+
+        self.sources = load_catalogue(make_catalogue(self.temp_dir, 5))
+
+        # Bands of sources close to the poles are cut at +/- 90 degrees
+
+        self.sources["dec_rad"][0] = np.deg2rad(89.)
+        self.sources["dec_rad"][1] = np.deg2rad(-89.5)
+
+    def tearDown(self):
+        remove_synthetic_data(self.temp_dir)
+
+    def test_bands(self):
+
+        logging.info("Testing declination bands of LowMemoryInjector.")
+
+        inj = MCInjector.create(self.season, self.sources, **inj_dict)
+        low_memory_inj = MCInjector.create(
+            self.season, self.sources,
+            injector_name="low_memory_injector", **inj_dict)
+
+        n_exp = inj.calculate_n_exp()
+        low_memory_n_exp = low_memory_inj.calculate_n_exp()
+
+        np.testing.assert_array_equal(
+            low_memory_n_exp["source_name"], n_exp["source_name"])
+        np.testing.assert_allclose(
+            low_memory_n_exp["n_exp"], n_exp["n_exp"], rtol=1e-10)
+
+        mc = self.season.get_mc()
+
+        for source in self.sources:
+            _, min_dec, max_dec, _ = low_memory_inj.get_dec_and_omega(source)
+
+            mask = np.logical_and(np.greater(mc["trueDec"], min_dec),
+                                  np.less(mc["trueDec"], max_dec))
+
+            band = low_memory_inj.get_band_mask(source, min_dec, max_dec)
+
+            self.assertGreater(len(band), 0)
+
+            # The band is an index array, ordered by true declination
+
+            np.testing.assert_array_equal(np.sort(band), np.flatnonzero(mask))
+            self.assertTrue(np.all(np.diff(mc["trueDec"][band]) >= 0.))
+
+            np.testing.assert_array_equal(mc[band], np.sort(
+                mc[mask], order="trueDec", kind="stable"))
+
+            self.assertAlmostEqual(
+                np.sum(low_memory_inj.mc_weights[band]),
+                np.sum(low_memory_inj.mc_weights[mask]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+"""Test that trials run in chunks on several processes are all saved, with
+the same results as trials run in a single process, and that failed chunks
+are reported, using a synthetic season of data.
+"""
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from flarestack.core.minimisation import MinimisationHandler
+from flarestack.core.multiprocess_wrapper import run_multiprocess
+from flarestack.shared import scale_shortener, load_trial_results
+from synthetic_data import make_dataset, make_catalogue, remove_synthetic_data
+
+llh_dict = {
+    "llh_name": "standard",
+    "llh_energy_pdf": {
+        "energy_pdf_name": "power_law"
+    },
+    "llh_sig_time_pdf": {
+        "time_pdf_name": "steady"
+    },
+    "llh_bkg_time_pdf": {
+        "time_pdf_name": "steady",
+    }
+}
+
+inj_dict = {
+    "injection_energy_pdf": {
+        "energy_pdf_name": "power_law",
+        "gamma": 2.0
+    },
+    "injection_sig_time_pdf": {
+        "time_pdf_name": "steady"
+    }
+}
+
+
+class TestMultiprocessWrapper(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+        self.mh_dict = {
+            "name": "tests/test_multiprocess_wrapper/",
+            "mh_name": "fixed_weights",
+            "dataset": make_dataset(self.temp_dir, n_exp=int(5e3)),
+            "catalogue": make_catalogue(self.temp_dir, 2),
+            "llh_dict": llh_dict,
+            "inj_dict": inj_dict,
+            "n_trials": 5,
+            "n_steps": 2,
+            "scale": 1.,
+            "fixed_scale": 0.1
+        }
+
+        self.mh = MinimisationHandler.create(self.mh_dict)
+
+        if os.path.isdir(self.mh.pickle_output_dir):
+            shutil.rmtree(self.mh.pickle_output_dir)
+
+    def tearDown(self):
+        remove_synthetic_data(self.temp_dir)
+        shutil.rmtree(self.mh.pickle_output_dir, ignore_errors=True)
+
+    def test_chunks(self):
+
+        logging.info("Testing trials run in chunks on two processes.")
+
+        scale = self.mh_dict["fixed_scale"]
+
+        run_multiprocess(n_cpu=2, mh_dict=self.mh_dict, chunk_size=2)
+
+        write_dir = os.path.join(
+            self.mh.pickle_output_dir, scale_shortener(scale))
+
+        # Each chunk of 2, 2 and 1 trials is saved to a separate file, named
+        # after the seed of its first trial
+
+        files = sorted(os.listdir(write_dir))
+
+        self.assertEqual(len(files), 3)
+
+        n_trials = []
+
+        for file_name in files:
+            results = load_trial_results(os.path.join(write_dir, file_name))
+
+            n_trials.append(len(results["TS"]))
+
+            for key in self.mh.param_names:
+                self.assertEqual(len(results["Parameters"][key]),
+                                 len(results["TS"]))
+
+            seed = int(file_name.split(".")[0])
+
+            res_dict = self.mh.run_trial(self.mh.prepare_dataset(scale, seed))
+
+            self.assertAlmostEqual(results["TS"][0], res_dict["TS"], places=8)
+
+        self.assertEqual(sorted(n_trials), [1, 2, 2])
+
+    def test_failed_chunks(self):
+
+        logging.info("Testing that failed chunks of trials are reported.")
+
+        with mock.patch.object(type(self.mh), "run_trial",
+                               side_effect=ValueError("Failed trial")):
+            with self.assertRaises(RuntimeError):
+                run_multiprocess(n_cpu=2, mh_dict=self.mh_dict, chunk_size=2)
+
+        self.assertFalse(os.path.isdir(self.mh.pickle_output_dir))
+
+
+if __name__ == '__main__':
+    unittest.main()
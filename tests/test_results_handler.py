@@ -0,0 +1,138 @@
+"""Test that the ResultsHandler merges new results files each time it is
+updated, removing the files it has merged, using results files saved to a
+temporary directory.
+"""
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+from flarestack.core.results import ResultsHandler
+from flarestack.shared import save_trial_results, scale_shortener
+from synthetic_data import make_catalogue
+
+llh_dict = {
+    "llh_name": "standard",
+    "llh_energy_pdf": {
+        "energy_pdf_name": "power_law"
+    },
+    "llh_sig_time_pdf": {
+        "time_pdf_name": "steady"
+    },
+    "llh_bkg_time_pdf": {
+        "time_pdf_name": "steady",
+    }
+}
+
+
+def make_results(n, seed):
+    rng = np.random.RandomState(seed)
+    return {
+        "TS": list(rng.chisquare(1., n)),
+        "Parameters": {
+            "n_s": list(rng.uniform(0., 5., n)),
+            "gamma": list(rng.uniform(1., 4., n))
+        },
+        "Flags": [0 for _ in range(n)]
+    }
+
+
+class TestResultsHandler(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+        self.pickle_output_dir = os.path.join(self.temp_dir, "pickles")
+        inj_dir = os.path.join(self.temp_dir, "injection_values")
+        os.makedirs(inj_dir)
+
+        self.patches = [
+            mock.patch("flarestack.core.results.name_pickle_output_dir",
+                       return_value=self.pickle_output_dir),
+            mock.patch("flarestack.core.results.inj_dir_name",
+                       return_value=inj_dir)
+        ]
+
+        for patch in self.patches:
+            patch.start()
+
+        self.rh_dict = {
+            "name": "tests/test_results_handler/",
+            "mh_name": "fixed_weights",
+            "catalogue": make_catalogue(self.temp_dir),
+            "llh_dict": llh_dict
+        }
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        shutil.rmtree(self.temp_dir)
+
+    def write_results(self, scale, seed, n):
+        write_dir = os.path.join(self.pickle_output_dir, scale_shortener(scale))
+
+        try:
+            os.makedirs(write_dir)
+        except OSError:
+            pass
+
+        path = os.path.join(write_dir, "{0}.npz".format(seed))
+        save_trial_results(make_results(n, seed), path)
+        return path
+
+    def test_update(self):
+
+        logging.info("Testing incremental updates of the ResultsHandler.")
+
+        shards = [
+            self.write_results(0., 1, 20),
+            self.write_results(0., 2, 30),
+            self.write_results(1., 3, 10)
+        ]
+
+        rh = ResultsHandler(self.rh_dict)
+
+        self.assertEqual(len(rh.results[scale_shortener(0.)]["TS"]), 50)
+        self.assertEqual(len(rh.results[scale_shortener(1.)]["TS"]), 10)
+
+        # Merged files are kept, and the files which were merged are deleted
+
+        for path in shards:
+            self.assertFalse(os.path.isfile(path))
+
+        self.assertEqual(sorted(os.listdir(rh.merged_dir)), sorted([
+            scale_shortener(0.) + ".npz", scale_shortener(1.) + ".npz"]))
+
+        new_shard = self.write_results(0., 4, 15)
+
+        rh.update()
+
+        self.assertFalse(os.path.isfile(new_shard))
+
+        bkg_ts = rh.results[scale_shortener(0.)]["TS"]
+
+        self.assertEqual(len(bkg_ts), 65)
+        self.assertEqual(len(rh.results[scale_shortener(1.)]["TS"]), 10)
+
+        np.testing.assert_allclose(sorted(bkg_ts), sorted(
+            make_results(20, 1)["TS"] + make_results(30, 2)["TS"] +
+            make_results(15, 4)["TS"]))
+
+        # Updating without new files changes nothing
+
+        rh.update()
+
+        self.assertEqual(len(rh.results[scale_shortener(0.)]["TS"]), 65)
+
+        # A new ResultsHandler loads the merged files
+
+        rh = ResultsHandler(self.rh_dict)
+
+        self.assertEqual(len(rh.results[scale_shortener(0.)]["TS"]), 65)
+        self.assertEqual(len(rh.results[scale_shortener(1.)]["TS"]), 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+"""Test that the RotatedPoolInjector injects the same signal events as the
+MCInjector, when pools are kept in memory, dropped, or saved to disk, using
+a synthetic season of data.
+"""
+import gc
+import logging
+import os
+import tempfile
+import unittest
+import numpy as np
+from flarestack.core.injector import MCInjector
+from flarestack.utils.catalogue_loader import load_catalogue
+from synthetic_data import SyntheticSeason, make_catalogue, \
+    remove_synthetic_data
+
+inj_dict = {
+    "injection_energy_pdf": {
+        "energy_pdf_name": "power_law",
+        "gamma": 2.0
+    },
+    "injection_sig_time_pdf": {
+        "time_pdf_name": "steady"
+    }
+}
+
+scale = 0.5
+
+
+class TestRotatedPoolInjector(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.spill_dir = os.path.join(self.temp_dir, "pools")
+        self.season = SyntheticSeason(self.temp_dir)
+        self.sources = load_catalogue(make_catalogue(self.temp_dir, 4))
+
+    def tearDown(self):
+        remove_synthetic_data(self.temp_dir)
+
+    def assert_same_signal(self, inj, pool_inj, seed):
+        np.random.seed(seed)
+        sig = inj.inject_signal(scale)
+
+        np.random.seed(seed)
+        pool_sig = pool_inj.inject_signal(scale)
+
+        self.assertGreater(len(sig), 0)
+        self.assertEqual(len(sig), len(pool_sig))
+
+        # Positions are rotated with the same function, but for arrays of
+        # different lengths, and so can differ by rounding
+
+        for name in sig.dtype.names:
+            if name in ["ra", "dec", "sinDec"]:
+                np.testing.assert_allclose(pool_sig[name], sig[name],
+                                           rtol=0., atol=1e-12)
+            else:
+                np.testing.assert_array_equal(pool_sig[name], sig[name])
+
+    def test_pools(self):
+
+        logging.info("Testing pools of rotated events.")
+
+        inj = MCInjector.create(self.season, self.sources, **inj_dict)
+        pool_inj = MCInjector.create(
+            self.season, self.sources, injector_name="rotated_pool_injector",
+            **inj_dict)
+
+        for seed in [1, 2, 3]:
+            self.assert_same_signal(inj, pool_inj, seed)
+
+        self.assertEqual(len(pool_inj.rotated_pools), len(self.sources))
+        self.assertEqual(len(pool_inj.spilled_pools), 0)
+
+    def test_spill(self):
+
+        logging.info("Testing pools of rotated events saved to disk.")
+
+        inj = MCInjector.create(self.season, self.sources, **inj_dict)
+
+        # Each pool is larger than the memory limit, so only the most
+        # recently used pool is kept in memory
+
+        pool_inj = MCInjector.create(
+            self.season, self.sources, injector_name="rotated_pool_injector",
+            pool_max_memory_mb=1.e-3, pool_spill_dir=self.spill_dir,
+            **inj_dict)
+
+        for seed in [1, 2, 3]:
+            self.assert_same_signal(inj, pool_inj, seed)
+
+        self.assertEqual(len(pool_inj.rotated_pools), 1)
+        self.assertEqual(len(pool_inj.spilled_pools), len(self.sources))
+
+        pool_dir = pool_inj.pool_dir
+
+        self.assertEqual(sorted(os.listdir(pool_dir)), sorted(
+            ["{0}.npy".format(i) for i in range(len(self.sources))]))
+
+        # New sources discard all pools, and remove the saved pools
+
+        new_sources = load_catalogue(make_catalogue(self.temp_dir, 4, seed=4))
+
+        inj.update_sources(new_sources)
+        pool_inj.update_sources(new_sources)
+
+        self.assertFalse(os.path.isdir(pool_dir))
+        self.assertEqual(len(pool_inj.rotated_pools), 0)
+        self.assertEqual(len(pool_inj.spilled_pools), 0)
+
+        for seed in [4, 5]:
+            self.assert_same_signal(inj, pool_inj, seed)
+
+        # The saved pools are removed when the injector is deleted
+
+        pool_dir = pool_inj.pool_dir
+
+        self.assertTrue(os.path.isdir(pool_dir))
+
+        del pool_inj
+        gc.collect()
+
+        self.assertFalse(os.path.isdir(pool_dir))
+
+    def test_drop(self):
+
+        logging.info("Testing pools of rotated events dropped from memory.")
+
+        inj = MCInjector.create(self.season, self.sources, **inj_dict)
+        pool_inj = MCInjector.create(
+            self.season, self.sources, injector_name="rotated_pool_injector",
+            pool_max_memory_mb=1.e-3, **inj_dict)
+
+        for seed in [1, 2]:
+            self.assert_same_signal(inj, pool_inj, seed)
+
+        self.assertEqual(len(pool_inj.rotated_pools), 1)
+        self.assertIsNone(pool_inj.pool_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
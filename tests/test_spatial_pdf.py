@@ -0,0 +1,71 @@
+"""Test the rotation of simulated events onto a source position, as performed
+by the signal spatial PDFs during injection.
+"""
+import logging
+import unittest
+import numpy as np
+import healpy as hp
+from flarestack.core.spatial_pdf import SignalSpatialPDF
+
+
+def rotate_single_event(ra1, dec1, ra2, dec2, ra3, dec3):
+    """Reference rotation of a single event, using one healpy rotation matrix
+    per event.
+    """
+    x = hp.rotator.rotateDirection(
+        hp.rotator.get_rotation_matrix((ra2 - np.pi, dec2 - np.pi/2., 0.))[0],
+        np.pi/2. - dec1, ra1 - np.pi)
+
+    zen, phi = hp.rotator.rotateDirection(np.dot(
+        hp.rotator.get_rotation_matrix((np.pi - ra3, 0, 0))[0],
+        hp.rotator.get_rotation_matrix((0, np.pi/2. - dec3, 0.))[0]),
+        x[0], x[1])
+
+    return phi + np.pi, np.pi/2. - zen
+
+
+class TestSpatialPDF(unittest.TestCase):
+
+    def setUp(self):
+        np.random.seed(12)
+        n_events = 50
+        self.true_ra = np.random.uniform(0., 2 * np.pi, n_events)
+        self.true_dec = np.arcsin(np.random.uniform(-1., 1., n_events))
+        self.ra = (self.true_ra + np.random.normal(0., 0.05, n_events)) % \
+                  (2 * np.pi)
+        self.dec = np.clip(self.true_dec +
+                           np.random.normal(0., 0.05, n_events),
+                           -np.pi/2., np.pi/2.)
+
+    def test_rotation(self):
+
+        logging.info("Testing vectorised event rotation.")
+
+        for (src_ra, src_dec) in [(0.5, 0.), (2.1, -1.2), (5.6, 1.45)]:
+
+            ra, dec = SignalSpatialPDF.rotate(
+                self.ra, self.dec, self.true_ra, self.true_dec,
+                src_ra, src_dec)
+
+            for i in range(len(self.ra)):
+                true_ra, true_dec = rotate_single_event(
+                    self.ra[i], self.dec[i], self.true_ra[i],
+                    self.true_dec[i], src_ra, src_dec)
+
+                self.assertAlmostEqual(ra[i], true_ra, places=10)
+                self.assertAlmostEqual(dec[i], true_dec, places=10)
+
+    def test_true_direction_on_source(self):
+
+        logging.info("Testing that true directions are mapped onto source.")
+
+        ra, dec = SignalSpatialPDF.rotate(
+            self.true_ra, self.true_dec, self.true_ra, self.true_dec,
+            1.3, -0.4)
+
+        np.testing.assert_allclose(ra, 1.3, atol=1e-10)
+        np.testing.assert_allclose(dec, -0.4, atol=1e-10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+"""Test the memoized and vectorised simulation of signal times, using the
+GoodRunList of one year of IceCube data (IC86_1), and a season without
+downtime.
+"""
+import logging
+import unittest
+import numpy as np
+from flarestack.data.public import icecube_ps_3_year
+from flarestack.core.time_pdf import TimePDF, max_inverse_cdf_rows
+from flarestack.utils.catalogue_loader import load_catalogue
+from flarestack.utils.prepare_catalogue import cat_dtype
+from flarestack.analyses.tde.shared_TDE import tde_catalogue_name
+
+
+class TestTimeSampler(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def test_simulate_times_multi(self):
+
+        logging.info("Testing vectorised simulation of signal times.")
+
+        season = icecube_ps_3_year.get_seasons("IC86-2011")["IC86-2011"]
+        sources = load_catalogue(tde_catalogue_name("jetted"))
+
+        for t_pdf_dict in [
+            {"time_pdf_name": "steady"},
+            {"time_pdf_name": "box", "pre_window": 0., "post_window": 100.}
+        ]:
+            time_pdf = TimePDF.create(t_pdf_dict, season.get_time_pdf())
+
+            n_s = np.array([
+                3 * int(time_pdf.effective_injection_time(x) > 0.)
+                for x in sources])
+
+            np.random.seed(42)
+            times = time_pdf.simulate_times_multi(sources, n_s)
+
+            # The same random numbers, with the interpolation of each source
+
+            np.random.seed(42)
+            u = np.random.uniform(0., 1., np.sum(n_s))
+
+            source_index = np.repeat(np.arange(len(sources)), n_s)
+
+            for i in np.flatnonzero(n_s):
+                f = time_pdf.inverse_interpolate(sources[i])
+                np.testing.assert_allclose(
+                    times[source_index == i], f(u[source_index == i]),
+                    rtol=0., atol=1e-6)
+
+            # Identical distributions (e.g for a steady PDF) are only
+            # stored once
+
+            if t_pdf_dict["time_pdf_name"] == "steady":
+                self.assertEqual(time_pdf.n_inverse_cdf, 1)
+
+    def test_memoization(self):
+
+        logging.info("Testing memoization of the distribution of sources.")
+
+        livetime_pdf = TimePDF.create({
+            "time_pdf_name": "fixed_end_box",
+            "start_time_mjd": 55000.,
+            "end_time_mjd": 55365.
+        })
+
+        time_pdf = TimePDF.create(
+            {"time_pdf_name": "custom_source_box"}, livetime_pdf)
+
+        source = np.zeros(1, dtype=cat_dtype)
+        source["source_name"] = "source_0"
+        source["start_time_mjd"] = 55100.
+        source["end_time_mjd"] = 55110.
+
+        np.random.seed(42)
+
+        times = time_pdf.simulate_times_multi(source, [100])
+        self.assertTrue(np.all((times >= 55100.) & (times <= 55110.)))
+
+        # A source with the same name, but different times, is tabulated
+        # again rather than reusing the distribution of the first source
+
+        source["start_time_mjd"] = 55200.
+        source["end_time_mjd"] = 55230.
+
+        times = time_pdf.simulate_times_multi(source, [100])
+        self.assertTrue(np.all((times >= 55200.) & (times <= 55230.)))
+
+        self.assertEqual(time_pdf.n_inverse_cdf, 2)
+
+        times = time_pdf.simulate_times_multi(source, [100])
+        self.assertEqual(time_pdf.n_inverse_cdf, 2)
+
+        time_pdf.clear_inverse_cdf()
+        self.assertEqual(time_pdf.n_inverse_cdf, 0)
+
+        times = time_pdf.simulate_times_multi(source, [100])
+        self.assertTrue(np.all((times >= 55200.) & (times <= 55230.)))
+        self.assertEqual(time_pdf.n_inverse_cdf, 1)
+
+        # Once the table is full, the least recently used rows are replaced,
+        # while the rows of sources which are used in every trial are kept
+
+        sources = np.zeros(2, dtype=cat_dtype)
+        sources["source_name"] = ["source_0", "source_1"]
+        sources["start_time_mjd"] = 55300.
+        sources["end_time_mjd"] = 55310.
+
+        times = time_pdf.simulate_times_multi(sources, [10, 0])
+        row = time_pdf.get_inverse_cdf_rows(sources[:1])[0]
+
+        for i in range(max_inverse_cdf_rows + 10):
+            sources["start_time_mjd"][1] = 55000. + 0.1 * i
+            sources["end_time_mjd"][1] = 55010. + 0.1 * i
+
+            times = time_pdf.simulate_times_multi(sources, [10, 10])
+            self.assertTrue(np.all(
+                (times >= np.repeat(sources["start_time_mjd"], 10)) &
+                (times <= np.repeat(sources["end_time_mjd"], 10))))
+
+            self.assertEqual(
+                time_pdf.get_inverse_cdf_rows(sources[:1])[0], row)
+
+            self.assertLessEqual(time_pdf.n_inverse_cdf, max_inverse_cdf_rows)
+            self.assertLessEqual(len(time_pdf.inverse_cdf_table),
+                                 max_inverse_cdf_rows)
+
+        self.assertEqual(time_pdf.n_inverse_cdf, max_inverse_cdf_rows)
+        self.assertEqual(len(time_pdf.inverse_cdf_rows), max_inverse_cdf_rows)
+
+        # Tables which are identical to an existing row are not stored again
+
+        n_rows = time_pdf.n_inverse_cdf
+        time_pdf.add_inverse_cdf(sources[1])
+        self.assertEqual(time_pdf.n_inverse_cdf, n_rows)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+"""Test that the 5 sigma threshold of the background TS distribution can be
+found without plotting, and agrees with the value from the plotting function.
+"""
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from flarestack.core.ts_distributions import background_ts_threshold, \
+    plot_background_ts_distribution
+
+
+class TestTSDistributions(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_background_ts_threshold(self):
+
+        logging.info("Testing background TS threshold.")
+
+        np.random.seed(42)
+
+        ts_array = np.random.chisquare(1., 1000)
+        ts_array[:500] = 0.
+
+        threshold = background_ts_threshold(ts_array)[0]
+
+        path = os.path.join(self.dir, "ts.pdf")
+        plotted_threshold = plot_background_ts_distribution(ts_array, path)
+
+        self.assertAlmostEqual(threshold, plotted_threshold)
+        self.assertTrue(os.path.isfile(path))
+        self.assertTrue(20. < threshold < 30.)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+"""Test the interpolation of the Log(Signal/Background) grid, used as an
+alternative to the 2D energy splines.
+"""
+import logging
+import unittest
+import numpy as np
+from flarestack.utils.make_SoB_splines import SoBGrid, gamma_support_points
+
+
+def f(gamma, sin_dec, log_e):
+    """Function which is linear in each dimension, and so is reproduced
+    exactly by trilinear interpolation.
+    """
+    return 0.5 + 0.3 * gamma - 1.2 * sin_dec + 0.7 * log_e + \
+        0.2 * gamma * log_e - 0.4 * sin_dec * log_e
+
+
+class TestUtilSoBGrid(unittest.TestCase):
+
+    def setUp(self):
+        gamma = np.array(sorted(gamma_support_points))
+        sin_dec = np.linspace(-1., 1., 41)
+        log_e = np.linspace(1., 8., 57)
+
+        log_SoB = f(gamma[:, np.newaxis, np.newaxis],
+                    sin_dec[np.newaxis, :, np.newaxis],
+                    log_e[np.newaxis, np.newaxis, :])
+
+        self.grid = SoBGrid(gamma, sin_dec, log_e, log_SoB)
+
+        np.random.seed(5)
+        self.sin_dec = np.random.uniform(-1., 1., 100)
+        self.log_e = np.random.uniform(1., 8., 100)
+
+    def test_interpolation(self):
+
+        logging.info("Testing SoBGrid interpolation.")
+
+        for gamma in [1.0, 2.0, 2.3456, 3.99]:
+            np.testing.assert_allclose(
+                self.grid.ev(gamma, self.log_e, self.sin_dec),
+                f(gamma, self.sin_dec, self.log_e), atol=1e-10)
+
+        # Values outside of the grid are taken from the edge of the grid
+
+        np.testing.assert_allclose(
+            self.grid.ev(2.0, np.array([0., 9.]), np.array([-2., 2.])),
+            f(2.0, np.array([-1., 1.]), np.array([1., 8.])), atol=1e-10)
+
+    def test_cache(self):
+
+        logging.info("Testing SoBGrid cache.")
+
+        cache = self.grid.create_cache(self.log_e, self.sin_dec)
+
+        self.assertEqual(len(cache), len(gamma_support_points))
+
+        for gamma in sorted(gamma_support_points)[::30]:
+            self.assertTrue(gamma in cache)
+            np.testing.assert_allclose(
+                cache[gamma], f(gamma, self.sin_dec, self.log_e), atol=1e-10)
+
+        self.assertEqual(cache.misses, 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
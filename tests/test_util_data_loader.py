@@ -0,0 +1,121 @@
+"""Test that memory-mapped datasets, loaded from the processed data cache,
+are identical to datasets loaded and processed directly.
+"""
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from flarestack.icecube_utils.dataset_loader import data_loader, \
+    remove_data_cache
+import flarestack.shared
+from flarestack.shared import min_angular_err, data_cache_path
+
+
+class TestUtilDataLoader(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, "exp.npy")
+
+        np.random.seed(7)
+        n_events = 1000
+
+        data = np.empty(n_events, dtype=[
+            ("ra", np.float), ("dec", np.float), ("logE", np.float),
+            ("angErr", np.float), ("time", np.float), ("Run", np.int)])
+        data["ra"] = np.random.uniform(0., 2 * np.pi, n_events)
+        data["dec"] = np.arcsin(np.random.uniform(-1., 1., n_events))
+        data["logE"] = np.random.uniform(2., 6., n_events)
+        data["angErr"] = np.deg2rad(np.random.uniform(0.01, 2., n_events))
+        data["time"] = np.random.uniform(55000., 55365., n_events)
+        data["Run"] = 1
+
+        np.save(self.path, data)
+
+    def tearDown(self):
+        for cut_fields in [True, False]:
+            remove_data_cache(self.path, cut_fields=cut_fields)
+        shutil.rmtree(self.temp_dir)
+
+    def test_mmap(self):
+
+        logging.info("Testing memory-mapped data loading.")
+
+        for cut_fields in [True, False]:
+
+            data = data_loader(self.path, cut_fields=cut_fields)
+            mmap_data = data_loader(self.path, cut_fields=cut_fields,
+                                    mmap_mode="r")
+
+            self.assertTrue(isinstance(mmap_data, np.memmap))
+            self.assertEqual(data.dtype, mmap_data.dtype)
+            np.testing.assert_array_equal(data, mmap_data)
+
+        self.assertTrue(np.min(mmap_data["sigma"]) >= min_angular_err)
+        self.assertFalse(mmap_data.flags.writeable)
+
+    def test_cache_update(self):
+
+        logging.info("Testing that the data cache is remade when the data "
+                     "is modified.")
+
+        old = data_loader(self.path, mmap_mode="r")
+
+        data = np.load(self.path)
+        data["logE"] += 1.
+        np.save(self.path, data)
+
+        # Ensure that the modification time of the new file is later
+
+        t = os.path.getmtime(self.path) + 10.
+        os.utime(self.path, (t, t))
+
+        new = data_loader(self.path, mmap_mode="r")
+
+        np.testing.assert_allclose(new["logE"], old["logE"] + 1.)
+
+    def test_header_only(self):
+
+        logging.info("Testing that the dtype of a dataset is found without "
+                     "saving the processed data.")
+
+        path = data_cache_path(self.path, True, True)
+        remove_data_cache(self.path)
+
+        for cut_fields in [True, False]:
+            empty = data_loader(self.path, cut_fields=cut_fields,
+                                header_only=True)
+            self.assertEqual(len(empty), 0)
+            self.assertEqual(empty.dtype, data_loader(
+                self.path, cut_fields=cut_fields).dtype)
+
+        self.assertFalse(os.path.isfile(path))
+
+        data_loader(self.path, mmap_mode="r")
+        self.assertTrue(os.path.isfile(path))
+
+        remove_data_cache(self.path)
+        self.assertFalse(os.path.isfile(path))
+
+    def test_cache_version(self):
+
+        logging.info("Testing that the data cache depends on the version of "
+                     "the processing.")
+
+        path = data_cache_path(self.path, True, True)
+        version = flarestack.shared.data_cache_version
+
+        try:
+            flarestack.shared.data_cache_version = version + 1
+            new_path = data_cache_path(self.path, True, True)
+        finally:
+            flarestack.shared.data_cache_version = version
+
+        self.assertNotEqual(path, new_path)
+        self.assertEqual(path, data_cache_path(self.path, True, True))
+
+
+if __name__ == '__main__':
+    unittest.main()
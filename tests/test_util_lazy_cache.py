@@ -0,0 +1,49 @@
+"""Test the lazily-evaluated cache of values at gamma support points, used
+for the energy and spatial Signal/Background caches.
+"""
+import logging
+import unittest
+import numpy as np
+from flarestack.utils.make_SoB_splines import LazySupportPointCache, \
+    gamma_support_points
+
+
+class TestUtilLazyCache(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def test_lazy_evaluation(self):
+
+        logging.info("Testing LazySupportPointCache.")
+
+        x = np.linspace(0., 1., 10)
+        evaluated = []
+
+        def f(gamma):
+            evaluated.append(gamma)
+            return gamma * x
+
+        cache = LazySupportPointCache(f, gamma_support_points)
+
+        self.assertEqual(len(evaluated), 0)
+        self.assertEqual(len(cache), len(gamma_support_points))
+
+        gamma = sorted(gamma_support_points)[10]
+
+        self.assertTrue(gamma in cache)
+        self.assertFalse(1.2345 in cache)
+
+        np.testing.assert_array_equal(cache[gamma], gamma * x)
+        np.testing.assert_array_equal(cache[gamma], gamma * x)
+
+        self.assertEqual(evaluated, [gamma])
+        self.assertEqual(cache.misses, 1)
+        self.assertEqual(cache.hits, 1)
+
+        with self.assertRaises(KeyError):
+            cache[1.2345]
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+"""Test the saving, loading and merging of columnar trial results.
+"""
+import logging
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from flarestack.shared import save_trial_results, load_trial_results, \
+    merge_trial_results
+
+
+def make_results(n, offset=0.):
+    return {
+        "TS": list(np.arange(n) + offset),
+        "Parameters": {
+            "n_s": list(np.arange(n) * 2. + offset),
+            "gamma": [2.0 for _ in range(n)]
+        },
+        "Flags": [0 for _ in range(n)]
+    }
+
+
+class TestUtilTrialResults(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_trial_results(self):
+
+        logging.info("Testing columnar trial results.")
+
+        path = os.path.join(self.dir, "1.npz")
+        save_trial_results(make_results(5), path)
+
+        self.assertEqual(os.listdir(self.dir), ["1.npz"])
+
+        res = load_trial_results(path)
+
+        np.testing.assert_array_equal(res["TS"], np.arange(5))
+        np.testing.assert_array_equal(res["Parameters"]["n_s"],
+                                      np.arange(5) * 2.)
+        self.assertEqual(list(res["Parameters"].keys()), ["n_s", "gamma"])
+
+        # Results from older versions are saved as pickles
+
+        legacy_path = os.path.join(self.dir, "2.pkl")
+
+        with open(legacy_path, "wb") as f:
+            pickle.dump(make_results(3, offset=10.), f)
+
+        merged = merge_trial_results([res, load_trial_results(legacy_path)])
+
+        np.testing.assert_array_equal(
+            merged["TS"], list(np.arange(5)) + [10., 11., 12.])
+        np.testing.assert_array_equal(merged["Parameters"]["gamma"], 2.0)
+        self.assertEqual(len(merged["Flags"]), 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
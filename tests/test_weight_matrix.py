@@ -0,0 +1,84 @@
+"""Test that the cached and vectorised weight matrix agrees with the
+acceptance of each source evaluated individually, using one year of IceCube
+data (IC86_1).
+"""
+import logging
+import unittest
+import numpy as np
+from flarestack.data.public import icecube_ps_3_year
+from flarestack.core.minimisation import MinimisationHandler
+from flarestack.utils.catalogue_loader import calculate_source_weight
+from flarestack.analyses.tde.shared_TDE import tde_catalogue_name
+
+catalogue = tde_catalogue_name("jetted")
+
+
+class TestWeightMatrix(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def test_weight_matrix(self):
+
+        for llh_name in ["standard", "fixed_energy"]:
+
+            logging.info("Testing weight matrix for '{0}' LLH class".format(
+                llh_name))
+
+            mh_dict = {
+                "name": "tests/test_weight_matrix/",
+                "mh_name": "fixed_weights",
+                "dataset": icecube_ps_3_year.get_seasons("IC86-2011"),
+                "catalogue": catalogue,
+                "llh_dict": {
+                    "llh_name": llh_name,
+                    "llh_energy_pdf": {
+                        "energy_pdf_name": "power_law",
+                        "gamma": 2.0
+                    },
+                    "llh_sig_time_pdf": {
+                        "time_pdf_name": "steady"
+                    },
+                    "llh_bkg_time_pdf": {
+                        "time_pdf_name": "steady",
+                    }
+                },
+                "inj_dict": {
+                    "injection_energy_pdf": {
+                        "energy_pdf_name": "power_law",
+                        "gamma": 2.0
+                    },
+                    "injection_sig_time_pdf": {
+                        "time_pdf_name": "steady"
+                    }
+                }
+            }
+
+            mh = MinimisationHandler.create(mh_dict)
+
+            for params in [[1.0, 2.0], [3.0, 2.7]]:
+                params = params[:len(mh.p0)]
+
+                weights_matrix = mh.make_weight_matrix(params)
+
+                for i, season in enumerate(mh.seasons.values()):
+                    llh = mh.get_likelihood(season.season_name)
+
+                    for j, source in enumerate(mh.sources):
+                        w = np.ravel(llh.acceptance(source, params))[0] * \
+                            llh.sig_time_pdf.effective_injection_time(
+                                source) * \
+                            calculate_source_weight(source) / \
+                            calculate_source_weight(mh.sources)
+
+                        self.assertAlmostEqual(
+                            weights_matrix[i][j] / w, 1., places=8)
+
+                # Check that the cached values are reused
+
+                np.testing.assert_array_equal(
+                    weights_matrix, mh.make_weight_matrix(params))
+
+
+if __name__ == '__main__':
+    unittest.main()